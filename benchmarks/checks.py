@@ -0,0 +1,149 @@
+"""
+Offline checks of behaviour the benchmarks don't exercise. Each check
+drives the real code against fakes (a fake extractor, the yt-dlp stub,
+recording handlers) and fails loudly when the behaviour is wrong.
+
+Run from the repository root:
+    python benchmarks/checks.py
+    python benchmarks/checks.py resolve_formats
+
+Checks whose optional dependency is not installed are skipped. Exits with
+1 if any check fails, 0 otherwise.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import traceback
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+CHECKS = {}
+
+class Skipped(Exception):
+    pass
+
+def check(func):
+    CHECKS[func.__name__] = func
+    return func
+
+@check
+def resolve_formats():
+    """
+    The in-process engine resolves each format spec with its own format
+    selector, so different specs give different streams.
+    """
+    try:
+        import yt_dlp
+        from yt_dlp.extractor.common import InfoExtractor
+    except ImportError:
+        raise Skipped("yt_dlp is not installed")
+    from modules.ytdlp_engine import InProcessEngine
+
+    class FakeIE(InfoExtractor):
+        _VALID_URL = r'fake:(?P<id>.+)'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            return {
+                'id': video_id,
+                'title': "Check",
+                'formats': [
+                    {'format_id': 'low', 'url': 'https://media.invalid/low', 'ext': 'mp4',
+                     'vcodec': 'avc1', 'acodec': 'mp4a', 'tbr': 400},
+                    {'format_id': 'mid', 'url': 'https://media.invalid/mid', 'ext': 'mp4',
+                     'vcodec': 'avc1', 'acodec': 'mp4a', 'tbr': 1500},
+                    {'format_id': 'high', 'url': 'https://media.invalid/high', 'ext': 'mp4',
+                     'vcodec': 'avc1', 'acodec': 'mp4a', 'tbr': 6000},
+                    {'format_id': 'audio', 'url': 'https://media.invalid/audio', 'ext': 'm4a',
+                     'vcodec': 'none', 'acodec': 'mp4a', 'tbr': 128},
+                ],
+            }
+
+    def factory(params):
+        # No default extractors, so nothing but the fake one claims the URL
+        ydl = yt_dlp.YoutubeDL(params, auto_init=False)
+        ydl.add_info_extractor(FakeIE())
+        return ydl
+
+    engine = InProcessEngine(workers=1, ydl_factory=factory)
+    expected = {
+        'best': 'high',
+        'worst': 'low',
+        'bestaudio': 'audio',
+        'best[tbr<=?2000]/worst': 'mid',
+        'best[tbr<=?300]/worst': 'low',
+    }
+    # Twice, so the second round runs on the cached instances
+    for _ in range(2):
+        for spec, format_id in expected.items():
+            url = engine.resolve_stream("fake:check0001", spec)
+            assert url.endswith("/" + format_id), f"{spec!r} resolved to {url}, expected {format_id}"
+
+@check
+def menu_dispatch():
+    """
+    Each fixed menu command id reaches its own handler; the download ids
+    reach the format action of the menu that was built last.
+    """
+    try:
+        import wx
+    except ImportError:
+        raise Skipped("wxPython is not installed")
+    if not wx.App.IsDisplayAvailable():
+        raise Skipped("no display")
+    from modules.gui import TeTubeFrame, DOWNLOAD_FORMATS
+    from modules.models import VideoResult
+
+    app = wx.App(False)
+    frame = TeTubeFrame()
+    calls = []
+    # Record the calls instead of playing, copying or queueing
+    frame.on_play = lambda event: calls.append(('play',))
+    frame.on_play_audio = lambda event: calls.append(('play_audio',))
+    frame.on_copy_link = lambda event: calls.append(('copy_link',))
+    frame.on_download = lambda fmt: calls.append(('download', fmt))
+    expected = {'play': ('play',), 'play_audio': ('play_audio',), 'copy_link': ('copy_link',)}
+    expected.update({'download_' + fmt: ('download', fmt) for _, fmt in DOWNLOAD_FORMATS})
+    try:
+        assert set(frame.commands.ids) == set(expected), f"commands {sorted(frame.commands.ids)}"
+        result = VideoResult("check000001", "Check", "https://www.youtube.com/watch?v=check000001")
+        menu = frame.build_result_menu(result)
+        for name, call in expected.items():
+            command_id = frame.commands.ids[name]
+            assert menu.FindItemById(command_id), f"{name} is missing from the result menu"
+            del calls[:]
+            frame.GetEventHandler().ProcessEvent(wx.CommandEvent(wx.wxEVT_MENU, command_id))
+            assert calls == [call], f"{name} dispatched to {calls}, expected {call}"
+        menu.Destroy()
+    finally:
+        frame.download_manager.shutdown()
+        frame.Destroy()
+        app.Destroy()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help="checks to run (default: all)")
+    args = parser.parse_args()
+
+    # Caches, queues and downloads go to a scratch folder
+    os.chdir(tempfile.mkdtemp(prefix="te_tube_checks_"))
+    sys.path.insert(0, ROOT_DIR)
+
+    failed = 0
+    for name in args.names or list(CHECKS):
+        try:
+            CHECKS[name]()
+        except Skipped as e:
+            print(f"SKIP {name}: {e}")
+        except Exception:
+            failed += 1
+            print(f"FAIL {name}")
+            traceback.print_exc()
+        else:
+            print(f"OK   {name}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
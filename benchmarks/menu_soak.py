@@ -0,0 +1,102 @@
+"""
+Soak test for menu command dispatch. Builds and destroys the search
+result context menu thousands of times, as right-clicking would, and
+dispatches a download command through the window after each one. Memory
+and dispatch time must stay flat however many menus have been opened.
+
+Run from the repository root (needs wxPython and a display):
+    python benchmarks/menu_soak.py
+    python benchmarks/menu_soak.py --menus 20000
+
+Exits with 1 if memory grows or dispatch slows down, 0 otherwise.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Allowed growth between the first and the last round
+MAX_GROWTH_BYTES = 256 * 1024
+MAX_SLOWDOWN = 2.0
+
+def run_round(frame, result, menus):
+    import wx
+
+    command_id = frame.commands.ids['download_mp4']
+    timings = []
+    for _ in range(menus):
+        menu = frame.build_result_menu(result)
+        event = wx.CommandEvent(wx.wxEVT_MENU, command_id)
+        started = time.perf_counter()
+        frame.GetEventHandler().ProcessEvent(event)
+        timings.append(time.perf_counter() - started)
+        menu.Destroy()
+    return statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--menus", type=int, default=5000, help="menus opened in total")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    try:
+        import wx
+    except ImportError:
+        print("wxPython is not installed")
+        return 0
+
+    # The window's caches, queue and settings go to a scratch folder
+    os.chdir(tempfile.mkdtemp(prefix="te_tube_soak_"))
+    sys.path.insert(0, ROOT_DIR)
+    from modules.gui import TeTubeFrame
+    from modules.models import VideoResult
+
+    app = wx.App(False)
+    frame = TeTubeFrame()
+    dispatched = [0]
+    # Count downloads instead of queueing them
+    frame.on_download = lambda fmt: dispatched.__setitem__(0, dispatched[0] + 1)
+    result = VideoResult("soak0000001", "Soak test", "https://www.youtube.com/watch?v=soak0000001")
+    per_round = max(1, args.menus // args.rounds)
+
+    # One round to warm up caches and allocators before measuring
+    run_round(frame, result, per_round)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    rounds = []
+    for index in range(args.rounds):
+        median_ms = run_round(frame, result, per_round)
+        growth = tracemalloc.get_traced_memory()[0] - baseline
+        rounds.append((median_ms, growth))
+        print(f"round {index + 1:3}: {per_round * (index + 1):6} menus, "
+              f"dispatch median {median_ms:.4f} ms, memory {growth / 1024:+.1f} KiB")
+    tracemalloc.stop()
+
+    frame.download_manager.shutdown()
+    frame.Destroy()
+    app.Destroy()
+
+    failures = []
+    if dispatched[0] != per_round * (args.rounds + 1):
+        failures.append(f"{dispatched[0]} commands dispatched, expected {per_round * (args.rounds + 1)}")
+    first_ms, last_ms = rounds[0][0], rounds[-1][0]
+    if last_ms > first_ms * MAX_SLOWDOWN + 0.01:
+        failures.append(f"dispatch slowed from {first_ms:.4f} ms to {last_ms:.4f} ms")
+    growth = rounds[-1][1] - rounds[0][1]
+    if growth > MAX_GROWTH_BYTES:
+        failures.append(f"memory grew by {growth / 1024:.1f} KiB")
+
+    for failure in failures:
+        print("FAIL:", failure)
+    if not failures:
+        print("OK: memory and dispatch time stayed flat")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+Offline benchmark suite. yt-dlp is replaced by benchmarks/ytdlp_stub.py,
+so the numbers reflect Te_Tube's own overhead, not the network.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier>.json
+
+Results are written to benchmarks/results/<timestamp>.json.
+"""
+import argparse
+import json
+import os
+import platform
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+STUB_PATH = os.path.join(BENCH_DIR, "ytdlp_stub.py")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+def stub_command():
+    return subprocess.list2cmdline([sys.executable, STUB_PATH]) if os.name == 'nt' \
+        else " ".join(shlex.quote(p) for p in [sys.executable, STUB_PATH])
+
+def summarize(samples):
+    return {
+        'runs': len(samples),
+        'median_ms': round(statistics.median(samples) * 1000, 2),
+        'min_ms': round(min(samples) * 1000, 2),
+        'max_ms': round(max(samples) * 1000, 2),
+    }
+
+def bench_search(runs):
+    from modules.search_engine import StreamingSearch, search_youtube
+
+    first, total = [], []
+    for i in range(runs):
+        started = time.perf_counter()
+        first_at = []
+        StreamingSearch(f"benchmark query {i}", use_cache=False).run(
+            lambda item: first_at.append(time.perf_counter()) if not first_at else None
+        )
+        total.append(time.perf_counter() - started)
+        first.append(first_at[0] - started)
+
+    # A second run of the same query is answered by the search cache
+    search_youtube("benchmark cached")
+    cached = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        search_youtube("benchmark cached")
+        cached.append(time.perf_counter() - started)
+
+    return {
+        'time_to_first_result': summarize(first),
+        'total': summarize(total),
+        'cached': summarize(cached),
+    }
+
+def bench_resolve(runs):
+    from modules.ytdlp_engine import get_engine
+
+    samples = []
+    for i in range(runs):
+        started = time.perf_counter()
+        get_engine().resolve_stream(f"https://www.youtube.com/watch?v=resolve{i:04d}", "best")
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def bench_enrichment(count):
+    from modules.enrichment import MetadataEnricher
+
+    ids = [f"enrich{i:05d}" for i in range(count)]
+    timings = {}
+    for name, batch_size in (('one_per_call', 1), ('batched', 10)):
+        enricher = MetadataEnricher(batch_size=batch_size, workers=3)
+        started = time.perf_counter()
+        enricher.want(ids)
+        enricher.join()
+        timings[name + '_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return dict(timings, ids=count)
+
+def bench_progress_parsing(lines):
+    from modules.ytdlp_engine import get_engine
+    from modules.downloader import download_media
+
+    os.environ['STUB_PROGRESS_LINES'] = str(lines)
+    received = []
+
+    # Raw engine: every progress line reaches the callback
+    started = time.perf_counter()
+    get_engine().download("https://www.youtube.com/watch?v=benchmark01",
+                          {'output_template': os.path.join(os.getcwd(), "download", "%(title)s.%(ext)s"),
+                           'format': "best"},
+                          received.append)
+    raw_elapsed = time.perf_counter() - started
+
+    # download_media: the same stream through the progress throttle
+    throttled = []
+    started = time.perf_counter()
+    download_media("https://www.youtube.com/watch?v=benchmark02", 'mp4', throttled.append)
+    throttled_elapsed = time.perf_counter() - started
+
+    return {
+        'lines': lines,
+        'parsed': len(received),
+        'lines_per_sec': round(lines / raw_elapsed),
+        'elapsed_ms': round(raw_elapsed * 1000, 2),
+        'throttled_callbacks': len(throttled),
+        'throttled_elapsed_ms': round(throttled_elapsed * 1000, 2),
+    }
+
+def bench_event_delivery(events):
+    try:
+        import wx
+        import wx.lib.newevent
+    except ImportError:
+        return {'skipped': "wxPython is not installed"}
+
+    BenchEvent, EVT_BENCH = wx.lib.newevent.NewEvent()
+    app = wx.App(False)
+    frame = wx.Frame(None)
+    received = [0]
+    timing = {}
+
+    def on_event(event):
+        received[0] += 1
+        if received[0] == events:
+            timing['done'] = time.perf_counter()
+            app.ExitMainLoop()
+
+    frame.Bind(EVT_BENCH, on_event)
+
+    def producer():
+        timing['start'] = time.perf_counter()
+        for i in range(events):
+            wx.PostEvent(frame, BenchEvent(index=i))
+
+    wx.CallAfter(threading.Thread(target=producer, daemon=True).start)
+    app.MainLoop()
+    frame.Destroy()
+
+    elapsed = timing['done'] - timing['start']
+    return {'events': events, 'events_per_sec': round(events / elapsed), 'elapsed_ms': round(elapsed * 1000, 2)}
+
+def bench_startup(runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.join(BENCH_DIR, "startup_probe.py")], cwd=os.getcwd(),
+                                capture_output=True, text=True, timeout=120)
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            return {'skipped': f"startup_probe.py exited with code {result.returncode}: {result.stderr.strip()[-300:]}"}
+        samples.append(elapsed)
+    return {'process': summarize(samples)}
+
+def compare(current, baseline, prefix=""):
+    """
+    Prints the relative change of every numeric value present in both runs.
+    """
+    for key, value in current.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(other, dict):
+            compare(value, other, name + ".")
+        elif isinstance(value, (int, float)) and isinstance(other, (int, float)) and other:
+            change = (value - other) * 100.0 / other
+            print(f"{name:60} {other:>12} -> {value:>12} ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--progress-lines", type=int, default=20000)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Everything the app writes (caches, queue, downloads) goes to a scratch folder
+    workdir = tempfile.mkdtemp(prefix="te_tube_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT_DIR)
+    os.environ['TE_TUBE_YTDLP'] = stub_command()
+    os.environ['TE_TUBE_ENGINE'] = 'subprocess'
+    os.environ.setdefault('STUB_RESULT_DELAY', "0.01")
+    os.environ.setdefault('STUB_INFO_DELAY', "0.01")
+
+    results = {
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'search': bench_search(args.runs),
+        'resolve': bench_resolve(args.runs),
+        'enrichment': bench_enrichment(30),
+        'progress_parsing': bench_progress_parsing(args.progress_lines),
+        'event_delivery': bench_event_delivery(args.events),
+        'startup': bench_startup(min(args.runs, 5)),
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out_path = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Saved to {out_path}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Starts Te_Tube exactly as main.py does, but closes the window as soon as
+it is ready instead of starting the background work. Used by
+run_benchmarks.py to time a cold start.
+
+Run from the directory Te_Tube normally runs in (needs wxPython):
+    python benchmarks/startup_probe.py
+"""
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, ROOT_DIR)
+import main
+
+def on_gui_ready():
+    main.report_startup()
+    import wx
+    wx.GetApp().GetTopWindow().Close()
+
+if __name__ == "__main__":
+    # main() looks the callback up when the GUI starts
+    main.on_gui_ready = on_gui_ready
+    main.main()
@@ -0,0 +1,144 @@
+"""
+Offline stand-in for yt-dlp used by the benchmarks.
+
+Replays the recorded output in benchmarks/fixtures at rates controlled by
+environment variables, so the app's own overhead can be measured without
+network access:
+
+STUB_STARTUP_DELAY   seconds to sleep before doing anything (default 0)
+STUB_RESULT_DELAY    seconds between search results (default 0.05)
+STUB_PROGRESS_LINES  progress lines per download (default 1000)
+STUB_PROGRESS_DELAY  seconds between progress lines (default 0)
+STUB_INFO_DELAY      seconds per video for full metadata (default 0.05)
+"""
+import json
+import os
+import sys
+import time
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+def option(args, name, default=None):
+    if name in args:
+        return args[args.index(name) + 1]
+    return default
+
+def load_entries():
+    with open(os.path.join(FIXTURES, "search.jsonl"), 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def emit_entries(args, count):
+    entries = load_entries()
+    start = int(option(args, "--playlist-start", 1))
+    end = int(option(args, "--playlist-end", count))
+    delay = env_float("STUB_RESULT_DELAY", 0.05)
+    for index in range(start, min(end, count) + 1):
+        entry = dict(entries[(index - 1) % len(entries)])
+        # Unique 11 character ids so de-duplication doesn't hide results
+        entry['id'] = f"{entry['id'][:6]}{index:05d}"
+        entry['url'] = f"https://www.youtube.com/watch?v={entry['id']}"
+        entry['playlist_index'] = index
+        time.sleep(delay)
+        print(json.dumps(entry), flush=True)
+
+def emit_infos(args):
+    # Full info for every URL after '--', with a small format list
+    entry = load_entries()[0]
+    delay = env_float("STUB_INFO_DELAY", 0.05)
+    for url in args[args.index("--") + 1:]:
+        video_id = url.rsplit("=", 1)[-1]
+        duration = entry.get('duration') or 213
+        time.sleep(delay)
+        print(json.dumps(dict(entry, id=video_id, url=url, duration=duration, like_count=1000, formats=[
+            {'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a.40.2', 'vcodec': 'none', 'tbr': 129.5,
+             'asr': 44100, 'audio_channels': 2, 'filesize': int(duration * 16190)},
+            {'format_id': '18', 'ext': 'mp4', 'acodec': 'mp4a.40.2', 'vcodec': 'avc1.42001E', 'tbr': 500.0},
+            {'format_id': '137', 'ext': 'mp4', 'acodec': 'none', 'vcodec': 'avc1.640028', 'tbr': 2500.0,
+             'filesize_approx': int(duration * 312500)},
+        ])), flush=True)
+
+def emit_download(args):
+    template = option(args, "-o")
+    url = args[-1]
+    path = template.replace("%(title)s", "stub_" + url.rsplit("=", 1)[-1][-11:]).replace("%(ext)s", "mp4")
+    with open(os.path.join(FIXTURES, "progress.txt"), 'r', encoding='utf-8') as f:
+        sys.stdout.write(f.read())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # A video+audio spec downloads each stream to its own file and merges them
+    # afterwards, like the recorded "137+140" selection
+    if "+" in (option(args, "-f") or ""):
+        base = os.path.splitext(path)[0]
+        parts = [base + ".f137.mp4", base + ".f140.m4a"]
+    else:
+        parts = [path]
+    lines = int(os.environ.get("STUB_PROGRESS_LINES", 1000))
+    for index, part in enumerate(parts):
+        share = lines // len(parts) + (lines % len(parts) if index == len(parts) - 1 else 0)
+        emit_part(args, part, share)
+
+    if len(parts) > 1:
+        print(f'[Merger] Merging formats into "{path}"', flush=True)
+        with open(path, 'wb') as f:
+            for part in parts:
+                with open(part, 'rb') as source:
+                    f.write(source.read())
+        for part in parts:
+            os.remove(part)
+        print(f"Deleting original file {parts[0]} (pass -k to keep)", flush=True)
+
+def emit_part(args, path, lines):
+    print(f"[download] Destination: {path}", flush=True)
+    # Like yt-dlp, write to a .part file and continue one left by an earlier run
+    with open(path + ".part", 'ab') as f:
+        f.write(b"\0" * 1024)
+
+    delay = env_float("STUB_PROGRESS_DELAY", 0)
+    progress_template = option(args, "--progress-template")
+    total = 50 * 1024 * 1024
+    for i in range(1, lines + 1):
+        done = total * i // lines
+        if progress_template:
+            prefix = progress_template.split(":", 1)[1].split("{", 1)[0]
+            print(prefix + json.dumps({
+                'downloaded_bytes': done, 'total_bytes': total, 'total_bytes_estimate': None,
+                'speed': 5242880.0, 'eta': (total - done) // 5242880,
+                'fragment_index': None, 'fragment_count': None
+            }))
+        else:
+            print(f"[download] {done * 100.0 / total:5.1f}% of   50.00MiB at    5.00MiB/s ETA 00:{(total - done) // 5242880:02d}")
+        if delay:
+            sys.stdout.flush()
+            time.sleep(delay)
+    sys.stdout.flush()
+
+    os.replace(path + ".part", path)
+
+def main():
+    args = sys.argv[1:]
+    time.sleep(env_float("STUB_STARTUP_DELAY", 0))
+
+    if "--version" in args:
+        print("2025.09.26")
+        return
+    search = next((a for a in args if a.startswith("ytsearch")), None)
+    if search:
+        count = int(search[len("ytsearch"):search.index(":")] or 1)
+        emit_entries(args, count)
+    elif "-g" in args:
+        expire = int(time.time()) + 6 * 3600
+        print(f"https://rr1---sn-stub.googlevideo.com/videoplayback?expire={expire}&itag=18&id=stub")
+    elif "--dump-json" in args and "--skip-download" in args:
+        emit_infos(args)
+    elif "--dump-single-json" in args:
+        print(json.dumps(load_entries()[0]))
+    elif "--flat-playlist" in args:
+        emit_entries(args, 50)
+    elif "-o" in args:
+        emit_download(args)
+
+if __name__ == "__main__":
+    main()
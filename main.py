@@ -1,7 +1,38 @@
+import json
 import os
 import sys
-from modules.ytdlp_manager import ensure_ytdlp
-from modules.gui import start_gui
+import threading
+import time
+
+# Cold-start time is measured from here; keep the imports above to the standard library
+START_TIME = time.perf_counter()
+
+def report_startup():
+    """
+    Prints the cold-start time and appends it to data/startup_times.jsonl
+    so regressions can be tracked over time.
+    """
+    elapsed_ms = (time.perf_counter() - START_TIME) * 1000
+    print(f"Startup took {elapsed_ms:.0f} ms")
+    try:
+        from modules.settings import data_path
+        with open(data_path("startup_times.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'time': time.time(), 'startup_ms': round(elapsed_ms, 1)}) + "\n")
+    except Exception as e:
+        print(f"Error recording startup time: {e}")
+
+def on_gui_ready():
+    report_startup()
+
+    # Heavy work happens only once the window is on screen. A yt-dlp
+    # override (TE_TUBE_YTDLP) is never replaced by the updater.
+    if not os.environ.get('TE_TUBE_YTDLP'):
+        from modules.ytdlp_manager import start_background_update
+        start_background_update()
+
+    # Warm up the yt-dlp engine so the first search doesn't pay for its imports
+    from modules.ytdlp_engine import get_engine
+    threading.Thread(target=get_engine, daemon=True).start()
 
 def main():
     # Ensure dependencies in lib folder are accessible
@@ -9,18 +40,20 @@ def main():
     if lib_path not in os.environ["PATH"]:
         os.environ["PATH"] = lib_path + os.pathsep + os.environ["PATH"]
 
+    # Any arguments select the headless CLI (modules/cli.py), which never imports wx
+    if len(sys.argv) > 1:
+        from modules.cli import main as run_cli
+        sys.exit(run_cli(sys.argv[1:]))
+
     print("--- Te_Tube Startup ---")
-    
-    # Check/Update yt-dlp first as requested
-    try:
-        ensure_ytdlp()
-    except Exception as e:
-        print(f"Error initializing yt-dlp: {e}")
-        # We might still want to start the GUI, but downloads won't work.
-        # However, the user said "sau đó mới vào phần mềm", implying it's required.
 
-    # Start the GUI
-    start_gui()
+    # A yt-dlp.exe downloaded last session may still be waiting to be swapped in
+    from modules.ytdlp_manager import apply_pending_update
+    apply_pending_update()
+
+    # The yt-dlp update check runs in the background once the GUI is up
+    from modules.gui import start_gui
+    start_gui(on_ready=on_gui_ready)
 
 if __name__ == "__main__":
     main()
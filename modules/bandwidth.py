@@ -0,0 +1,104 @@
+import threading
+
+from modules.settings import get_setting, set_setting
+
+# Never throttle a job below this, however many are running
+MIN_RATE = 32 * 1024
+
+class RateControl:
+    """
+    The current allowance of one running download. Engines that can
+    change limits on the fly read `rate` while downloading.
+    rate: bytes per second, or None for unlimited.
+    """
+    def __init__(self, rate=None, fragments=1):
+        self.rate = rate
+        self.fragments = fragments
+        # Rate the job's process was started with (subprocess engine)
+        self.started_rate = rate
+
+class BandwidthScheduler:
+    """
+    Splits a global bandwidth budget between running downloads.
+    With the 'fair' policy every job gets an equal share; with 'priority'
+    each priority step doubles a job's weight. Shares are recomputed
+    whenever a job starts, finishes or changes priority, and so is the
+    number of concurrent fragments each job may fetch.
+    """
+    def __init__(self, budget=None, policy=None, fragment_budget=None):
+        self.budget = budget if budget is not None else get_setting('bandwidth_limit')
+        self.policy = policy or get_setting('bandwidth_policy')
+        self.fragment_budget = fragment_budget or get_setting('fragment_budget')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def weight(self, priority):
+        if self.policy == 'priority':
+            return 2.0 ** max(-4, min(4, priority))
+        return 1.0
+
+    def register(self, job_id, priority=0):
+        """
+        Adds a running job and returns its RateControl.
+        """
+        with self._lock:
+            control = RateControl()
+            self._jobs[job_id] = (priority, control)
+            self._rebalance()
+            control.started_rate = control.rate
+            return control
+
+    def unregister(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._rebalance()
+
+    def set_priority(self, job_id, priority):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id] = (priority, self._jobs[job_id][1])
+                self._rebalance()
+
+    def set_budget(self, budget):
+        """
+        budget: bytes per second for all downloads together, 0 for unlimited.
+        """
+        with self._lock:
+            self.budget = max(0, int(budget))
+            self._rebalance()
+        set_setting('bandwidth_limit', self.budget)
+
+    def set_policy(self, policy):
+        with self._lock:
+            self.policy = policy
+            self._rebalance()
+        set_setting('bandwidth_policy', policy)
+
+    def _rebalance(self):
+        if not self._jobs:
+            return
+        count = len(self._jobs)
+        fragments = max(1, min(get_setting('concurrent_fragments'), self.fragment_budget // count))
+        total_weight = sum(self.weight(priority) for priority, _ in self._jobs.values())
+        for priority, control in self._jobs.values():
+            control.fragments = fragments
+            if self.budget:
+                control.rate = max(MIN_RATE, int(self.budget * self.weight(priority) / total_weight))
+            else:
+                control.rate = None
+
+    def allocations(self):
+        """
+        Returns {job_id: (rate, fragments)} for inspection.
+        """
+        with self._lock:
+            return {job_id: (control.rate, control.fragments) for job_id, (_, control) in self._jobs.items()}
+
+    def needs_restart(self, control):
+        """
+        True when a job whose limit is fixed at process start is now allowed
+        at least twice as much as it was started with.
+        """
+        if control.started_rate is None:
+            return False
+        return control.rate is None or control.rate >= 2 * control.started_rate
@@ -0,0 +1,89 @@
+import re
+import threading
+
+from modules.models import VideoResult
+from modules.ytdlp_engine import get_engine
+
+# Lists YouTube makes up per viewer: mixes and radio (RD...), upload mixes
+# (UL...), which never end, and the viewer's own liked and watch later lists
+GENERATED_LIST_RE = r'(?:RD|UL)[\w-]*|(?:LL|WL|LM)(?![\w-])'
+# A list id that names a real, finite playlist
+PLAYLIST_ID = rf'(?!{GENERATED_LIST_RE})[\w-]+'
+LIST_PARAM_RE = re.compile(rf'[?&]list=({PLAYLIST_ID})')
+
+# Playlist pages and channel pages. A watch?v=...&list=... link is the
+# video; playlist_url_of() gives its playlist for callers that offer it.
+COLLECTION_URL_RE = re.compile(
+    r'(?:https?://)?(?:www\.|m\.|music\.)?youtube\.com/'
+    rf'(?:playlist\?(?:[^#\s]*?&)?list={PLAYLIST_ID}'
+    r'|@[\w.-]+'
+    r'|channel/[\w-]+'
+    r'|c/[\w.-]+'
+    r'|user/[\w.-]+)'
+)
+
+def is_collection_url(url):
+    """
+    True for playlist and channel URLs that expand into several videos.
+    """
+    return bool(COLLECTION_URL_RE.search(url or ""))
+
+def playlist_url_of(url):
+    """
+    Returns the playlist page for a watch link that is part of a real
+    playlist, or None. Mixes never count: they are generated as they
+    play and have no end.
+    """
+    match = LIST_PARAM_RE.search(url or "")
+    return f"https://www.youtube.com/playlist?list={match.group(1)}" if match else None
+
+def expand_collection(url, cancel_event=None, on_entry=None):
+    """
+    Expands a playlist or channel URL into VideoResults using flat
+    extraction, dropping duplicate video ids while keeping the order.
+    Returns (playlist_title, entries); the title may be None.
+    """
+    seen = set()
+    entries = []
+    titles = []
+
+    def on_info(info):
+        if not titles and info.get('playlist_title'):
+            titles.append(info['playlist_title'])
+        entry = VideoResult.from_info(info)
+        if entry.id in seen:
+            return
+        seen.add(entry.id)
+        entries.append(entry)
+        if on_entry:
+            on_entry(entry)
+
+    get_engine().expand(url, on_info, cancel_event)
+    return (titles[0] if titles else None), entries
+
+def download_collection(manager, url, fmt, title=None, priority=0):
+    """
+    Expands `url` and queues every video on `manager` as one batch.
+    Returns (batch_id, jobs).
+    """
+    playlist_title, entries = expand_collection(url)
+    if not entries:
+        raise Exception("No videos found at this link")
+    return manager.submit_many([(e.url, e.title) for e in entries], fmt, priority, title or playlist_title or url)
+
+def start_collection_download(manager, url, fmt, callback=None, title=None):
+    """
+    Runs download_collection on a background thread, since expanding a
+    large playlist can take a while. callback(batch_id, jobs, error).
+    """
+    def run():
+        try:
+            batch_id, jobs = download_collection(manager, url, fmt, title)
+            if callback:
+                callback(batch_id, jobs, None)
+        except Exception as e:
+            print(f"Error expanding playlist: {e}")
+            if callback:
+                callback(None, [], e)
+
+    threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,270 @@
+"""
+Headless front end: `python main.py <command> ...` runs one of the commands
+below without importing wx. Results are written to stdout as JSON lines;
+log messages from the modules go to stderr.
+
+    search QUERY [-n N] [--start S] [--no-cache] [--details]
+    resolve URL [URL ...] [-f FORMAT | --audio]
+    download URL [URL ...] [-f mp4|m4a|mp3|wav] [-j JOBS] [--progress]
+    batch FILE [-f ...] [-j JOBS] [--progress]      (FILE '-' reads stdin)
+    throughput              measured speeds and recent format decisions
+    serve [--port PORT]     run the shared local service (see service.py)
+
+Exit codes: 0 success, 1 everything failed, 2 bad usage,
+3 some jobs failed, 130 interrupted.
+"""
+import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from modules.batch import is_collection_url, expand_collection, playlist_url_of
+from modules.downloader import download_media, DownloadCancelled
+from modules.enrichment import MetadataEnricher
+from modules.search_engine import StreamingSearch, PAGE_SIZE
+from modules.stream_resolver import get_stream_resolver, parse_expiry
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+EXIT_INTERRUPTED = 130
+
+FORMATS = ('mp4', 'm4a', 'mp3', 'wav')
+
+class Output:
+    """
+    Writes one JSON object per line. Shared by all worker threads.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, **fields):
+        line = json.dumps(fields, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+def exit_code(succeeded, failed):
+    if not failed:
+        return EXIT_OK
+    return EXIT_PARTIAL if succeeded else EXIT_FAILED
+
+def run_search(args, out, cancel_event):
+    # Runs on the main thread, so Ctrl+C interrupts it directly
+    search = StreamingSearch(args.query, args.max_results, args.start, use_cache=not args.no_cache)
+    try:
+        results = search.run(lambda item: out.emit(event='result', **item.to_dict()))
+    except Exception as e:
+        out.emit(event='error', query=args.query, error=str(e))
+        return EXIT_FAILED
+    if args.details:
+        enrich_results(results, out)
+    out.emit(event='finished', query=args.query, count=len(results))
+    return EXIT_OK
+
+def enrich_results(results, out):
+    """
+    Emits a 'details' event (views, sizes per format, ...) for every result.
+    """
+    enricher = MetadataEnricher(lambda video_id, details: out.emit(event='details', id=video_id, **details))
+    enricher.want([r.id for r in results])
+    # Waiting with a timeout keeps the main thread responsive to Ctrl+C
+    while not enricher.join(timeout=0.5):
+        pass
+
+def run_resolve(args, out, cancel_event):
+    format_spec = "bestaudio" if args.audio else args.format
+    resolver = get_stream_resolver()
+
+    def resolve(url):
+        if cancel_event.is_set():
+            return False
+        try:
+            stream_url = resolver.resolve(url, format_spec)
+        except Exception as e:
+            out.emit(event='error', url=url, error=str(e))
+            return False
+        out.emit(event='resolved', url=url, format=format_spec, stream_url=stream_url,
+                 expires=parse_expiry(stream_url))
+        return True
+
+    return run_parallel(resolve, args.urls, args.jobs, cancel_event)
+
+def expand_targets(urls, out, cancel_event, playlists=False):
+    """
+    Replaces playlist and channel links with the videos they contain.
+    With `playlists`, watch links that are part of a playlist count as
+    the playlist; otherwise they are just the video.
+    """
+    targets = []
+    for url in urls:
+        if playlists and playlist_url_of(url):
+            url = playlist_url_of(url)
+        if not is_collection_url(url):
+            targets.append(url)
+            continue
+        try:
+            title, entries = expand_collection(url, cancel_event)
+        except Exception as e:
+            out.emit(event='error', url=url, error=f"Could not read playlist: {e}")
+            continue
+        out.emit(event='expanded', url=url, title=title, count=len(entries))
+        targets.extend(entries)
+    return targets
+
+def run_download(args, out, cancel_event, urls=None):
+    urls = args.urls if urls is None else urls
+    targets = expand_targets(urls, out, cancel_event, args.playlist)
+    if not targets:
+        return EXIT_FAILED
+
+    def download(target):
+        url = getattr(target, 'url', target)
+        if cancel_event.is_set():
+            return False
+        out.emit(event='started', url=url, format=args.format)
+
+        def on_progress(p):
+            out.emit(event='progress', url=url, percent=round(p.get('percent', 0.0), 1),
+                     downloaded_bytes=p.get('downloaded_bytes'), speed=p.get('speed'), eta=p.get('eta'))
+
+        try:
+            path = download_media(target, args.format, on_progress if args.progress else None, cancel_event)
+        except DownloadCancelled:
+            out.emit(event='cancelled', url=url)
+            return False
+        except Exception as e:
+            out.emit(event='error', url=url, error=str(e))
+            return False
+        out.emit(event='finished', url=url, path=path)
+        return True
+
+    return run_parallel(download, targets, args.jobs, cancel_event)
+
+def read_url_file(path):
+    stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.lstrip().startswith('#')]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def run_batch(args, out, cancel_event):
+    try:
+        urls = read_url_file(args.file)
+    except OSError as e:
+        out.emit(event='error', file=args.file, error=str(e))
+        return EXIT_USAGE
+    return run_download(args, out, cancel_event, urls)
+
+def run_parallel(func, items, jobs, cancel_event):
+    """
+    Runs func(item) for every item on `jobs` threads. func returns True on
+    success. Returns the exit code for the whole run.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+    futures = [executor.submit(func, item) for item in items]
+    try:
+        # Waiting with a timeout keeps the main thread responsive to Ctrl+C
+        while wait(futures, timeout=0.5).not_done:
+            pass
+    except KeyboardInterrupt:
+        cancel_event.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        return EXIT_INTERRUPTED
+    executor.shutdown(wait=True)
+
+    if cancel_event.is_set():
+        return EXIT_INTERRUPTED
+    succeeded = sum(1 for f in futures if f.result())
+    return exit_code(succeeded, len(futures) - succeeded)
+
+def run_throughput(args, out, cancel_event):
+    # Downloads run in the service while there is one, and so do its decisions
+    from modules.service import call_or_local
+    from modules.throughput import get_format_policy
+    snapshot = call_or_local('throughput', lambda: get_format_policy().snapshot())
+    for network, entry in snapshot['networks'].items():
+        out.emit(event='network', network=network, current=network == snapshot['network'], **entry)
+    for decision in snapshot['decisions']:
+        out.emit(event='decision', **decision)
+    return EXIT_OK
+
+def run_serve(args, out, cancel_event):
+    from modules.service import serve
+    try:
+        serve(args.port, ready=lambda server: out.emit(event='listening', url=server.url))
+    except OSError as e:
+        out.emit(event='error', error=str(e))
+        return EXIT_FAILED
+    except KeyboardInterrupt:
+        pass
+    return EXIT_OK
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="te_tube", description="Te_Tube without the GUI. Output is JSON lines.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help="search YouTube")
+    search.add_argument('query')
+    search.add_argument('-n', '--max-results', type=int, default=PAGE_SIZE)
+    search.add_argument('--start', type=int, default=1, help="1-based index of the first result")
+    search.add_argument('--no-cache', action='store_true', help="ignore the search cache")
+    search.add_argument('--details', action='store_true', help="also emit views and estimated sizes per result")
+    search.set_defaults(handler=run_search)
+
+    resolve = commands.add_parser('resolve', help="print direct stream URLs")
+    resolve.add_argument('urls', nargs='+')
+    resolve.add_argument('-f', '--format', default='best', help="yt-dlp format spec")
+    resolve.add_argument('--audio', action='store_true', help="resolve bestaudio")
+    resolve.add_argument('-j', '--jobs', type=int, default=4)
+    resolve.set_defaults(handler=run_resolve)
+
+    for name, help_text in (('download', "download videos, playlists or channels"),
+                            ('batch', "download every URL listed in a file")):
+        command = commands.add_parser(name, help=help_text)
+        if name == 'download':
+            command.add_argument('urls', nargs='+')
+            command.set_defaults(handler=run_download)
+        else:
+            command.add_argument('file', help="one URL per line, '-' for stdin")
+            command.set_defaults(handler=run_batch)
+        command.add_argument('-f', '--format', choices=FORMATS, default='mp4')
+        command.add_argument('-j', '--jobs', type=int, default=2, help="parallel downloads")
+        command.add_argument('--progress', action='store_true', help="emit progress events")
+        command.add_argument('--playlist', action='store_true',
+                             help="download the whole playlist of watch?v=...&list=... links")
+
+    throughput = commands.add_parser('throughput', help="show measured speeds and format decisions")
+    throughput.set_defaults(handler=run_throughput)
+
+    serve = commands.add_parser('serve', help="run the local service other Te_Tube processes share")
+    serve.add_argument('--port', type=int, help="default: the 'service_port' setting (0 = any free port)")
+    serve.set_defaults(handler=run_serve)
+    return parser
+
+def main(argv=None):
+    try:
+        args = build_parser().parse_args(argv)
+    except SystemExit as e:
+        return EXIT_OK if e.code == 0 else EXIT_USAGE
+
+    # stdout carries the JSON lines; anything the modules print goes to stderr
+    out = Output(sys.stdout)
+    sys.stdout = sys.stderr
+    cancel_event = threading.Event()
+    try:
+        return args.handler(args, out, cancel_event)
+    except KeyboardInterrupt:
+        cancel_event.set()
+        return EXIT_INTERRUPTED
+    finally:
+        sys.stdout = out.stream
+
+if __name__ == "__main__":
+    sys.exit(main())
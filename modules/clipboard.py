@@ -0,0 +1,246 @@
+import hashlib
+import os
+import re
+import threading
+
+from modules.batch import COLLECTION_URL_RE, LIST_PARAM_RE
+from modules.models import VIDEO_ID_RE
+from modules.settings import get_setting
+
+# One pass over the text finds both kinds of link; a playlist link wins
+# over the video id it may also contain (watch?v=...&list=...)
+LINK_RE = re.compile(f"(?P<collection>{COLLECTION_URL_RE.pattern})|{VIDEO_ID_RE.pattern}")
+# Every link contains "youtu"; the optional scheme and subdomain before it
+# are at most this long ("https://music."), and no link runs past the window
+PREFIX_CHARS = 16
+WINDOW_CHARS = 2048
+# The rest of a link after the part LINK_RE matched
+URL_TAIL_RE = re.compile(r'[^\s#]*')
+
+def _find_links(text):
+    # The optional prefix makes the regex try every position of the text, so
+    # it only runs around occurrences of the literal, which str.find locates fast
+    end = 0
+    index = text.find("youtu")
+    while index != -1:
+        match = LINK_RE.search(text, max(end, index - PREFIX_CHARS), index + WINDOW_CHARS)
+        if match:
+            yield match
+            end = match.end()
+        index = text.find("youtu", max(index + 1, end))
+
+def extract_links(text):
+    """
+    Returns every YouTube link in `text` in order of appearance, without
+    duplicates: videos as watch URLs, playlists and channels as found.
+    A video that is part of a real playlist keeps its list= parameter,
+    so the playlist can still be offered (see batch.playlist_url_of).
+    """
+    links = []
+    seen = set()
+    for match in _find_links(text or ""):
+        if match.group('collection'):
+            link = match.group('collection')
+            if not link.startswith(('http://', 'https://')):
+                link = "https://" + link
+        else:
+            link = f"https://www.youtube.com/watch?v={match.group(2)}"
+            # list= may come before or after v=
+            tail = URL_TAIL_RE.match(text, match.end())
+            playlist = LIST_PARAM_RE.search(text, match.start(), tail.end())
+            if playlist:
+                link += f"&list={playlist.group(1)}"
+        if link not in seen:
+            seen.add(link)
+            links.append(link)
+    return links
+
+def text_digest(text):
+    return hashlib.blake2b(text.encode('utf-8', 'replace'), digest_size=16).digest()
+
+def _sequence_number_source():
+    # Windows bumps a counter on every clipboard change; reading it does not
+    # open the clipboard or copy its contents
+    if os.name != 'nt':
+        return None
+    try:
+        import ctypes
+        return ctypes.windll.user32.GetClipboardSequenceNumber
+    except (ImportError, AttributeError, OSError):
+        return None
+
+WM_QUIT = 0x0012
+WM_CLIPBOARDUPDATE = 0x031D
+LISTENER_CLASS = "TeTubeClipboardListener"
+
+class _ClipboardListener:
+    """
+    Windows clipboard change notifications: a message-only window
+    registered with AddClipboardFormatListener receives WM_CLIPBOARDUPDATE,
+    and the thread running run() sleeps in GetMessageW until one arrives.
+    """
+    def __init__(self, on_update):
+        import ctypes
+        from ctypes import wintypes
+        self.ctypes = ctypes
+        self.on_update = on_update
+        self.thread_id = None
+        # Private DLL handles, so the prototypes set here don't leak elsewhere
+        self.user32 = user32 = ctypes.WinDLL('user32', use_last_error=True)
+        self.kernel32 = kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        LRESULT = wintypes.LPARAM
+        self.WNDPROC = ctypes.WINFUNCTYPE(LRESULT, wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
+
+        class WNDCLASSW(ctypes.Structure):
+            _fields_ = [('style', wintypes.UINT), ('lpfnWndProc', self.WNDPROC), ('cbClsExtra', ctypes.c_int),
+                        ('cbWndExtra', ctypes.c_int), ('hInstance', wintypes.HANDLE), ('hIcon', wintypes.HANDLE),
+                        ('hCursor', wintypes.HANDLE), ('hbrBackground', wintypes.HANDLE),
+                        ('lpszMenuName', wintypes.LPCWSTR), ('lpszClassName', wintypes.LPCWSTR)]
+
+        self.WNDCLASSW = WNDCLASSW
+        kernel32.GetModuleHandleW.argtypes = [wintypes.LPCWSTR]
+        kernel32.GetModuleHandleW.restype = wintypes.HANDLE
+        kernel32.GetCurrentThreadId.restype = wintypes.DWORD
+        user32.DefWindowProcW.argtypes = [wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM]
+        user32.DefWindowProcW.restype = LRESULT
+        user32.RegisterClassW.argtypes = [ctypes.POINTER(WNDCLASSW)]
+        user32.RegisterClassW.restype = wintypes.ATOM
+        user32.CreateWindowExW.argtypes = [wintypes.DWORD, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.DWORD,
+                                           ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, wintypes.HWND,
+                                           wintypes.HANDLE, wintypes.HANDLE, wintypes.LPVOID]
+        user32.CreateWindowExW.restype = wintypes.HWND
+        user32.AddClipboardFormatListener.argtypes = [wintypes.HWND]
+        user32.AddClipboardFormatListener.restype = wintypes.BOOL
+        user32.RemoveClipboardFormatListener.argtypes = [wintypes.HWND]
+        user32.DestroyWindow.argtypes = [wintypes.HWND]
+        user32.GetMessageW.argtypes = [ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT]
+        user32.GetMessageW.restype = wintypes.BOOL
+        user32.TranslateMessage.argtypes = [ctypes.POINTER(wintypes.MSG)]
+        user32.DispatchMessageW.argtypes = [ctypes.POINTER(wintypes.MSG)]
+        user32.DispatchMessageW.restype = LRESULT
+        user32.PostThreadMessageW.argtypes = [wintypes.DWORD, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM]
+        user32.PostThreadMessageW.restype = wintypes.BOOL
+
+    def run(self, stopping):
+        """
+        Delivers notifications until stop() is called. Returns False at
+        once if the listener could not be registered.
+        """
+        ctypes, user32 = self.ctypes, self.user32
+        from ctypes import wintypes
+
+        def window_proc(hwnd, message, wparam, lparam):
+            if message == WM_CLIPBOARDUPDATE:
+                self.on_update()
+                return 0
+            return user32.DefWindowProcW(hwnd, message, wparam, lparam)
+
+        # Kept on self: the callback must outlive the window
+        self._window_proc = self.WNDPROC(window_proc)
+        instance = self.kernel32.GetModuleHandleW(None)
+        window_class = self.WNDCLASSW(lpfnWndProc=self._window_proc, hInstance=instance,
+                                      lpszClassName=LISTENER_CLASS)
+        # Fails harmlessly if an earlier watcher registered the class
+        user32.RegisterClassW(ctypes.byref(window_class))
+        hwnd_message = wintypes.HWND(-3)
+        hwnd = user32.CreateWindowExW(0, LISTENER_CLASS, LISTENER_CLASS, 0, 0, 0, 0, 0, hwnd_message,
+                                      None, instance, None)
+        if not hwnd:
+            return False
+        try:
+            if not user32.AddClipboardFormatListener(hwnd):
+                return False
+            # The window gave this thread a message queue, so stop() can post to it
+            self.thread_id = self.kernel32.GetCurrentThreadId()
+            if stopping():
+                return True
+            message = wintypes.MSG()
+            while user32.GetMessageW(ctypes.byref(message), None, 0, 0) > 0:
+                user32.TranslateMessage(ctypes.byref(message))
+                user32.DispatchMessageW(ctypes.byref(message))
+            user32.RemoveClipboardFormatListener(hwnd)
+            return True
+        finally:
+            user32.DestroyWindow(hwnd)
+
+    def stop(self):
+        if self.thread_id is not None:
+            self.user32.PostThreadMessageW(self.thread_id, WM_QUIT, 0, 0)
+
+def _listener_source(on_update):
+    if os.name != 'nt':
+        return None
+    try:
+        return _ClipboardListener(on_update)
+    except (ImportError, AttributeError, OSError):
+        return None
+
+class ClipboardWatcher:
+    """
+    Tells the app when the clipboard may hold something new, so its text is
+    read only after a change instead of on a timer.
+
+    On Windows a daemon thread registers for clipboard change notifications
+    and sleeps until one arrives, then calls on_change() from that thread.
+    Where the listener can't be registered it falls back to comparing the
+    clipboard sequence number every 'clipboard_poll_interval' seconds.
+    Elsewhere `available` is False and the window checks when it is
+    activated instead.
+
+    seen(text) records text as handled and returns True if it was already
+    seen; only a digest of the last text is kept, however large it is.
+    """
+    def __init__(self, on_change, interval=None):
+        self.on_change = on_change
+        self.interval = interval or get_setting('clipboard_poll_interval')
+        self._listener = _listener_source(self._changed)
+        self._sequence_number = _sequence_number_source()
+        self._last_digest = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def available(self):
+        return self._listener is not None or self._sequence_number is not None
+
+    def start(self):
+        if self.available and self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.stop()
+
+    def seen(self, text):
+        digest = text_digest(text)
+        if digest == self._last_digest:
+            return True
+        self._last_digest = digest
+        return False
+
+    def _changed(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"Error in clipboard listener: {e}")
+
+    def _run(self):
+        if self._listener is not None:
+            try:
+                if self._listener.run(self._stop.is_set):
+                    return
+            except Exception as e:
+                print(f"Error listening for clipboard changes: {e}")
+            print("Clipboard notifications unavailable, checking the clipboard periodically.")
+        if self._sequence_number is not None:
+            self._poll()
+
+    def _poll(self):
+        last = self._sequence_number()
+        while not self._stop.wait(self.interval):
+            current = self._sequence_number()
+            if current != last:
+                last = current
+                self._changed()
@@ -0,0 +1,604 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+
+from modules import metrics
+from modules.bandwidth import BandwidthScheduler
+from modules.downloader import download_media, DownloadCancelled, CONVERTED_FORMATS
+from modules.journal import Journal
+from modules.library import get_library
+from modules.models import video_id_of
+from modules.postprocess import get_postprocessor
+from modules.settings import data_path, get_setting, set_setting
+from modules.ytdlp_engine import get_engine, format_bytes
+
+QUEUE_FILE = "download_queue.json"
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+# Downloaded, waiting for or undergoing audio conversion (no download slot held)
+CONVERTING = 'converting'
+FINISHED = 'finished'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+
+# Jobs in these states are written to the queue file and restored on startup
+PERSISTED_STATES = (QUEUED, RUNNING, PAUSED, CONVERTING)
+
+# A job this far along finishes with its old limit rather than restarting
+RESTART_MAX_PERCENT = 90.0
+
+# Seconds between journal records for one running job
+JOURNAL_INTERVAL = 1.0
+
+# Fields of DownloadJob that say where an interrupted download stands
+RESUME_FIELDS = ('format_spec', 'partial_path', 'downloaded_bytes', 'fragment_index', 'percent')
+
+class DownloadJob:
+    """
+    A single entry in the download queue.
+    Higher priority runs first; equal priorities run in submission order.
+    """
+    def __init__(self, url, title, fmt, priority=0, job_id=None, seq=0, batch_id=None, batch_title=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.url = url
+        self.title = title
+        self.fmt = fmt
+        self.priority = priority
+        self.seq = seq
+        self.batch_id = batch_id
+        self.batch_title = batch_title
+        self.status = QUEUED
+        self.percent = 0.0
+        self.line = ""
+        self.path = None
+        self.raw_path = None
+        # The PostProcessor job and this job's listener on it (conversions may be shared)
+        self.conversion = None
+        self.conversion_listener = None
+        self.error = None
+        self.cancel_event = None
+        self.rate_control = None
+        self.restart = False
+        # HLS/DASH: yt-dlp fixes the limit of fragment downloads when they start
+        self.fragmented = False
+        self.queued_at = time.perf_counter()
+        # Streams yt-dlp picked and the file it was writing, so a restart
+        # continues the same partial file instead of choosing afresh
+        self.format_spec = None
+        self.partial_path = None
+        self.downloaded_bytes = None
+        self.fragment_index = None
+        self.journaled_at = 0.0
+
+    def sort_key(self):
+        return (-self.priority, self.seq)
+
+    def key(self):
+        """
+        Jobs with the same key produce the same file.
+        """
+        return (video_id_of(self.url) or self.url, self.fmt)
+
+    def mark_in_library(self, path):
+        self.status = FINISHED
+        self.path = path
+        self.percent = 100.0
+        self.line = "Already downloaded"
+
+    def resume_state(self):
+        return {field: getattr(self, field) for field in RESUME_FIELDS}
+
+    def apply_resume(self, state):
+        for field in RESUME_FIELDS:
+            if state.get(field) is not None:
+                setattr(self, field, state[field])
+
+    def has_partial(self):
+        """
+        True if the file an interrupted run was writing is still on disk.
+        """
+        path = self.partial_path
+        return bool(path) and (os.path.exists(path + ".part") or os.path.exists(path))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'url': self.url,
+            'title': self.title,
+            'fmt': self.fmt,
+            'priority': self.priority,
+            'seq': self.seq,
+            'status': self.status,
+            'percent': self.percent,
+            'batch_id': self.batch_id,
+            'batch_title': self.batch_title,
+            'raw_path': self.raw_path,
+            'resume': self.resume_state()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['url'], data.get('title', data['url']), data.get('fmt', 'mp4'),
+                  data.get('priority', 0), data.get('id'), data.get('seq', 0),
+                  data.get('batch_id'), data.get('batch_title'))
+        # Whatever was running when we stopped goes back into the queue
+        job.status = PAUSED if data.get('status') == PAUSED else QUEUED
+        job.percent = data.get('percent', 0.0)
+        job.apply_resume(data.get('resume') or {})
+        # A finished raw download only needs its conversion redone
+        raw_path = data.get('raw_path')
+        if data.get('status') == CONVERTING and raw_path and os.path.exists(raw_path):
+            job.status = CONVERTING
+            job.raw_path = raw_path
+        return job
+
+def summarize_batches(jobs):
+    """
+    Aggregates the jobs of every batch in `jobs`:
+    {batch_id: {'title', 'total', 'finished', 'failed', 'running', 'percent'}}
+    """
+    batches = {}
+    for job in jobs:
+        if not job.batch_id:
+            continue
+        batch = batches.setdefault(job.batch_id, {'title': job.batch_title, 'total': 0, 'finished': 0,
+                                                  'failed': 0, 'running': 0, 'percent': 0.0})
+        batch['total'] += 1
+        batch['finished'] += job.status == FINISHED
+        batch['failed'] += job.status in (ERROR, CANCELLED)
+        batch['running'] += job.status == RUNNING
+        batch['percent'] += 100.0 if job.status == FINISHED else job.percent
+    for batch in batches.values():
+        batch['percent'] /= batch['total']
+    return batches
+
+class DownloadManager:
+    """
+    Schedules downloads over a bounded pool of worker threads.
+    Listeners are called as listener(job) from worker threads whenever
+    a job changes state or reports progress.
+    """
+    def __init__(self, max_concurrency=None, queue_path=None):
+        self.max_concurrency = max(1, max_concurrency or get_setting('max_concurrent_downloads'))
+        self.queue_path = queue_path or data_path(QUEUE_FILE)
+        # Progress of running jobs between two saves of the queue file
+        self.journal = Journal(os.path.splitext(self.queue_path)[0] + ".journal")
+        self.listeners = []
+        self.bandwidth = BandwidthScheduler()
+
+        self._jobs = {}
+        self._seq = 0
+        self._running = 0
+        self._workers = []
+        self._stopping = False
+        self._cond = threading.Condition()
+
+        self._load()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _notify(self, job):
+        for listener in list(self.listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                print(f"Error in download listener: {e}")
+
+    def start(self):
+        with self._cond:
+            self._stopping = False
+            self._ensure_workers()
+            self._cond.notify_all()
+            converting = [j for j in self._jobs.values() if j.status == CONVERTING]
+        # Jobs loaded from the queue file may share a raw file (mp3 and wav
+        # of one video); it has to outlive all of their conversions
+        sharing = Counter(j.raw_path for j in converting if j.conversion is None)
+        for raw_path, count in sharing.items():
+            if count > 1:
+                get_postprocessor().claim(raw_path, count)
+        for job in converting:
+            self._start_conversion(job)
+
+    def _ensure_workers(self):
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def set_max_concurrency(self, value):
+        with self._cond:
+            self.max_concurrency = max(1, int(value))
+            self._ensure_workers()
+            self._cond.notify_all()
+        set_setting('max_concurrent_downloads', self.max_concurrency)
+
+    def _active_jobs(self):
+        # Called with the lock held
+        return {job.key(): job for job in self._jobs.values() if job.status in PERSISTED_STATES}
+
+    def _library_path(self, url, fmt):
+        video_id = video_id_of(url)
+        return get_library().have(video_id, fmt) if video_id else None
+
+    def submit(self, url, title, fmt, priority=0):
+        """
+        Adds a download to the queue and returns its DownloadJob.
+        A video that is already queued in this format returns the existing
+        job; one that is already in the library is finished at once.
+        """
+        library_path = self._library_path(url, fmt)
+        with self._cond:
+            self._seq += 1
+            job = DownloadJob(url, title, fmt, priority, seq=self._seq)
+            existing = self._active_jobs().get(job.key())
+            if existing is not None:
+                metrics.count('download.coalesced')
+                return existing
+            if library_path:
+                job.mark_in_library(library_path)
+            self._jobs[job.id] = job
+            self._save()
+            self._cond.notify_all()
+        self._notify(job)
+        return job
+
+    def submit_many(self, items, fmt, priority=0, batch_title=None):
+        """
+        Queues several (url, title) pairs as one batch with a single save.
+        Videos already queued are skipped, those in the library are added
+        as finished. Returns (batch_id, jobs).
+        """
+        batch_id = uuid.uuid4().hex[:12]
+        jobs = []
+        library_paths = {url: self._library_path(url, fmt) for url, _ in items}
+        with self._cond:
+            active = self._active_jobs()
+            for url, title in items:
+                self._seq += 1
+                job = DownloadJob(url, title, fmt, priority, seq=self._seq,
+                                  batch_id=batch_id, batch_title=batch_title)
+                if job.key() in active:
+                    metrics.count('download.coalesced')
+                    continue
+                if library_paths[url]:
+                    job.mark_in_library(library_paths[url])
+                active[job.key()] = job
+                self._jobs[job.id] = job
+                jobs.append(job)
+            self._save()
+            self._cond.notify_all()
+        for job in jobs:
+            self._notify(job)
+        return batch_id, jobs
+
+    def batch_progress(self):
+        """
+        Aggregates the jobs of every batch still in the list, see summarize_batches.
+        """
+        with self._cond:
+            return summarize_batches(list(self._jobs.values()))
+
+    def jobs(self):
+        with self._cond:
+            return sorted(self._jobs.values(), key=lambda j: j.seq)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def pause(self, job_id):
+        """
+        Pauses a queued or running job. A running job is stopped and
+        continues from its partial file when resumed.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in (QUEUED, RUNNING):
+                return
+            if job.status == RUNNING and job.cancel_event:
+                job.cancel_event.set()
+            job.status = PAUSED
+            self._save()
+        self._notify(job)
+
+    def resume(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in (PAUSED, ERROR, CANCELLED):
+                return
+            job.status = QUEUED
+            job.error = None
+            job.queued_at = time.perf_counter()
+            self._save()
+            self._cond.notify_all()
+        self._notify(job)
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in (FINISHED, CANCELLED):
+                return
+            if job.status == RUNNING and job.cancel_event:
+                job.cancel_event.set()
+            if job.status == CONVERTING and job.conversion:
+                get_postprocessor().cancel(job.conversion, job.conversion_listener)
+            job.status = CANCELLED
+            self._save()
+        self._notify(job)
+
+    def set_priority(self, job_id, priority):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.priority = priority
+            self._save()
+            self._cond.notify_all()
+        self.bandwidth.set_priority(job_id, priority)
+        self._apply_rates()
+        self._notify(job)
+
+    def set_bandwidth_limit(self, budget):
+        """
+        Sets the global budget in bytes per second (0 = unlimited).
+        """
+        self.bandwidth.set_budget(budget)
+        self._apply_rates()
+
+    def _apply_rates(self):
+        """
+        Jobs whose limit can't change while they run get restarted when
+        their share has grown a lot; yt-dlp continues from the partial file.
+        That is every job on engines without live rate control, and
+        fragmented (HLS/DASH) downloads on the ones with it, since yt-dlp
+        copies the limit into its fragment downloader when it starts.
+        """
+        live = get_engine().live_rate_control
+        with self._cond:
+            for job in self._jobs.values():
+                if (job.status == RUNNING and job.rate_control and job.cancel_event
+                        and (not live or job.fragmented)
+                        and job.percent < RESTART_MAX_PERCENT
+                        and self.bandwidth.needs_restart(job.rate_control)):
+                    job.restart = True
+                    job.cancel_event.set()
+
+    def remove_finished(self):
+        """
+        Drops finished, failed and cancelled jobs from the list.
+        """
+        with self._cond:
+            for job_id in [j.id for j in self._jobs.values() if j.status in (FINISHED, ERROR, CANCELLED)]:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        """
+        Stops the workers. Running jobs and conversions are killed but stay
+        in the queue file, so they start again (from their partial or raw
+        files) next time.
+        """
+        with self._cond:
+            self._stopping = True
+            for job in self._jobs.values():
+                if job.status == RUNNING and job.cancel_event:
+                    job.cancel_event.set()
+                if job.status == CONVERTING and job.conversion:
+                    get_postprocessor().cancel(job.conversion)
+            self._save()
+            self._cond.notify_all()
+
+    def _next_job(self):
+        queued = [j for j in self._jobs.values() if j.status == QUEUED]
+        if not queued:
+            return None
+        return min(queued, key=DownloadJob.sort_key)
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._stopping and (self._running >= self.max_concurrency or self._next_job() is None):
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                job = self._next_job()
+                metrics.record('download.queue_wait', (time.perf_counter() - job.queued_at) * 1000)
+                job.status = RUNNING
+                job.cancel_event = threading.Event()
+                self._running += 1
+                self._save()
+            self._notify(job)
+
+            try:
+                self._run_job(job)
+            finally:
+                self.bandwidth.unregister(job.id)
+                with self._cond:
+                    self._running -= 1
+                    job.cancel_event = None
+                    job.rate_control = None
+                    self._save()
+                    self._cond.notify_all()
+                self._apply_rates()
+                self._notify(job)
+
+    def _run_job(self, job):
+        def callback(p):
+            job.percent = p.get('percent', job.percent)
+            job.line = p.get('line', job.line)
+            if p.get('fragment_count'):
+                job.fragmented = True
+            self._journal_progress(job, p)
+            self._notify(job)
+
+        # An interrupted download keeps its streams so yt-dlp continues the partial file
+        format_spec = job.format_spec if job.has_partial() else None
+        if format_spec:
+            metrics.count('download.resumed')
+            job.line = f"Resuming from {format_bytes(job.downloaded_bytes)}"
+            self._notify(job)
+        else:
+            job.format_spec = job.partial_path = job.downloaded_bytes = job.fragment_index = None
+
+        job.rate_control = self.bandwidth.register(job.id, job.priority)
+        self._apply_rates()
+        while True:
+            try:
+                path = download_media(job.url, job.fmt, callback, job.cancel_event, job.rate_control,
+                                      defer_conversion=True, format_spec=format_spec)
+                if job.fmt in CONVERTED_FORMATS and path:
+                    # Hand the raw audio to the conversion queue and free this slot
+                    job.raw_path = path
+                    job.percent = 0.0
+                    job.line = "Waiting for conversion"
+                    job.status = CONVERTING
+                    self._start_conversion(job)
+                else:
+                    job.path = path
+                    job.percent = 100.0
+                    job.status = FINISHED
+            except DownloadCancelled:
+                if job.restart and job.status == RUNNING:
+                    # Rebalanced: start again straight away with the new limit
+                    job.restart = False
+                    metrics.count('download.restarts')
+                    job.cancel_event.clear()
+                    job.rate_control.started_rate = job.rate_control.rate
+                    # Keep the streams this run picked so the partial file is continued
+                    format_spec = job.format_spec
+                    continue
+                # pause()/cancel()/shutdown() already set the new status
+                if job.status == RUNNING:
+                    job.status = QUEUED
+                    job.queued_at = time.perf_counter()
+            except Exception as e:
+                if format_spec:
+                    # The pinned streams may be gone; choose afresh once
+                    format_spec = job.format_spec = None
+                    continue
+                job.error = str(e)
+                job.status = ERROR
+            return
+
+    def _journal_progress(self, job, progress):
+        # A tick that arrives after pause()/cancel() must not bring the job back on replay
+        if job.status != RUNNING:
+            return
+        if progress.get('format_id'):
+            job.format_spec = progress['format_id']
+        if progress.get('filename'):
+            job.partial_path = progress['filename']
+        if progress.get('downloaded_bytes') is not None:
+            job.downloaded_bytes = progress['downloaded_bytes']
+        if progress.get('fragment_index') is not None:
+            job.fragment_index = progress['fragment_index']
+        now = time.monotonic()
+        if job.partial_path and now - job.journaled_at >= JOURNAL_INTERVAL:
+            job.journaled_at = now
+            # Under the lock _save() holds, so no record lands between its
+            # snapshot and the journal truncation. The whole job goes in,
+            # so replay can restore it even without the queue file.
+            with self._cond:
+                if job.status == RUNNING:
+                    self.journal.append(job.to_dict())
+
+    def _start_conversion(self, job):
+        def on_update(conversion):
+            if job.status != CONVERTING:
+                return
+            if conversion.status == 'converting':
+                job.percent = conversion.percent
+                job.line = f"Converting to {job.fmt}: {conversion.percent:.0f}%"
+            elif conversion.status == 'finished':
+                get_postprocessor().release(job.raw_path)
+                with self._cond:
+                    job.path = conversion.target
+                    job.raw_path = None
+                    job.percent = 100.0
+                    job.status = FINISHED
+                    self._save()
+                video_id = video_id_of(job.url)
+                if video_id:
+                    get_library().add(video_id, job.fmt, conversion.target, job.title)
+            elif conversion.status == 'error':
+                with self._cond:
+                    job.error = conversion.error
+                    job.status = ERROR
+                    self._save()
+            self._notify(job)
+
+        job.conversion_listener = on_update
+        job.conversion = get_postprocessor().submit(job.raw_path, job.fmt, on_update)
+
+    def _save(self):
+        # Called with the lock held; progress ticks don't trigger a save
+        data = [j.to_dict() for j in self._jobs.values() if j.status in PERSISTED_STATES]
+        tmp_path = self.queue_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.queue_path)
+        except Exception as e:
+            print(f"Error saving download queue: {e}")
+            return
+        # The queue file now holds everything the journal recorded
+        self.journal.clear()
+
+    def _load(self):
+        data = []
+        try:
+            with open(self.queue_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading download queue: {e}")
+        for item in data:
+            job = DownloadJob.from_dict(item)
+            self._jobs[job.id] = job
+            self._seq = max(self._seq, job.seq)
+
+        # Progress recorded after the last save, i.e. up to a crash
+        records = self.journal.replay()
+        for record in records:
+            job = self._jobs.get(record.get('id'))
+            if job is None:
+                job = DownloadJob.from_dict(record)
+                self._jobs[job.id] = job
+                self._seq = max(self._seq, job.seq)
+            else:
+                job.apply_resume(record.get('resume') or {})
+        if records:
+            self._save()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_download_manager():
+    """
+    Returns the shared DownloadManager, creating and starting it on first use.
+    While a Te_Tube service is running this is a RemoteDownloadManager for
+    the service's queue.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            from modules.service import service_client, forget_service, RemoteDownloadManager, ServiceUnavailable
+            client = service_client()
+            try:
+                _manager = RemoteDownloadManager(client) if client else DownloadManager()
+            except ServiceUnavailable as e:
+                print(f"Te_Tube service not reachable, working locally: {e}")
+                forget_service(client)
+                _manager = DownloadManager()
+            _manager.start()
+        return _manager
@@ -1,79 +1,248 @@
-import subprocess
 import os
-import re
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from modules import metrics
+from modules.library import get_library
+from modules.models import VideoResult, media_url, video_id_of
+from modules.postprocess import get_postprocessor
+from modules.ytdlp_engine import get_engine, DownloadCancelled
+from modules.progress import ProgressThrottle
+from modules.settings import get_setting
+from modules.throughput import get_format_policy
 
-YTDLP_PATH = os.path.join(os.getcwd(), "lib", "yt-dlp.exe")
 DOWNLOAD_DIR = os.path.join(os.getcwd(), "download")
 
-def download_media(url, format_type='mp4', progress_callback=None):
+# Formats that need an ffmpeg conversion after the download
+CONVERTED_FORMATS = ('mp3', 'wav')
+
+# Best mp4 video; FormatPolicy caps it by what the network delivers in time
+MP4_FORMAT = "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best"
+
+# Downloads running right now by (video id, format), see download_media.
+# mp3 and wav are both converted from one raw 'bestaudio' file.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+class SharedDownload:
+    """
+    One running download and everyone waiting for it: the future its
+    result goes to and the progress callbacks of all callers, so each of
+    them sees the progress of the download that actually runs. A caller
+    joining late is handed the latest update at once.
     """
-    Downloads media from URL in specified format.
-    progress_callback: function(data) where data is a dict with progress info.
+    def __init__(self):
+        self.future = Future()
+        # Callers still waiting for the result, counted under _inflight_lock
+        self.users = 0
+        self._callbacks = []
+        self._last = None
+        self._lock = threading.Lock()
+
+    def add(self, callback):
+        if callback is None:
+            return
+        with self._lock:
+            self._callbacks.append(callback)
+            last = self._last
+        if last is not None:
+            callback(last)
+
+    def remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def progress(self, data):
+        with self._lock:
+            self._last = data
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback(data)
+            except Exception as e:
+                print(f"Error in progress listener: {e}")
+
+def download_media(target, format_type='mp4', progress_callback=None, cancel_event=None, rate_control=None,
+                   defer_conversion=False, format_spec=None):
+    """
+    Downloads media in specified format.
+    target: a URL string or a VideoResult.
+    progress_callback: function(data) where data is a dict with progress info,
+    called at most 'progress_updates_per_second' times per second.
+    cancel_event: optional threading.Event; setting it kills yt-dlp and
+    raises DownloadCancelled. Partial files are kept so a later run resumes.
+    rate_control: optional bandwidth.RateControl with the job's rate limit
+    and concurrent fragment count.
+    defer_conversion: for mp3/wav, skip the inline audio extraction and
+    return the raw bestaudio file so the caller can convert it separately.
+    format_spec: optional yt-dlp format ids to use instead of the choice
+    for `format_type`, e.g. the streams an interrupted download picked.
     returns: The path to the downloaded file.
+
+    A video already in the library is returned without starting yt-dlp,
+    and concurrent calls for the same video and format share one download
+    and its progress. For mp3/wav the shared part is the raw audio, whichever
+    of the two each caller wants; callers without defer_conversion then
+    convert it through the PostProcessor, which shares the conversion as
+    well. When several callers share the raw file it is claimed for each
+    of them, so it is removed only after the last one converted it.
+    """
+    video_id = video_id_of(target)
+    if video_id is None:
+        return _download(target, format_type, progress_callback, cancel_event, rate_control, defer_conversion,
+                         format_spec)
+
+    path = get_library().have(video_id, format_type)
+    if path:
+        metrics.count('download.library_hits')
+        if progress_callback:
+            progress_callback({'status': 'finished', 'percent': 100.0, 'line': "Already downloaded"})
+        return path
+
+    key = (video_id, 'bestaudio' if format_type in CONVERTED_FORMATS else format_type)
+    with _inflight_lock:
+        shared = _inflight.get(key)
+        owner = shared is None
+        if owner:
+            shared = _inflight[key] = SharedDownload()
+        shared.users += 1
+    shared.add(progress_callback)
+
+    if not owner:
+        metrics.count('download.coalesced')
+        try:
+            path = _wait_for(shared.future, cancel_event)
+        except DownloadCancelled:
+            with _inflight_lock:
+                resolved = shared.future.done()
+                if not resolved:
+                    shared.users -= 1
+            if resolved and not shared.future.exception() and format_type in CONVERTED_FORMATS:
+                # Cancelled just as the raw file arrived; our claim goes unused
+                get_postprocessor().release(shared.future.result())
+            if cancel_event is not None and cancel_event.is_set():
+                raise
+            # The other caller gave up; carry on with a download of our own
+            return download_media(target, format_type, progress_callback, cancel_event, rate_control,
+                                  defer_conversion, format_spec)
+        finally:
+            shared.remove(progress_callback)
+    else:
+        try:
+            path = _download(target, format_type, shared.progress, cancel_event, rate_control, True, format_spec)
+            if path and format_type not in CONVERTED_FORMATS:
+                title, uploader, duration = describe(target, path)
+                get_library().add(video_id, format_type, path, title, uploader, duration)
+            with _inflight_lock:
+                # No caller joins or leaves between the count and the result
+                _inflight.pop(key, None)
+                if path and format_type in CONVERTED_FORMATS and shared.users > 1:
+                    get_postprocessor().claim(path, shared.users)
+                shared.future.set_result(path)
+        except BaseException as e:
+            shared.future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+    if path and format_type in CONVERTED_FORMATS and not defer_conversion:
+        path = _convert(target, video_id, path, format_type, progress_callback, cancel_event)
+    return path
+
+def _convert(target, video_id, raw_path, format_type, progress_callback, cancel_event):
+    # Runs on the conversion queue like a deferred job, but waits for it here
+    def on_update(conversion):
+        if progress_callback and conversion.status == 'converting':
+            progress_callback({'status': 'converting', 'percent': conversion.percent,
+                               'line': f"Converting to {format_type}: {conversion.percent:.0f}%"})
+
+    postprocessor = get_postprocessor()
+    conversion = postprocessor.submit(raw_path, format_type, on_update)
+    while not conversion.done.wait(0.2):
+        if cancel_event is not None and cancel_event.is_set():
+            postprocessor.cancel(conversion, on_update)
+            raise DownloadCancelled("Download cancelled")
+    if conversion.status == 'cancelled':
+        raise DownloadCancelled("Conversion cancelled")
+    if conversion.status != 'finished':
+        raise Exception(f"Conversion to {format_type} failed: {conversion.error}")
+    postprocessor.release(raw_path)
+    title, uploader, duration = describe(target, conversion.target)
+    get_library().add(video_id, format_type, conversion.target, title, uploader, duration)
+    if progress_callback:
+        progress_callback({'status': 'finished', 'percent': 100.0, 'line': "Converted"})
+    return conversion.target
+
+def _wait_for(future, cancel_event):
+    # Our own cancel_event still works while someone else's download runs
+    while True:
+        try:
+            return future.result(timeout=0.2)
+        except FutureTimeout:
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled("Download cancelled")
+
+def describe(target, path):
+    """
+    Returns (title, uploader, duration) for the library: from the
+    VideoResult when there is one, else the title from the file name.
     """
+    if isinstance(target, VideoResult):
+        return target.title, target.uploader, target.duration
+    return os.path.splitext(os.path.basename(path))[0], None, None
+
+def _download(target, format_type, progress_callback, cancel_event, rate_control, defer_conversion,
+              format_spec=None):
+    url = media_url(target)
     if not os.path.exists(DOWNLOAD_DIR):
         os.makedirs(DOWNLOAD_DIR)
         
     output_template = os.path.join(DOWNLOAD_DIR, "%(title)s.%(ext)s")
     
-    cmd = [YTDLP_PATH, "-o", output_template, "--newline", "--progress"]
+    options = {'output_template': output_template}
     
-    if format_type == 'mp3':
-        cmd += ["-f", "bestaudio", "--extract-audio", "--audio-format", "mp3", "--audio-quality", "0"]
+    if format_type in CONVERTED_FORMATS and defer_conversion:
+        options['format'] = "bestaudio"
+    elif format_type == 'mp3':
+        options.update({'format': "bestaudio", 'extract_audio': "mp3", 'audio_quality': 0})
     elif format_type == 'm4a':
-        cmd += ["-f", "bestaudio[ext=m4a]"]
+        options['format'] = "bestaudio[ext=m4a]"
     elif format_type == 'wav':
-        cmd += ["-f", "bestaudio", "--extract-audio", "--audio-format", "wav"]
-    elif format_type == 'mp4':
-        cmd += ["-f", "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best"]
+        options.update({'format': "bestaudio", 'extract_audio': "wav"})
+    else:
+        # A pinned format_spec replaces the choice below, so no decision is made for it
+        options['format'] = MP4_FORMAT if format_spec else get_format_policy().download_format(MP4_FORMAT)
+    if format_spec:
+        options['format'] = format_spec
+    
+    # Fragmented (DASH/HLS) formats fetch this many fragments in parallel
+    options['concurrent_fragments'] = get_setting('concurrent_fragments')
+    if rate_control is not None:
+        options['concurrent_fragments'] = rate_control.fragments
+        options['rate_limit'] = rate_control.rate
+        options['rate_control'] = rate_control
     
     # Add ffmpeg path from lib folder
-    cmd += ["--ffmpeg-location", os.path.join(os.getcwd(), "lib")]
-    cmd += [url]
+    options['ffmpeg_location'] = os.path.join(os.getcwd(), "lib")
+    
+    throttle = None
+    if progress_callback:
+        throttle = progress_callback = ProgressThrottle(progress_callback, get_setting('progress_updates_per_second'))
     
     try:
-        process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.STDOUT, 
-            text=True, 
-            encoding='utf-8', 
-            errors='replace',
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-        )
-        
-        final_path = None
-        
-        for line in process.stdout:
-            # Parse progress: [download]  10.0% of 100.00MiB at 1.00MiB/s ETA 01:30
-            if '[download]' in line:
-                percent_match = re.search(r'(\d+\.\d+)%', line)
-                if percent_match:
-                    percent = float(percent_match.group(1))
-                    if progress_callback:
-                        progress_callback({'status': 'downloading', 'percent': percent, 'line': line.strip()})
-            
-            # Look for the destination file
-            if '[download] Destination:' in line:
-                final_path = line.split('Destination:')[1].strip()
-            elif 'has already been downloaded' in line:
-                # [download] d:\python code\te_tube\download\Video Title.mp4 has already been downloaded
-                match = re.search(r'\[download\] (.*) has already been downloaded', line)
-                if match:
-                    final_path = match.group(1).strip()
-            elif '[ExtractAudio] Destination:' in line:
-                final_path = line.split('Destination:')[1].strip()
-
-        process.wait()
-        
-        if process.returncode == 0:
-            return final_path
-        else:
-            raise Exception(f"yt-dlp exited with code {process.returncode}")
-            
+        with metrics.span('download', format=format_type):
+            return get_engine().download(url, options, progress_callback, cancel_event)
+    except DownloadCancelled:
+        raise
     except Exception as e:
         print(f"Error during download: {e}")
+        metrics.error('download', e)
         raise e
+    finally:
+        # Always hand over the last state, even if it was coalesced away
+        if throttle:
+            throttle.flush()
 
 if __name__ == "__main__":
     def my_callback(p):
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import OrderedDict
+
+from modules import metrics
+from modules.settings import get_setting
+
+WATCH_URL = "https://www.youtube.com/watch?v={}"
+
+# Average bitrates of the files the app produces after conversion
+# (libmp3lame -q:a 0 averages about 245 kbit/s; wav is 16-bit PCM)
+MP3_BYTES_PER_SEC = 245000 / 8
+WAV_BYTES_PER_SAMPLE = 2
+
+def format_size(fmt, duration):
+    """
+    Returns the size of one yt-dlp format entry in bytes: the exact size
+    when YouTube reports it, otherwise an estimate from the bitrate.
+    """
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+def _best(formats, predicate):
+    # yt-dlp lists formats worst to best
+    matches = [f for f in formats if predicate(f)]
+    return matches[-1] if matches else None
+
+def estimate_sizes(info):
+    """
+    Estimates the download size of `info` for each format the app offers
+    ('mp4', 'm4a', 'mp3', 'wav'), mirroring the format choices in
+    downloader._download. Formats that cannot be estimated are left out.
+    """
+    formats = info.get('formats') or []
+    duration = info.get('duration')
+    is_audio = lambda f: f.get('acodec') not in (None, 'none') and f.get('vcodec') in (None, 'none')
+    is_video = lambda f: f.get('vcodec') not in (None, 'none')
+    sizes = {}
+
+    video = _best(formats, lambda f: is_video(f) and f.get('acodec') in (None, 'none') and f.get('ext') == 'mp4')
+    m4a = _best(formats, lambda f: is_audio(f) and f.get('ext') == 'm4a')
+    if video and m4a:
+        video_size, audio_size = format_size(video, duration), format_size(m4a, duration)
+        if video_size and audio_size:
+            sizes['mp4'] = video_size + audio_size
+    if 'mp4' not in sizes:
+        progressive = _best(formats, lambda f: is_video(f) and f.get('acodec') not in (None, 'none')
+                            and f.get('ext') == 'mp4')
+        if progressive and format_size(progressive, duration):
+            sizes['mp4'] = format_size(progressive, duration)
+    if m4a and format_size(m4a, duration):
+        sizes['m4a'] = format_size(m4a, duration)
+
+    if duration:
+        sizes['mp3'] = int(duration * MP3_BYTES_PER_SEC)
+        audio = _best(formats, is_audio) or {}
+        rate = audio.get('asr') or 48000
+        channels = audio.get('audio_channels') or 2
+        sizes['wav'] = int(duration * rate * channels * WAV_BYTES_PER_SAMPLE)
+    return sizes
+
+def summarize_info(info):
+    """
+    Keeps the fields the result list shows from a full yt-dlp info dict,
+    which is far too large (every format and thumbnail) to hold per row.
+    """
+    return {
+        'duration_string': info.get('duration_string'),
+        'uploader': info.get('uploader') or info.get('channel'),
+        'view_count': info.get('view_count'),
+        'like_count': info.get('like_count'),
+        'upload_date': info.get('upload_date'),
+        'sizes': estimate_sizes(info),
+    }
+
+class MetadataEnricher:
+    """
+    Fills in what flat search results lack (view counts, exact durations,
+    estimated download sizes) after the results are already on screen.
+
+    want(video_ids) replaces the pending list, like ThumbnailFetcher.
+    Each worker takes up to 'enrichment_batch_size' ids and resolves them
+    with a single engine.extract_infos() call, so one yt-dlp start (or one
+    warm in-process extractor pass) covers a whole batch, and the workers
+    run several batches at once, each holding one of the extraction slots
+    shared with searches. Results are memoized by id for 'enrichment_ttl'
+    seconds and passed to on_ready(video_id, details) from the worker
+    thread. cancel() also stops the batches already running.
+    """
+    def __init__(self, on_ready=None, engine=None, batch_size=None, workers=None, ttl=None, max_entries=None):
+        self.on_ready = on_ready
+        self.engine = engine
+        self.batch_size = max(1, batch_size or get_setting('enrichment_batch_size'))
+        self.workers = max(1, workers or get_setting('enrichment_workers'))
+        self.ttl = ttl or get_setting('enrichment_ttl')
+        self.max_entries = max_entries or get_setting('enrichment_memory_entries')
+        self._memo = OrderedDict()
+        self._wanted = []
+        self._inflight = set()
+        self._failed = set()
+        self._cancel_event = threading.Event()
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def get(self, video_id):
+        """
+        Returns the memoized details for `video_id`, or None.
+        """
+        with self._cond:
+            return self._lookup(video_id)
+
+    def _lookup(self, video_id):
+        # Called with _cond held
+        entry = self._memo.get(video_id)
+        if entry is None:
+            return None
+        expires, details = entry
+        if expires < time.time():
+            del self._memo[video_id]
+            return None
+        self._memo.move_to_end(video_id)
+        return details
+
+    def want(self, video_ids):
+        """
+        Sets the ids to enrich next, most important first.
+        """
+        with self._cond:
+            self._wanted = [v for v in dict.fromkeys(video_ids)
+                            if v and v not in self._inflight and v not in self._failed and self._lookup(v) is None]
+            if self._wanted and not self._threads:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self._worker_loop, daemon=True)
+                    self._threads.append(thread)
+                    thread.start()
+            self._cond.notify_all()
+
+    def cancel(self):
+        with self._cond:
+            self._cancel_event.set()
+            self._cancel_event = threading.Event()
+        self.want([])
+
+    def join(self, timeout=None):
+        """
+        Waits until every wanted id has been resolved or has failed.
+        Returns False if `timeout` ran out first.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._wanted and not self._inflight, timeout)
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._wanted:
+                    self._cond.wait()
+                batch = self._wanted[:self.batch_size]
+                del self._wanted[:self.batch_size]
+                self._inflight.update(batch)
+                cancel_event = self._cancel_event
+            try:
+                self._fetch(batch, cancel_event)
+            finally:
+                with self._cond:
+                    self._inflight.difference_update(batch)
+                    self._cond.notify_all()
+
+    def _fetch(self, batch, cancel_event):
+        from modules.ytdlp_engine import extraction_slot, get_engine
+        engine = self.engine or get_engine()
+        remaining = set(batch)
+
+        def on_info(info):
+            video_id = info.get('id')
+            if video_id not in remaining:
+                return
+            remaining.discard(video_id)
+            details = summarize_info(info)
+            with self._cond:
+                self._memo[video_id] = (time.time() + self.ttl, details)
+                self._memo.move_to_end(video_id)
+                while len(self._memo) > self.max_entries:
+                    self._memo.popitem(last=False)
+            if self.on_ready:
+                try:
+                    self.on_ready(video_id, details)
+                except Exception as e:
+                    print(f"Error in enrichment listener: {e}")
+
+        with extraction_slot('enrichment', cancel_event.is_set) as acquired:
+            if not acquired:
+                return
+            with metrics.span('enrichment.batch', ids=len(batch)) as span:
+                try:
+                    engine.extract_infos([WATCH_URL.format(v) for v in batch], on_info, cancel_event)
+                except Exception as e:
+                    # Ids already delivered are kept; only the rest count as failed
+                    if remaining and not cancel_event.is_set():
+                        print(f"Error enriching {len(remaining)} of {len(batch)} results: {e}")
+                span.set(failed=len(remaining), cancelled=cancel_event.is_set())
+        # Cancelled ids did not fail; they are looked up again if they come back on screen
+        if not cancel_event.is_set():
+            with self._cond:
+                self._failed.update(remaining)
@@ -1,31 +1,308 @@
 import wx
+import io
 import os
 import threading
-import re
+import time
+from collections import OrderedDict
 import wx.lib.newevent
-from modules.search_engine import search_youtube
-from modules.player import play_video
-from modules.downloader import download_media
+from modules import metrics
+from modules.search_engine import StreamingSearch, PAGE_SIZE
+from modules.search_cache import get_search_cache, normalize_query
+from modules.player import play_video, playback_mode, prefetch_stream, PLAYBACK_MODES
+from modules.settings import get_setting, set_setting
+from modules.download_manager import get_download_manager, RUNNING, QUEUED, FINISHED, ERROR, CONVERTING
+from modules.models import media_url, VideoResult
+from modules.batch import is_collection_url, playlist_url_of, start_collection_download
+from modules.thumbnails import ThumbnailFetcher
+from modules.enrichment import MetadataEnricher
+from modules.ytdlp_engine import format_bytes
+from modules.library import get_library
+from modules.clipboard import ClipboardWatcher, extract_links
+from modules.throughput import get_format_policy
+from modules.service import call_or_local
 
-# Define a custom event for progress updates using the modern way
+# Define custom events for queue and search updates using the modern way
 DownloadEvent, EVT_DOWNLOAD_UPDATE = wx.lib.newevent.NewEvent()
+SearchEvent, EVT_SEARCH_UPDATE = wx.lib.newevent.NewEvent()
+
+DOWNLOAD_FORMATS = [("MP4 Video", "mp4"), ("M4A Audio", "m4a"), ("MP3 Audio", "mp3"), ("WAV Audio", "wav")]
+
+# Menu command ids are fixed for the life of the process (see CommandRegistry)
+FIRST_COMMAND_ID = wx.ID_HIGHEST + 100
+MAX_COMMANDS = 50
+
+class CommandRegistry:
+    """
+    Named menu commands with fixed ids and one dispatcher. The whole id
+    range is bound once with EVT_MENU_RANGE, so building a menu only
+    appends items: it never adds a binding or a closure to the window,
+    however many menus are opened over a session, and dispatch is a single
+    dict lookup.
+    """
+    def __init__(self, window, first_id=FIRST_COMMAND_ID):
+        self.first_id = first_id
+        self.ids = {}
+        self.labels = {}
+        self.handlers = {}
+        window.Bind(wx.EVT_MENU_RANGE, self.dispatch, id=first_id, id2=first_id + MAX_COMMANDS - 1)
+
+    def add(self, name, label, handler):
+        if len(self.ids) >= MAX_COMMANDS:
+            raise ValueError("Too many menu commands; raise MAX_COMMANDS")
+        command_id = self.first_id + len(self.ids)
+        self.ids[name] = command_id
+        self.labels[name] = label
+        self.handlers[command_id] = handler
+        return command_id
+
+    def append(self, menu, name, label=None):
+        return menu.Append(self.ids[name], label or self.labels[name])
+
+    def dispatch(self, event):
+        handler = self.handlers.get(event.GetId())
+        if handler is None:
+            event.Skip()
+            return
+        handler()
+
+class ThumbnailRing:
+    """
+    Decoded thumbnails for a ResultListCtrl. The wx.ImageList works as a
+    ring of 'thumbnail_memory_entries' slots reused in LRU order, so memory
+    stays flat however far the user scrolls. Lookups never touch the disk
+    or network: a missing thumbnail shows the blank slot 0 and the visible
+    rows are handed to a ThumbnailFetcher, which decodes off the UI thread.
+    """
+    SIZE = (64, 36)
+    # Rows below the visible page that are fetched ahead of scrolling
+    LOOKAHEAD = 10
+    UPDATE_DELAY_MS = 100
+
+    def __init__(self, list_ctrl):
+        self.list_ctrl = list_ctrl
+        self.capacity = get_setting('thumbnail_memory_entries')
+        self.image_list = wx.ImageList(*self.SIZE)
+        blank = wx.Bitmap(*self.SIZE)
+        self.image_list.Add(blank)
+        self.slots = OrderedDict()
+        self._update_pending = False
+        self.fetcher = ThumbnailFetcher(self.on_data)
+        list_ctrl.SetImageList(self.image_list, wx.IMAGE_LIST_SMALL)
+
+    def image_index(self, video_id):
+        slot = self.slots.get(video_id)
+        if slot is not None:
+            self.slots.move_to_end(video_id)
+            return slot
+        self.schedule_update()
+        return 0
+
+    def schedule_update(self):
+        # Coalesces the misses of one repaint (or one scroll) into one request
+        if not self._update_pending:
+            self._update_pending = True
+            wx.CallLater(self.UPDATE_DELAY_MS, self.update_visible)
+
+    def update_visible(self):
+        self._update_pending = False
+        if not self.list_ctrl:
+            return
+        results = self.list_ctrl.results
+        top, bottom = self.list_ctrl.visible_range(self.LOOKAHEAD)
+        self.fetcher.want([results[i].id for i in range(top, bottom) if results[i].id not in self.slots])
+
+    def cancel(self):
+        self.fetcher.cancel()
+
+    def on_data(self, video_id, data):
+        # Worker thread: decoding and scaling happen here, only the Bitmap is made on the UI thread
+        image = wx.Image(io.BytesIO(data), wx.BITMAP_TYPE_ANY)
+        if image.IsOk():
+            wx.CallAfter(self.add, video_id, image.Scale(*self.SIZE, wx.IMAGE_QUALITY_HIGH))
+
+    def add(self, video_id, image):
+        if not self.list_ctrl or video_id in self.slots:
+            return
+        bitmap = wx.Bitmap(image)
+        if self.image_list.GetImageCount() <= self.capacity:
+            slot = self.image_list.Add(bitmap)
+        else:
+            _, slot = self.slots.popitem(last=False)
+            self.image_list.Replace(slot, bitmap)
+        self.slots[video_id] = slot
+
+        top, bottom = self.list_ctrl.visible_range()
+        if bottom > top:
+            self.list_ctrl.RefreshItems(top, bottom - 1)
+
+class ResultListCtrl(wx.ListCtrl):
+    """
+    Virtual list of search results. Only the visible rows are rendered,
+    rows are read straight from the frame's list of VideoResult records.
+    Views and sizes come from a MetadataEnricher: rows painted without
+    details queue the visible page for a batched lookup and are refreshed
+    in place when it returns. Lookups wait while the frame holds them (a
+    search is still streaming in). Keeps the small ListBox-style API
+    (GetSelection/SetSelection/GetCount/Clear) the rest of the frame relies on.
+    """
+    # Rows below the visible page whose details are fetched ahead of scrolling
+    ENRICH_LOOKAHEAD = 10
+    ENRICH_DELAY_MS = 150
+
+    def __init__(self, parent):
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL)
+        self.results = []
+        self.InsertColumn(0, "Title", width=400)
+        self.InsertColumn(1, "Duration", width=70)
+        self.InsertColumn(2, "Uploader", width=160)
+        self.InsertColumn(3, "Views", width=90)
+        self.InsertColumn(4, "Size (MP4)", width=90)
+        self.thumbnails = ThumbnailRing(self) if get_setting('show_thumbnails') else None
+        self.enricher = MetadataEnricher(self.on_details) if get_setting('enrich_results') else None
+        self._enrich_pending = False
+        self._enrich_held = False
+
+    def set_results(self, results):
+        self.results = results
+        # Whatever the old list still wanted is no longer on screen
+        if self.thumbnails:
+            self.thumbnails.cancel()
+        if self.enricher:
+            self.enricher.cancel()
+        self.SetItemCount(len(results))
+
+    def visible_range(self, lookahead=0):
+        """
+        Returns (top, bottom) row indexes of the page on screen plus
+        `lookahead` rows below it, bottom exclusive.
+        """
+        top = max(0, self.GetTopItem())
+        return top, min(len(self.results), top + self.GetCountPerPage() + 1 + lookahead)
+
+    def details_of(self, result):
+        if result.details is None and self.enricher and not result.path:
+            result.details = self.enricher.get(result.id)
+            if result.details is None:
+                self.schedule_enrich()
+            elif result.uploader in (None, 'Unknown') and result.details.get('uploader'):
+                result.uploader = result.details['uploader']
+        return result.details
+
+    def hold_enrichment(self, held):
+        # Releasing looks up whatever is on screen by then
+        self._enrich_held = held
+        if not held and self.enricher:
+            self.schedule_enrich()
+
+    def schedule_enrich(self):
+        # Coalesces the rows of one repaint (or one scroll) into one request
+        if not self._enrich_pending and not self._enrich_held:
+            self._enrich_pending = True
+            wx.CallLater(self.ENRICH_DELAY_MS, self.enrich_visible)
+
+    def enrich_visible(self):
+        self._enrich_pending = False
+        if not self or self._enrich_held:
+            return
+        top, bottom = self.visible_range(self.ENRICH_LOOKAHEAD)
+        self.enricher.want([r.id for r in self.results[top:bottom] if r.details is None and not r.path])
+
+    def on_details(self, video_id, details):
+        # Worker thread
+        wx.CallAfter(self.apply_details, video_id, details)
+
+    def apply_details(self, video_id, details):
+        if not self:
+            return
+        top, bottom = self.visible_range()
+        for index in range(top, bottom):
+            result = self.results[index]
+            if result.id == video_id and result.details is None:
+                self.details_of(result)
+                self.RefreshItem(index)
+
+    def refresh_count(self):
+        self.SetItemCount(len(self.results))
+
+    def OnGetItemText(self, item, column):
+        result = self.results[item]
+        if column == 0:
+            return f"[Downloaded] {result.title}" if result.path else result.title
+        details = self.details_of(result) or {}
+        if column == 1:
+            return details.get('duration_string') or result.duration or ""
+        elif column == 2:
+            return result.uploader or ""
+        elif column == 3:
+            views = details.get('view_count')
+            return f"{views:,}" if views is not None else ""
+        size = details.get('sizes', {}).get('mp4')
+        return format_bytes(size) if size else ""
+
+    def OnGetItemImage(self, item):
+        if self.thumbnails is None:
+            return -1
+        return self.thumbnails.image_index(self.results[item].id)
+
+    def GetSelection(self):
+        return self.GetFirstSelected()
+
+    def SetSelection(self, index):
+        self.Select(index)
+        self.Focus(index)
+
+    def GetCount(self):
+        return self.GetItemCount()
+
+    def Clear(self):
+        self.set_results([])
 
 class TeTubeFrame(wx.Frame):
     def __init__(self):
         super().__init__(parent=None, title="Te_Tube - YouTube Search & Download", size=(800, 600))
         
         self.results = []
-        self.last_clipboard_text = ""
+        self.search_generation = 0
+        self.active_search = None
+        self.search_query = ""
+        self.next_start = 1
+        self.has_more = False
+        self.search_started = 0.0
+        self.local_ids = set()
+        # Rows shown from a related cached query until the real results arrive
+        self.provisional_count = 0
+        self.search_interactive = False
+        self.typing_timer = None
+        self.download_manager = get_download_manager()
+        self.CreateStatusBar()
+        self.init_commands()
         self.init_ui()
         self.Centre()
+
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
+        self.Bind(EVT_SEARCH_UPDATE, self.on_search_update)
         
         # Use CHAR_HOOK for global hotkeys like Enter
         self.Bind(wx.EVT_CHAR_HOOK, self.on_key_down)
 
-        # Clipboard monitor timer
-        self.clipboard_timer = wx.Timer(self)
-        self.Bind(wx.EVT_TIMER, self.on_check_clipboard, self.clipboard_timer)
-        self.clipboard_timer.Start(1000) # Check every 1 second
+        # Clipboard links: read on change (Windows) or when the window is activated
+        self.link_dialog_open = False
+        self.clipboard = ClipboardWatcher(lambda: wx.CallAfter(self.check_clipboard))
+        if self.clipboard.available:
+            self.clipboard.start()
+        else:
+            self.Bind(wx.EVT_ACTIVATE, self.on_activate)
+
+    def init_commands(self):
+        self.commands = CommandRegistry(self)
+        self.commands.add('play', "&Play\tEnter", lambda: self.on_play(None))
+        self.commands.add('play_audio', "Play &audio only", lambda: self.on_play_audio(None))
+        self.commands.add('copy_link', "&Copy Link", lambda: self.on_copy_link(None))
+        for label, fmt in DOWNLOAD_FORMATS:
+            self.commands.add('download_' + fmt, label, lambda f=fmt: self.on_format_chosen(f))
+        # What the open format menu downloads: fmt -> None, replaced by each menu
+        self.format_action = None
 
     def set_accessible_name(self, control, name):
         """Safely sets the accessible name for a control."""
@@ -42,9 +319,13 @@ class TeTubeFrame(wx.Frame):
         self.notebook = wx.Notebook(panel)
         self.search_tab = wx.Panel(self.notebook)
         self.process_link_tab = wx.Panel(self.notebook)
+        self.downloads_tab = DownloadsPanel(self.notebook, self, self.download_manager)
+        self.stats_tab = StatsPanel(self.notebook, self)
         
         self.notebook.AddPage(self.search_tab, "Search")
         self.notebook.AddPage(self.process_link_tab, "Process via link")
+        self.notebook.AddPage(self.downloads_tab, "Downloads")
+        self.notebook.AddPage(self.stats_tab, "Statistics")
 
         self.setup_search_tab()
         self.setup_process_link_tab()
@@ -61,6 +342,8 @@ class TeTubeFrame(wx.Frame):
         self.search_input = wx.TextCtrl(self.search_tab, style=wx.TE_PROCESS_ENTER)
         self.search_input.SetHint("Enter keywords here...")
         self.search_input.Bind(wx.EVT_TEXT_ENTER, self.on_search)
+        if get_setting('search_as_you_type'):
+            self.search_input.Bind(wx.EVT_TEXT, self.on_search_text)
         
         # Accessibility for search input
         self.set_accessible_name(self.search_input, "Search YouTube")
@@ -75,14 +358,32 @@ class TeTubeFrame(wx.Frame):
         vbox.Add(hbox1, 0, wx.EXPAND | wx.ALL, 5)
 
         # Result list
-        self.result_list = wx.ListBox(self.search_tab, style=wx.LB_SINGLE)
-        self.result_list.Bind(wx.EVT_LISTBOX_DCLICK, self.on_play)
+        self.result_list = ResultListCtrl(self.search_tab)
+        self.result_list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_play)
+        self.result_list.Bind(wx.EVT_LIST_ITEM_FOCUSED, self.on_result_focused)
         self.result_list.Bind(wx.EVT_CONTEXT_MENU, self.on_context_menu)
         
         # Accessibility for list box
         self.set_accessible_name(self.result_list, "Search Results")
 
         vbox.Add(self.result_list, 1, wx.EXPAND | wx.ALL, 5)
+
+        self.load_more_button = wx.Button(self.search_tab, label="Load more results")
+        self.load_more_button.Bind(wx.EVT_BUTTON, lambda e: self.load_more())
+        self.load_more_button.Disable()
+        self.set_accessible_name(self.load_more_button, "Load more results")
+
+        hbox2 = wx.BoxSizer(wx.HORIZONTAL)
+        hbox2.Add(self.load_more_button, 0, wx.ALL, 5)
+
+        mode_label = wx.StaticText(self.search_tab, label="Playback mode:")
+        self.playback_mode = wx.Choice(self.search_tab, choices=["Standard", "Fast start (pipe)", "Audio only"])
+        self.playback_mode.SetSelection(PLAYBACK_MODES.index(playback_mode()))
+        self.playback_mode.Bind(wx.EVT_CHOICE, lambda e: set_setting('playback_mode', PLAYBACK_MODES[self.playback_mode.GetSelection()]))
+        self.set_accessible_name(self.playback_mode, "Playback mode")
+        hbox2.Add(mode_label, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 15)
+        hbox2.Add(self.playback_mode, 0, wx.ALL, 5)
+        vbox.Add(hbox2, 0, wx.EXPAND)
         self.search_tab.SetSizer(vbox)
 
     def setup_process_link_tab(self):
@@ -122,31 +423,157 @@ class TeTubeFrame(wx.Frame):
         query = self.search_input.GetValue()
         if not query:
             return
+        if self.typing_timer:
+            self.typing_timer.Stop()
 
-        # Show status
-        self.SetTitle(f"Searching for '{query}'...")
+        # Enter after typing: the search for this text is already running or done
+        if self.search_interactive and normalize_query(query) == normalize_query(self.search_query):
+            self.search_interactive = False
+            if not self.active_search and self.result_list.GetCount() > 0:
+                self.result_list.SetFocus()
+            return
+        self.start_search(query)
+
+    def on_search_text(self, event):
+        event.Skip()
+        # Debounce: only a pause in typing starts a search
+        delay = get_setting('search_as_you_type_delay_ms')
+        if self.typing_timer and self.typing_timer.IsRunning():
+            self.typing_timer.Restart(delay)
+        else:
+            self.typing_timer = wx.CallLater(delay, self.on_typing_paused)
+
+    def on_typing_paused(self):
+        query = self.search_input.GetValue().strip()
+        if len(query) < get_setting('search_as_you_type_min_chars'):
+            return
+        if normalize_query(query) == normalize_query(self.search_query):
+            return
+        self.start_search(query, interactive=True)
+
+    def start_search(self, query, interactive=False):
+        self.search_query = query
+        self.search_interactive = interactive
+        self.next_start = 1
         
-        # Clear previous results
-        self.result_list.Clear()
+        # Downloaded matches come first and are on screen before YouTube answers
         try:
-            self.results = search_youtube(query)
-            
-            for item in self.results:
-                display_text = f"{item['title']} [{item['duration']}] - {item['uploader']}"
-                self.result_list.Append(display_text)
+            with metrics.span('library.search') as span:
+                self.results = get_library().search(query)
+                span.set(results=len(self.results))
         except Exception as e:
-            wx.MessageBox(f"Error during search: {e}", "Search Error", wx.OK | wx.ICON_ERROR)
-        
-        self.SetTitle("Te_Tube - YouTube Search & Download")
-        if self.result_list.GetCount() > 0:
+            print(f"Error searching the library: {e}")
+            self.results = []
+        self.local_ids = {r.id for r in self.results}
+
+        # While typing, results cached for a related query stand in until YouTube answers
+        self.provisional_count = 0
+        if interactive:
+            try:
+                cached = get_search_cache().provisional(query, PAGE_SIZE) or []
+            except Exception as e:
+                print(f"Error reading search cache: {e}")
+                cached = []
+            provisional = [VideoResult.from_dict(d) for d in cached if d.get('id') not in self.local_ids]
+            self.results.extend(provisional)
+            self.provisional_count = len(provisional)
+
+        self.result_list.set_results(self.results)
+        if self.results:
             self.result_list.SetSelection(0)
+        self.run_search_page()
+
+    def drop_provisional(self):
+        if self.provisional_count:
+            del self.results[len(self.results) - self.provisional_count:]
+            self.provisional_count = 0
+            self.result_list.refresh_count()
+
+    def load_more(self):
+        """
+        Fetches the next page of results for the current query.
+        """
+        if self.active_search or not self.has_more:
+            return
+        self.run_search_page()
+
+    def run_search_page(self):
+        # A newer query supersedes whatever is still running
+        if self.active_search:
+            self.active_search.cancel()
+            metrics.count('search.superseded')
+        self.search_generation += 1
+        self.has_more = False
+        self.load_more_button.Disable()
+        # Searches get the extraction slots; details and prefetch wait until it settles
+        self.result_list.hold_enrichment(True)
+
+        # Show status
+        self.SetTitle(f"Searching for '{self.search_query}'...")
+
+        search = StreamingSearch(self.search_query, PAGE_SIZE, self.next_start)
+        self.active_search = search
+        self.search_started = time.perf_counter()
+        SearchThread(self, search, self.search_generation).start()
+
+    def on_search_update(self, event):
+        # Ignore events from searches that were superseded
+        if event.generation != self.search_generation:
+            return
+
+        if event.status == 'result':
+            if event.item.id in self.local_ids:
+                return
+            with metrics.span('gui.search_result'):
+                self.drop_provisional()
+                self.results.append(event.item)
+                self.result_list.refresh_count()
+                if len(self.results) == 1:
+                    self.result_list.SetSelection(0)
+                    # Enter to first row on screen, as the user sees it
+                    metrics.record('gui.search_first_result', (time.perf_counter() - self.search_started) * 1000)
+            return
+
+        self.active_search = None
+        self.drop_provisional()
+        self.result_list.hold_enrichment(False)
+        self.prefetch_focused()
+        self.SetTitle("Te_Tube - YouTube Search & Download")
+        if event.status == 'error':
+            if self.search_interactive:
+                # No dialog in the middle of typing
+                self.SetStatusText(f"Search failed: {event.error}")
+            else:
+                wx.MessageBox(f"Error during search: {event.error}", "Search Error", wx.OK | wx.ICON_ERROR)
+            return
+
+        first_page = self.next_start == 1
+        self.next_start += event.count
+        self.has_more = event.count >= PAGE_SIZE
+        self.load_more_button.Enable(self.has_more)
+        # Focus stays in the search box while the user is typing
+        if first_page and self.result_list.GetCount() > 0 and not self.search_interactive:
             self.result_list.SetFocus()
 
+    def on_result_focused(self, event):
+        index = event.GetIndex()
+        if not self.active_search:
+            self.prefetch_focused()
+        # Reaching the last row pulls in the next page
+        if index == len(self.results) - 1:
+            self.load_more()
+        event.Skip()
+
+    def prefetch_focused(self):
+        # Resolve the stream ahead of time so Enter starts playback at once
+        index = self.result_list.GetFocusedItem()
+        if 0 <= index < len(self.results):
+            prefetch_stream(self.results[index])
+
     def on_play(self, event):
         selection = self.result_list.GetSelection()
         if selection != wx.NOT_FOUND:
-            video_url = self.results[selection]['url']
-            self.play_url(video_url)
+            self.play_url(self.results[selection])
 
     def on_play_link(self, event):
         url = self.link_input.GetValue().strip()
@@ -155,12 +582,18 @@ class TeTubeFrame(wx.Frame):
             return
         self.play_url(url)
 
-    def play_url(self, url):
+    def play_url(self, url, mode=None):
+        # Resolving can take a moment on a cache miss, keep the UI responsive
         try:
-            play_video(url)
+            threading.Thread(target=play_video, args=(url, mode), daemon=True).start()
         except Exception as e:
             wx.MessageBox(f"Error playing video: {e}", "Playback Error", wx.OK | wx.ICON_ERROR)
 
+    def on_play_audio(self, event):
+        selection = self.result_list.GetSelection()
+        if selection != wx.NOT_FOUND:
+            self.play_url(self.results[selection], 'audio')
+
     def on_key_down(self, event):
         keycode = event.GetKeyCode()
         if keycode in [wx.WXK_RETURN, wx.WXK_NUMPAD_ENTER]:
@@ -173,8 +606,14 @@ class TeTubeFrame(wx.Frame):
         
         event.Skip()
 
-    def on_check_clipboard(self, event):
-        if not wx.TheClipboard.Open():
+    def on_activate(self, event):
+        event.Skip()
+        if event.GetActive():
+            self.check_clipboard()
+
+    def check_clipboard(self):
+        # A modal dialog is already asking about the previous change
+        if self.link_dialog_open or not wx.TheClipboard.Open():
             return
 
         text_data = wx.TextDataObject()
@@ -183,90 +622,106 @@ class TeTubeFrame(wx.Frame):
 
         if success:
             clipboard_text = text_data.GetText().strip()
-            if clipboard_text and clipboard_text != self.last_clipboard_text:
+            if clipboard_text and not self.clipboard.seen(clipboard_text):
                 # Suppress dialog if user is currently typing/pasting into a text field
                 focused = wx.Window.FindFocus()
                 if isinstance(focused, wx.TextCtrl):
-                    self.last_clipboard_text = clipboard_text
                     return
 
-                # Improved regex to catch m.youtube, music.youtube, and various path formats
-                youtube_regex = r'(https?://)?(www\.|m\.|music\.)?(youtube\.com|youtu\.be)/(watch\?v=|embed/|v/|shorts/)?([a-zA-Z0-9_-]{11})'
-                if re.search(youtube_regex, clipboard_text):
-                    self.last_clipboard_text = clipboard_text
-                    # Show detection dialog
-                    self.show_link_detected_dialog(clipboard_text)
-                else:
-                    # Update even if it's not a link to avoid checking again
-                    self.last_clipboard_text = clipboard_text
-
-    def show_link_detected_dialog(self, url):
-        # We need to make sure we don't open multiple dialogs if one is already open
-        # Since it's a modal dialog, it blocks the timer if shown as ShowModal
-        
-        dialog = LinkDetectedDialog(self, url)
-        result = dialog.ShowModal()
+                links = extract_links(clipboard_text)
+                if links:
+                    self.show_link_detected_dialog(links)
+
+    def show_link_detected_dialog(self, links):
+        self.link_dialog_open = True
+        dialog = LinkDetectedDialog(self, links)
+        try:
+            result = dialog.ShowModal()
+            whole_playlists = dialog.whole_playlists()
+        finally:
+            dialog.Destroy()
+            self.link_dialog_open = False
         
         if result == wx.ID_YES: # Play
-            self.play_url(url)
+            self.play_url(links[0])
         elif result == wx.ID_SAVE: # Download (using ID_SAVE as a placeholder for Download)
-            self.on_download_link_from_url(url)
-        
-        dialog.Destroy()
+            if whole_playlists:
+                links = [playlist_url_of(url) or url for url in links]
+            self.on_download_link_from_url(links)
 
-    def on_download_link_from_url(self, url):
-        # Create a simple menu for format selection
+    def on_download_link_from_url(self, links):
+        self.popup_format_menu(lambda fmt: self.download_links(links, fmt))
+
+    def build_format_menu(self, action, sizes=None):
+        """
+        Returns a menu of download formats; choosing one calls action(fmt).
+        """
+        self.format_action = action
         menu = wx.Menu()
-        formats = [("MP4 Video", "mp4"), ("M4A Audio", "m4a"), ("MP3 Audio", "mp3"), ("WAV Audio", "wav")]
-        
-        for label, fmt in formats:
-            item = menu.Append(wx.ID_ANY, label)
-            self.Bind(wx.EVT_MENU, lambda evt, f=fmt: self.start_download(url, "Video from clipboard", f), item)
-        
+        for label, fmt in DOWNLOAD_FORMATS:
+            if sizes and sizes.get(fmt):
+                label += f" (~{format_bytes(sizes[fmt])})"
+            self.commands.append(menu, 'download_' + fmt, label)
+        return menu
+
+    def popup_format_menu(self, action):
+        menu = self.build_format_menu(action)
         self.PopupMenu(menu)
         menu.Destroy()
 
+    def on_format_chosen(self, fmt):
+        if self.format_action:
+            self.format_action(fmt)
+
+    def download_links(self, links, fmt):
+        """
+        Queues links found together as one batch; playlists and channels
+        are expanded into batches of their own.
+        """
+        videos = [url for url in links if not is_collection_url(url)]
+        for url in links:
+            if is_collection_url(url):
+                self.start_batch_download(url, fmt)
+        if len(videos) == 1:
+            self.start_download(videos[0], "Video from clipboard", fmt)
+        elif videos:
+            _, jobs = self.download_manager.submit_many([(url, url) for url in videos], fmt,
+                                                        batch_title="Links from clipboard")
+            self.notebook.SetSelection(self.notebook.FindPage(self.downloads_tab))
+            self.SetStatusText(f"Queued {len(jobs)} videos for download")
+
     def on_copy_link(self, event):
         selection = self.result_list.GetSelection()
         if selection != wx.NOT_FOUND:
-            video_url = self.results[selection]['url']
+            video_url = self.results[selection].url
             if wx.TheClipboard.Open():
                 wx.TheClipboard.SetData(wx.TextDataObject(video_url))
                 wx.TheClipboard.Close()
-                # Update last_clipboard_text to prevent Te_Tube from detecting its own copy
-                self.last_clipboard_text = video_url
+                # Mark it seen so Te_Tube doesn't detect its own copy
+                self.clipboard.seen(video_url)
                 wx.MessageBox("Link copied to clipboard!", "Success", wx.OK | wx.ICON_INFORMATION)
 
     def on_context_menu(self, event):
         selection = self.result_list.GetSelection()
         if selection == wx.NOT_FOUND:
             return
-
-        menu = wx.Menu()
-        play_item = menu.Append(wx.ID_ANY, "&Play\tEnter")
-        self.Bind(wx.EVT_MENU, self.on_play, play_item)
-
-        copy_item = menu.Append(wx.ID_ANY, "&Copy Link")
-        self.Bind(wx.EVT_MENU, self.on_copy_link, copy_item)
-
-        download_menu = wx.Menu()
-        formats = [("MP4 Video", "mp4"), ("M4A Audio", "m4a"), ("MP3 Audio", "mp3"), ("WAV Audio", "wav")]
-        
-        for label, fmt in formats:
-            item = download_menu.Append(wx.ID_ANY, label)
-            self.Bind(wx.EVT_MENU, lambda evt, f=fmt: self.on_download(f), item)
-            
-        menu.AppendSubMenu(download_menu, "&Download")
-        
+        menu = self.build_result_menu(self.results[selection])
         self.PopupMenu(menu)
         menu.Destroy()
 
+    def build_result_menu(self, result):
+        menu = wx.Menu()
+        for name in ('play', 'play_audio', 'copy_link'):
+            self.commands.append(menu, name)
+        sizes = (result.details or {}).get('sizes')
+        menu.AppendSubMenu(self.build_format_menu(self.on_download, sizes), "&Download")
+        return menu
+
     def on_download(self, fmt):
         selection = self.result_list.GetSelection()
         if selection != wx.NOT_FOUND:
-            video_url = self.results[selection]['url']
-            title = self.results[selection]['title']
-            self.start_download(video_url, title, fmt)
+            result = self.results[selection]
+            self.start_download(result, result.title, fmt)
 
     def on_download_link(self, event):
         url = self.link_input.GetValue().strip()
@@ -274,121 +729,390 @@ class TeTubeFrame(wx.Frame):
             wx.MessageBox("Please enter a video link first.", "Error", wx.OK | wx.ICON_WARNING)
             return
         
-        # Create a simple menu for format selection
-        menu = wx.Menu()
-        formats = [("MP4 Video", "mp4"), ("M4A Audio", "m4a"), ("MP3 Audio", "mp3"), ("WAV Audio", "wav")]
-        
-        for label, fmt in formats:
-            item = menu.Append(wx.ID_ANY, label)
-            self.Bind(wx.EVT_MENU, lambda evt, f=fmt: self.start_download(url, "Video from link", f), item)
-        
-        self.PopupMenu(menu)
-        menu.Destroy()
+        # A video opened from a playlist is just the video unless the user says otherwise
+        if playlist_url_of(url) and wx.MessageBox(
+                "This video is part of a playlist. Download the whole playlist instead?",
+                "Playlist", wx.YES_NO | wx.NO_DEFAULT | wx.ICON_QUESTION) == wx.YES:
+            url = playlist_url_of(url)
+        self.popup_format_menu(lambda fmt: self.start_download(url, "Video from link", fmt))
+
+    def start_download(self, target, title, fmt):
+        url = media_url(target)
+        if is_collection_url(url):
+            self.start_batch_download(url, fmt)
+            return
+        self.download_manager.submit(url, title, fmt)
+        self.notebook.SetSelection(self.notebook.FindPage(self.downloads_tab))
+        self.SetStatusText(f"Queued for download: {title}")
+
+    def start_batch_download(self, url, fmt):
+        """
+        Expands a playlist/channel link in the background and queues
+        every video in it as one batch.
+        """
+        self.SetStatusText("Reading playlist...")
+
+        def on_expanded(batch_id, jobs, error):
+            if error:
+                wx.CallAfter(wx.MessageBox, f"Could not read playlist: {error}", "Download Error", wx.OK | wx.ICON_ERROR)
+                wx.CallAfter(self.SetStatusText, "")
+            else:
+                wx.CallAfter(self.SetStatusText, f"Queued {len(jobs)} videos for download")
 
-    def start_download(self, url, title, fmt):
-        dialog = DownloadProgressDialog(self, title, url, fmt)
-        dialog.Show()
+        start_collection_download(self.download_manager, url, fmt, on_expanded)
+        self.notebook.SetSelection(self.notebook.FindPage(self.downloads_tab))
 
-class DownloadThread(threading.Thread):
-    def __init__(self, win, url, fmt):
+    def on_close(self, event):
+        self.stats_tab.timer.Stop()
+        self.clipboard.stop()
+        self.downloads_tab.detach()
+        self.download_manager.shutdown()
+        event.Skip()
+
+class SearchThread(threading.Thread):
+    def __init__(self, win, search, generation):
         super().__init__()
         self.win = win
-        self.url = url
-        self.fmt = fmt
+        self.search = search
+        self.generation = generation
         self.daemon = True
 
     def run(self):
+        def callback(item):
+            wx.PostEvent(self.win, SearchEvent(status='result', generation=self.generation, item=item))
+
         try:
-            def callback(p):
-                wx.PostEvent(self.win, DownloadEvent(**p))
-            
-            final_path = download_media(self.url, self.fmt, callback)
-            wx.PostEvent(self.win, DownloadEvent(status='finished', path=final_path))
+            results = self.search.run(callback)
+            wx.PostEvent(self.win, SearchEvent(status='finished', generation=self.generation, count=len(results)))
         except Exception as e:
-            wx.PostEvent(self.win, DownloadEvent(status='error', error=str(e)))
+            if not self.search.cancelled:
+                wx.PostEvent(self.win, SearchEvent(status='error', generation=self.generation, error=str(e)))
 
-class DownloadProgressDialog(wx.Dialog):
-    def __init__(self, parent, title, url, fmt):
-        super().__init__(parent, title="Downloading...", size=(400, 180))
-        self.video_title = title
-        self.last_percent = -1
-        
-        panel = wx.Panel(self)
-        self.vbox = wx.BoxSizer(wx.VERTICAL)
-        
-        self.title_label = wx.StaticText(panel, label=f"Downloading: {title}")
-        self.set_accessible_name(self.title_label, f"Downloading: {title}")
-        
-        self.gauge = wx.Gauge(panel, range=100, size=(350, 25))
-        self.set_accessible_name(self.gauge, "Download progress")
-        
-        self.status_label = wx.StaticText(panel, label="Initializing...")
-        self.set_accessible_name(self.status_label, "Status: Initializing")
-        
-        self.vbox.Add(self.title_label, 0, wx.ALL | wx.EXPAND, 10)
-        self.vbox.Add(self.gauge, 0, wx.ALL | wx.EXPAND, 10)
-        self.vbox.Add(self.status_label, 0, wx.ALL | wx.EXPAND, 10)
-        
-        panel.SetSizer(self.vbox)
-        self.Centre()
-        
-        self.Bind(EVT_DOWNLOAD_UPDATE, self.on_update)
-        
-        self.thread = DownloadThread(self, url, fmt)
-        self.thread.start()
+class DownloadsPanel(wx.Panel):
+    """
+    Single view of the download queue. Progress from the manager's worker
+    threads is collected into one pending set and flushed with a single
+    posted event, so a burst of updates costs one redraw.
+    """
+    def __init__(self, parent, frame, manager):
+        super().__init__(parent)
+        self.frame = frame
+        self.manager = manager
+        self.row_ids = []
+        self.row_index = {}
+        self.last_status = {}
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._posted = False
 
-    def set_accessible_name(self, control, name):
-        """Safely sets the accessible name for a control."""
-        control.SetName(name)
-        acc = control.GetAccessible()
-        if acc:
-            acc.SetName(name)
+        vbox = wx.BoxSizer(wx.VERTICAL)
 
-    def on_update(self, event):
-        status = event.status
-        
-        if status == 'downloading':
-            percent = int(event.percent)
-            if percent != self.last_percent:
-                self.gauge.SetValue(percent)
-                self.last_percent = percent
-            
-            # Clean up the status line (remove [download])
-            clean_status = event.line.replace('[download]', '').strip()
-            self.status_label.SetLabel(clean_status)
-            # AVOID set_accessible_name on every tick as it's expensive and causes freeze
-            
-        elif status == 'finished':
-            self.gauge.SetValue(100)
-            self.status_label.SetLabel("Download Complete!")
-            # Final accessibility update when finished is okay
-            self.set_accessible_name(self.status_label, "Status: Download Complete")
-            
-            path = event.path or "Unknown location"
-            wx.MessageBox(f"Download complete!\nFile saved at: {path}", "Success", wx.OK | wx.ICON_INFORMATION)
-            self.Destroy()
-            
-        elif status == 'error':
-            error_msg = event.error or "Unknown error"
-            wx.MessageBox(f"Download failed: {error_msg}", "Error", wx.OK | wx.ICON_ERROR)
-            self.Destroy()
+        self.job_list = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for col, (label, width) in enumerate([("Title", 300), ("Format", 60), ("Priority", 60), ("Status", 90), ("Progress", 200), ("Limit", 120)]):
+            self.job_list.InsertColumn(col, label, width=width)
+        frame.set_accessible_name(self.job_list, "Download queue")
+        vbox.Add(self.job_list, 1, wx.EXPAND | wx.ALL, 5)
+
+        hbox = wx.BoxSizer(wx.HORIZONTAL)
+        for label, handler in [("Pause", self.on_pause), ("Resume", self.on_resume), ("Cancel", self.on_cancel),
+                               ("Raise priority", self.on_raise), ("Lower priority", self.on_lower),
+                               ("Clear finished", self.on_clear)]:
+            button = wx.Button(self, label=label)
+            button.Bind(wx.EVT_BUTTON, handler)
+            frame.set_accessible_name(button, label)
+            hbox.Add(button, 0, wx.ALL, 5)
+        vbox.Add(hbox, 0, wx.EXPAND)
+
+        hbox2 = wx.BoxSizer(wx.HORIZONTAL)
+        concurrency_label = wx.StaticText(self, label="Parallel downloads:")
+        self.concurrency = wx.SpinCtrl(self, min=1, max=16, initial=manager.max_concurrency)
+        self.concurrency.Bind(wx.EVT_SPINCTRL, lambda e: self.manager.set_max_concurrency(self.concurrency.GetValue()))
+        frame.set_accessible_name(self.concurrency, "Parallel downloads")
+        limit_label = wx.StaticText(self, label="Bandwidth limit (KiB/s, 0 = unlimited):")
+        self.bandwidth_limit = wx.SpinCtrl(self, min=0, max=1024 * 1024, initial=manager.bandwidth.budget // 1024)
+        self.bandwidth_limit.Bind(wx.EVT_SPINCTRL, lambda e: self.manager.set_bandwidth_limit(self.bandwidth_limit.GetValue() * 1024))
+        frame.set_accessible_name(self.bandwidth_limit, "Bandwidth limit in kilobytes per second")
+        self.share_by_priority = wx.CheckBox(self, label="Share bandwidth by priority")
+        self.share_by_priority.SetValue(manager.bandwidth.policy == 'priority')
+        self.share_by_priority.Bind(wx.EVT_CHECKBOX, self.on_policy)
+        hbox2.Add(concurrency_label, 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        hbox2.Add(self.concurrency, 0, wx.ALL, 5)
+        hbox2.Add(limit_label, 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        hbox2.Add(self.bandwidth_limit, 0, wx.ALL, 5)
+        hbox2.Add(self.share_by_priority, 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        vbox.Add(hbox2, 0, wx.EXPAND)
+
+        self.summary_label = wx.StaticText(self, label="")
+        vbox.Add(self.summary_label, 0, wx.EXPAND | wx.ALL, 5)
+
+        self.SetSizer(vbox)
+
+        self.Bind(EVT_DOWNLOAD_UPDATE, self.on_queue_update)
+        manager.add_listener(self.on_job_changed)
+        for job in manager.jobs():
+            self.update_row(job)
+        self.update_summary()
+
+    def on_job_changed(self, job):
+        # Called from worker threads
+        with self._pending_lock:
+            self._pending.add(job.id)
+            if self._posted:
+                return
+            self._posted = True
+        wx.PostEvent(self, DownloadEvent())
+
+    def on_queue_update(self, event):
+        with self._pending_lock:
+            job_ids = self._pending
+            self._pending = set()
+            self._posted = False
+
+        with metrics.span('gui.downloads_refresh', rows=len(job_ids)):
+            for job_id in job_ids:
+                job = self.manager.get(job_id)
+                if job is not None:
+                    self.update_row(job)
+            self.update_summary()
+
+    def update_row(self, job):
+        row = self.row_index.get(job.id)
+        if row is None:
+            row = self.job_list.InsertItem(self.job_list.GetItemCount(), job.title)
+            self.row_index[job.id] = row
+            self.row_ids.append(job.id)
+
+        if job.status in (RUNNING, CONVERTING):
+            progress = job.line.replace('[download]', '').strip() or f"{job.percent:.1f}%"
+        elif job.status == ERROR:
+            progress = job.error or "Unknown error"
+        elif job.status == FINISHED:
+            progress = job.path or "Unknown location"
+        else:
+            progress = f"{job.percent:.1f}%"
+
+        self.job_list.SetItem(row, 1, job.fmt)
+        self.job_list.SetItem(row, 2, str(job.priority))
+        self.job_list.SetItem(row, 3, job.status.capitalize())
+        self.job_list.SetItem(row, 4, progress)
+
+        control = job.rate_control
+        if job.status == RUNNING and control:
+            rate = f"{control.rate // 1024} KiB/s" if control.rate else "Unlimited"
+            self.job_list.SetItem(row, 5, f"{rate}, {control.fragments} frag")
+        else:
+            self.job_list.SetItem(row, 5, "")
+
+        # Announce state changes only, never every progress tick
+        if self.last_status.get(job.id) != job.status:
+            self.last_status[job.id] = job.status
+            if job.status == FINISHED:
+                self.frame.SetStatusText(f"Download complete: {job.title}")
+            elif job.status == ERROR:
+                self.frame.SetStatusText(f"Download failed: {job.title}")
+
+    def update_summary(self):
+        jobs = self.manager.jobs()
+        running = sum(1 for j in jobs if j.status == RUNNING)
+        queued = sum(1 for j in jobs if j.status == QUEUED)
+        converting = sum(1 for j in jobs if j.status == CONVERTING)
+        summary = f"{running} downloading, {converting} converting, {queued} queued"
+        for batch in self.manager.batch_progress().values():
+            summary += f" | {batch['title']}: {batch['finished']}/{batch['total']} done ({batch['percent']:.0f}%)"
+            if batch['failed']:
+                summary += f", {batch['failed']} failed"
+        self.summary_label.SetLabel(summary)
+        self.frame.set_accessible_name(self.summary_label, summary)
+
+    def on_policy(self, event):
+        self.manager.bandwidth.set_policy('priority' if self.share_by_priority.GetValue() else 'fair')
+        self.manager.set_bandwidth_limit(self.manager.bandwidth.budget)
+
+    def selected_job(self):
+        row = self.job_list.GetFirstSelected()
+        if row == wx.NOT_FOUND:
+            return None
+        return self.manager.get(self.row_ids[row])
+
+    def on_pause(self, event):
+        job = self.selected_job()
+        if job:
+            self.manager.pause(job.id)
+
+    def on_resume(self, event):
+        job = self.selected_job()
+        if job:
+            self.manager.resume(job.id)
+
+    def on_cancel(self, event):
+        job = self.selected_job()
+        if job:
+            self.manager.cancel(job.id)
+
+    def on_raise(self, event):
+        job = self.selected_job()
+        if job:
+            self.manager.set_priority(job.id, job.priority + 1)
+
+    def on_lower(self, event):
+        job = self.selected_job()
+        if job:
+            self.manager.set_priority(job.id, job.priority - 1)
+
+    def on_clear(self, event):
+        self.manager.remove_finished()
+        self.job_list.DeleteAllItems()
+        self.row_ids = []
+        self.row_index = {}
+        for job in self.manager.jobs():
+            self.update_row(job)
+        self.update_summary()
+
+    def detach(self):
+        self.manager.remove_listener(self.on_job_changed)
+
+class StatsPanel(wx.Panel):
+    """
+    Shows the timing spans and counters collected by modules.metrics.
+    Refreshes itself every few seconds while the tab is on screen.
+    """
+    REFRESH_MS = 2000
+
+    def __init__(self, parent, frame):
+        super().__init__(parent)
+        self.frame = frame
+        self.notebook = parent
+        self.metrics = metrics.get_metrics()
+
+        vbox = wx.BoxSizer(wx.VERTICAL)
+
+        self.span_list = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for col, (label, width) in enumerate([("Span", 220), ("Count", 70), ("Mean ms", 90), ("Max ms", 90),
+                                              ("Total ms", 100), ("Errors", 70)]):
+            self.span_list.InsertColumn(col, label, width=width)
+        frame.set_accessible_name(self.span_list, "Timed spans")
+        vbox.Add(self.span_list, 2, wx.EXPAND | wx.ALL, 5)
+
+        self.counter_list = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        self.counter_list.InsertColumn(0, "Counter", width=220)
+        self.counter_list.InsertColumn(1, "Value", width=160)
+        frame.set_accessible_name(self.counter_list, "Counters")
+        vbox.Add(self.counter_list, 1, wx.EXPAND | wx.ALL, 5)
+
+        self.throughput_label = wx.StaticText(self, label="")
+        self._throughput_pending = False
+        frame.set_accessible_name(self.throughput_label, "Network speed and format choice")
+        vbox.Add(self.throughput_label, 0, wx.EXPAND | wx.ALL, 5)
+
+        hbox = wx.BoxSizer(wx.HORIZONTAL)
+        self.enabled = wx.CheckBox(self, label="Record metrics")
+        self.enabled.SetValue(self.metrics.enabled)
+        self.enabled.Bind(wx.EVT_CHECKBOX, self.on_enabled)
+        hbox.Add(self.enabled, 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        for label, handler in [("Refresh", lambda e: self.refresh()), ("Reset", self.on_reset)]:
+            button = wx.Button(self, label=label)
+            button.Bind(wx.EVT_BUTTON, handler)
+            frame.set_accessible_name(button, label)
+            hbox.Add(button, 0, wx.ALL, 5)
+        vbox.Add(hbox, 0, wx.EXPAND)
+
+        self.SetSizer(vbox)
+
+        # Runs only while the tab is on screen
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, lambda e: self.refresh(), self.timer)
+        self.notebook.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.on_page_changed)
+
+    def on_page_changed(self, event):
+        event.Skip()
+        if self.notebook.GetCurrentPage() is self:
+            self.refresh()
+            self.timer.Start(self.REFRESH_MS)
+        else:
+            self.timer.Stop()
+
+    def refresh(self):
+        snapshot = self.metrics.snapshot()
+        self.span_list.DeleteAllItems()
+        for name, span in sorted(snapshot['spans'].items()):
+            row = self.span_list.InsertItem(self.span_list.GetItemCount(), name)
+            for col, key in enumerate(('count', 'mean_ms', 'max_ms', 'total_ms', 'errors'), start=1):
+                self.span_list.SetItem(row, col, str(span[key]))
+        self.counter_list.DeleteAllItems()
+        for name, value in sorted(snapshot['counters'].items()):
+            row = self.counter_list.InsertItem(self.counter_list.GetItemCount(), name)
+            self.counter_list.SetItem(row, 1, str(value))
+        # The service may take a while to answer; ask from a worker thread
+        if not self._throughput_pending:
+            self._throughput_pending = True
+            threading.Thread(target=self.load_throughput, daemon=True).start()
+
+    def load_throughput(self):
+        # Worker thread
+        try:
+            text = self.throughput_text()
+        except Exception as e:
+            text = f"Network speed unavailable: {e}"
+        wx.CallAfter(self.show_throughput, text)
+
+    def show_throughput(self, text):
+        if not self:
+            return
+        self._throughput_pending = False
+        self.throughput_label.SetLabel(text)
+
+    def throughput_text(self):
+        # Downloads run in the service while there is one, and so do its decisions
+        snapshot = call_or_local('throughput', lambda: get_format_policy().snapshot())
+        network = snapshot['network']
+        samples = snapshot['networks'].get(network, {}).get('samples', [])
+        if snapshot['estimate'] is None:
+            text = f"Network {network}: not measured yet, best formats are used"
+        else:
+            text = f"Network {network}: about {format_bytes(snapshot['estimate'])}/s from {len(samples)} transfers"
+        if snapshot['decisions']:
+            last = snapshot['decisions'][-1]
+            text += f"\nLast {last['kind']} format: {last['reason']} ({last['format']})"
+        return text
+
+    def on_enabled(self, event):
+        self.metrics.set_enabled(self.enabled.GetValue())
+        set_setting('metrics_enabled', self.enabled.GetValue())
+
+    def on_reset(self, event):
+        self.metrics.reset()
+        self.refresh()
 
 class LinkDetectedDialog(wx.Dialog):
-    def __init__(self, parent, url):
-        super().__init__(parent, title="Link Detected", size=(500, 200))
+    # Links listed in the dialog; the rest are summarized
+    MAX_LISTED = 5
+
+    def __init__(self, parent, links):
+        super().__init__(parent, title="Link Detected", size=(500, 200 + 15 * min(len(links) - 1, self.MAX_LISTED)))
         
         panel = wx.Panel(self)
         vbox = wx.BoxSizer(wx.VERTICAL)
         
-        label = wx.StaticText(panel, label=f"We detected a video link in your clipboard:\n\n{url}")
+        if len(links) == 1:
+            text = f"We detected a video link in your clipboard:\n\n{links[0]}"
+        else:
+            text = f"We detected {len(links)} links in your clipboard:\n\n" + "\n".join(links[:self.MAX_LISTED])
+            if len(links) > self.MAX_LISTED:
+                text += f"\n... and {len(links) - self.MAX_LISTED} more"
+        label = wx.StaticText(panel, label=text)
         label.Wrap(450)
+
+        # Off by default: a video copied from a playlist is usually wanted on its own
+        self.playlist_check = None
+        if any(playlist_url_of(url) for url in links):
+            self.playlist_check = wx.CheckBox(panel, label="Download the whole playlist")
         
         hbox = wx.BoxSizer(wx.HORIZONTAL)
         
-        play_btn = wx.Button(panel, label="Play")
+        play_btn = wx.Button(panel, label="Play" if len(links) == 1 else "Play first")
         play_btn.Bind(wx.EVT_BUTTON, lambda e: self.EndModal(wx.ID_YES))
         
-        download_btn = wx.Button(panel, label="Download")
+        download_btn = wx.Button(panel, label="Download" if len(links) == 1 else "Download all")
         download_btn.Bind(wx.EVT_BUTTON, lambda e: self.EndModal(wx.ID_SAVE))
         
         cancel_btn = wx.Button(panel, label="Cancel")
@@ -399,6 +1123,8 @@ class LinkDetectedDialog(wx.Dialog):
         hbox.Add(cancel_btn, 1, wx.ALL | wx.EXPAND, 5)
         
         vbox.Add(label, 1, wx.ALL | wx.EXPAND, 15)
+        if self.playlist_check:
+            vbox.Add(self.playlist_check, 0, wx.LEFT | wx.RIGHT, 15)
         vbox.Add(hbox, 0, wx.ALL | wx.EXPAND, 10)
         
         panel.SetSizer(vbox)
@@ -409,8 +1135,17 @@ class LinkDetectedDialog(wx.Dialog):
         parent.set_accessible_name(download_btn, "Download video from clipboard")
         parent.set_accessible_name(cancel_btn, "Cancel and return to main interface")
 
-def start_gui():
+    def whole_playlists(self):
+        return bool(self.playlist_check and self.playlist_check.GetValue())
+
+def start_gui(on_ready=None):
+    """
+    Creates the main window and runs the event loop.
+    on_ready() is called once the window has been shown.
+    """
     app = wx.App()
     frame = TeTubeFrame()
     frame.Show()
+    if on_ready:
+        wx.CallAfter(on_ready)
     app.MainLoop()
@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+
+class Journal:
+    """
+    Append-only file of JSON records kept next to a snapshot file. Small
+    frequent updates (download progress) are appended here instead of
+    rewriting the snapshot; whoever writes a new snapshot calls clear(),
+    since the snapshot then contains everything the journal said.
+
+    Each record is one line, flushed as it is written, so the records of
+    a process that crashed are still on disk. A line cut short by the
+    crash is skipped by replay().
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, record):
+        line = json.dumps(record, separators=(',', ':')) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(line)
+                self._file.flush()
+            except OSError as e:
+                print(f"Error writing journal {self.path}: {e}")
+
+    def replay(self):
+        """
+        Returns every complete record in the order written.
+        """
+        records = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error reading journal {self.path}: {e}")
+        return records
+
+    def clear(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error clearing journal {self.path}: {e}")
@@ -0,0 +1,176 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from modules.models import VideoResult
+from modules.settings import data_path
+
+LIBRARY_FILE = "library.db"
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Keeps the full-text index in step with the library table
+FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE library_fts USING fts5("
+    " title, uploader, video_id, fmt,"
+    " content='library', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER library_fts_insert AFTER INSERT ON library BEGIN"
+    " INSERT INTO library_fts(rowid, title, uploader, video_id, fmt)"
+    " VALUES (new.rowid, new.title, new.uploader, new.video_id, new.fmt); END",
+    "CREATE TRIGGER library_fts_delete AFTER DELETE ON library BEGIN"
+    " INSERT INTO library_fts(library_fts, rowid, title, uploader, video_id, fmt)"
+    " VALUES ('delete', old.rowid, old.title, old.uploader, old.video_id, old.fmt); END",
+    "INSERT INTO library_fts(library_fts) VALUES ('rebuild')",
+]
+
+def fts_query(text):
+    """
+    Turns free text into an FTS5 query matching every word as a prefix.
+    """
+    return " ".join(f'"{token}"*' for token in TOKEN_RE.findall(text))
+
+class Library:
+    """
+    Persistent index of finished downloads keyed by (video id, format).
+    The whole index is mirrored in a dict, so have() answers without
+    touching SQLite; a single stat() confirms the file is still there and
+    entries whose file was deleted are dropped on the spot. An FTS5 index
+    over title, uploader, id and format serves search().
+    """
+    def __init__(self, path=None):
+        self.path = path or data_path(LIBRARY_FILE)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS library ("
+            " video_id TEXT NOT NULL,"
+            " fmt TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " title TEXT,"
+            " uploader TEXT,"
+            " duration TEXT,"
+            " size INTEGER,"
+            " added REAL NOT NULL,"
+            " PRIMARY KEY (video_id, fmt))"
+        )
+        self.fts = self._create_fts()
+        self._db.commit()
+        self._paths = {
+            (video_id, fmt): path
+            for video_id, fmt, path in self._db.execute("SELECT video_id, fmt, path FROM library")
+        }
+
+    def _create_fts(self):
+        exists = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'library_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            for statement in FTS_SCHEMA:
+                self._db.execute(statement)
+            return True
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5: search() falls back to LIKE
+            print(f"Full-text library search not available: {e}")
+            self._db.rollback()
+            return False
+
+    def have(self, video_id, fmt):
+        """
+        Returns the path of an existing download of `video_id` in `fmt`, or None.
+        """
+        key = (video_id, fmt)
+        path = self._paths.get(key)
+        if path is None:
+            return None
+        if os.path.exists(path):
+            return path
+        self.remove(video_id, fmt)
+        return None
+
+    def add(self, video_id, fmt, path, title=None, uploader=None, duration=None):
+        if not video_id or not path:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        with self._lock:
+            # Delete + insert rather than REPLACE so the FTS triggers see both
+            self._db.execute("DELETE FROM library WHERE video_id = ? AND fmt = ?", (video_id, fmt))
+            self._db.execute(
+                "INSERT INTO library (video_id, fmt, path, title, uploader, duration, size, added)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, fmt, path, title, uploader, duration, size, time.time())
+            )
+            self._db.commit()
+            self._paths[(video_id, fmt)] = path
+
+    def remove(self, video_id, fmt):
+        with self._lock:
+            self._db.execute("DELETE FROM library WHERE video_id = ? AND fmt = ?", (video_id, fmt))
+            self._db.commit()
+            self._paths.pop((video_id, fmt), None)
+
+    def search(self, text, limit=20):
+        """
+        Returns downloaded videos matching `text` as VideoResults with
+        `path` set, best match first, one per video.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        with self._lock:
+            if self.fts:
+                rows = self._db.execute(
+                    "SELECT l.video_id, l.fmt, l.path, l.title, l.uploader, l.duration"
+                    " FROM library_fts JOIN library l ON l.rowid = library_fts.rowid"
+                    " WHERE library_fts MATCH ? ORDER BY bm25(library_fts) LIMIT ?",
+                    (query, limit * 2)
+                ).fetchall()
+            else:
+                pattern = f"%{text.strip()}%"
+                rows = self._db.execute(
+                    "SELECT video_id, fmt, path, title, uploader, duration FROM library"
+                    " WHERE title LIKE ? OR uploader LIKE ? ORDER BY added DESC LIMIT ?",
+                    (pattern, pattern, limit * 2)
+                ).fetchall()
+
+        results = []
+        seen = set()
+        for video_id, fmt, path, title, uploader, duration in rows:
+            if video_id in seen or not os.path.exists(path):
+                continue
+            seen.add(video_id)
+            results.append(VideoResult(video_id, title or video_id, f"https://www.youtube.com/watch?v={video_id}",
+                                       duration or 'N/A', uploader or 'Unknown', path=path))
+            if len(results) >= limit:
+                break
+        return results
+
+    def entries(self):
+        """
+        Returns every entry as a dict, newest first.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT video_id, fmt, path, title, uploader, duration, size, added FROM library ORDER BY added DESC"
+            )
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+_library = None
+_library_lock = threading.Lock()
+
+def get_library():
+    """
+    Returns the shared Library, creating it on first use.
+    """
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = Library()
+        return _library
@@ -0,0 +1,208 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from modules.settings import data_path, get_setting
+
+METRICS_FILE = "metrics.jsonl"
+
+class _NullSpan:
+    """
+    Returned by span() while metrics are disabled: entering, leaving and
+    setting attributes cost a method call and nothing else.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    """
+    Times a `with` block and records it on exit. Attributes given to
+    set() (bytes, result counts, ...) are written along with the duration.
+    """
+    __slots__ = ('metrics', 'name', 'attrs', 'started')
+
+    def __init__(self, metrics, name, attrs):
+        self.metrics = metrics
+        self.name = name
+        self.attrs = attrs
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.metrics.record(self.name, (time.perf_counter() - self.started) * 1000, **self.attrs)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+class Metrics:
+    """
+    Collects timed spans and counters. Totals are kept in memory for the
+    statistics panel; every span and error is also appended as one JSON line
+    to data/metrics.jsonl, which rotates at 'metrics_file_bytes'. Lines are
+    handed to a background writer, so recording never waits for the disk.
+    """
+    def __init__(self, enabled=None, path=None):
+        self.enabled = get_setting('metrics_enabled') if enabled is None else enabled
+        self.path = path
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._logger = None
+        self._logger_lock = threading.Lock()
+        self._listener = None
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    def record(self, name, duration_ms, **attrs):
+        """
+        Records a span measured elsewhere, e.g. across threads.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            totals = self._spans.get(name)
+            if totals is None:
+                totals = self._spans[name] = [0, 0.0, 0.0, 0]
+            totals[0] += 1
+            totals[1] += duration_ms
+            totals[2] = max(totals[2], duration_ms)
+            if 'error' in attrs:
+                totals[3] += 1
+        attrs.update(type='span', name=name, ms=round(duration_ms, 2))
+        self._write(attrs)
+
+    def count(self, name, value=1):
+        """
+        Adds `value` to a counter. Counters are kept in memory only, so
+        they are cheap enough for per-chunk totals such as bytes.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def error(self, name, error):
+        """
+        Counts a failure and writes it to the metrics file.
+        """
+        if not self.enabled:
+            return
+        self.count(name + ".errors")
+        self._write({'type': 'error', 'name': name, 'message': str(error)})
+
+    def snapshot(self):
+        """
+        Returns {'spans': {name: {count, total_ms, mean_ms, max_ms, errors}},
+        'counters': {name: value}}.
+        """
+        with self._lock:
+            spans = {
+                name: {
+                    'count': count,
+                    'total_ms': round(total, 1),
+                    'mean_ms': round(total / count, 1),
+                    'max_ms': round(worst, 1),
+                    'errors': errors,
+                }
+                for name, (count, total, worst, errors) in self._spans.items()
+            }
+            return {'spans': spans, 'counters': dict(self._counters)}
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def _write(self, entry):
+        entry['time'] = round(time.time(), 3)
+        try:
+            logger = self._logger or self._open_logger()
+            logger.info(json.dumps(entry))
+        except Exception as e:
+            print(f"Error writing metrics: {e}")
+            self.enabled = False
+
+    def _open_logger(self):
+        # Several threads may record their first span at once
+        with self._logger_lock:
+            if self._logger is not None:
+                return self._logger
+            handler = RotatingFileHandler(self.path or data_path(METRICS_FILE), encoding='utf-8',
+                                          maxBytes=get_setting('metrics_file_bytes'),
+                                          backupCount=get_setting('metrics_file_backups'))
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            lines = queue.SimpleQueue()
+            self._listener = QueueListener(lines, handler)
+            self._listener.start()
+            atexit.register(self.close)
+            logger = logging.getLogger(f"te_tube.metrics.{id(self)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(QueueHandler(lines))
+            self._logger = logger
+            return logger
+
+    def close(self):
+        """
+        Writes out the lines still queued and stops the background writer.
+        """
+        with self._logger_lock:
+            listener, self._listener = self._listener, None
+            if self._logger is not None:
+                for handler in list(self._logger.handlers):
+                    self._logger.removeHandler(handler)
+                self._logger = None
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
+
+def span(name, **attrs):
+    """
+    with span('search', query=q) as s: ...; s.set(results=n)
+    """
+    return get_metrics().span(name, **attrs)
+
+def record(name, duration_ms, **attrs):
+    get_metrics().record(name, duration_ms, **attrs)
+
+def count(name, value=1):
+    get_metrics().count(name, value)
+
+def error(name, exc):
+    get_metrics().error(name, exc)
@@ -0,0 +1,77 @@
+import re
+
+# Matches watch/embed/shorts/youtu.be style links and captures the 11 character id
+VIDEO_ID_RE = re.compile(
+    r'(?:https?://)?(?:www\.|m\.|music\.)?(?:youtube\.com|youtu\.be)/'
+    r'(?:watch\?(?:[^#\s]*?&)?v=|embed/|v/|shorts/|live/)?([a-zA-Z0-9_-]{11})'
+)
+
+class VideoResult:
+    """
+    Compact record for a single video, shared by search, player and downloader.
+    Uses __slots__ so that thousands of results keep a flat memory footprint.
+    `path` is set for videos already downloaded (see library.py) and
+    `details` once the full metadata has been fetched (see enrichment.py).
+    """
+    __slots__ = ('id', 'title', 'url', 'duration', 'uploader', 'path', 'details')
+
+    def __init__(self, id, title, url, duration='N/A', uploader='Unknown', path=None, details=None):
+        self.id = id
+        self.title = title
+        self.url = url
+        self.duration = duration
+        self.uploader = uploader
+        self.path = path
+        self.details = details
+
+    @classmethod
+    def from_info(cls, data):
+        """
+        Builds a record from a yt-dlp info dict (flat or full).
+        """
+        return cls(
+            data.get('id'),
+            data.get('title', 'Unknown Title'),
+            data.get('url') or f"https://www.youtube.com/watch?v={data.get('id')}",
+            data.get('duration_string', 'N/A'),
+            data.get('uploader', 'Unknown')
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('id'), data.get('title'), data.get('url'), data.get('duration'), data.get('uploader'))
+
+    def to_dict(self):
+        return {
+            'title': self.title,
+            'url': self.url,
+            'duration': self.duration,
+            'uploader': self.uploader,
+            'id': self.id
+        }
+
+    @property
+    def display_text(self):
+        return f"{self.title} [{self.duration}] - {self.uploader}"
+
+    def __repr__(self):
+        return f"VideoResult(id={self.id!r}, title={self.title!r})"
+
+def media_url(target):
+    """
+    Returns the URL for either a VideoResult or a plain URL string.
+    """
+    if isinstance(target, VideoResult):
+        return target.url
+    return target
+
+def video_id_of(target):
+    """
+    Returns the YouTube video id of a VideoResult or URL, or None if unknown.
+    """
+    if isinstance(target, VideoResult):
+        if target.id:
+            return target.id
+        target = target.url
+    match = VIDEO_ID_RE.search(target or "")
+    return match.group(1) if match else None
@@ -1,31 +1,220 @@
+import json
+import re
 import subprocess
 import os
+import threading
+import time
+from modules import metrics
+from modules.models import media_url
+from modules.settings import DEFAULTS, data_path, get_setting
+from modules.stream_resolver import get_stream_resolver
+from modules.throughput import get_estimator, get_format_policy
+from modules.ytdlp_engine import NO_WINDOW, SubprocessEngine
 
 FFPLAY_PATH = os.path.join(os.getcwd(), "lib", "ffplay.exe")
-YTDLP_PATH = os.path.join(os.getcwd(), "lib", "yt-dlp.exe")
+TIMINGS_FILE = "playback_timings.jsonl"
 
-def play_video(url):
+# 'resolve': resolve the stream URL, then let ffplay open it (the original way)
+# 'pipe': stream yt-dlp's output straight into ffplay's stdin
+# 'audio': resolve bestaudio and play it without a video window
+PLAYBACK_MODES = ('resolve', 'pipe', 'audio')
+
+# Keep ffplay's stream probing short so the first frame shows up sooner
+FAST_PROBE_ARGS = ["-probesize", "65536", "-analyzeduration", "500000"]
+
+# ffplay's status line (M-V: video, M-A: audio only, A-V: both) appears once playback runs
+FIRST_FRAME_RE = re.compile(rb'(?:M-V|M-A|A-V):')
+
+# Piped playback reports one throughput sample after this many seconds
+PIPE_SAMPLE_SECONDS = 10.0
+# ...if it spent at least this share of them waiting for the network; a
+# link that easily keeps up with playback gives no useful number
+PIPE_MIN_WAIT_SHARE = 0.2
+
+def playback_mode():
+    """
+    The 'playback_mode' setting, or the default one when settings.json
+    holds a value this version doesn't know.
+    """
+    mode = get_setting('playback_mode')
+    return mode if mode in PLAYBACK_MODES else DEFAULTS['playback_mode']
+
+def stream_format(mode, record=True):
+    """
+    Returns the format spec the 'resolve' and 'audio' modes resolve.
     """
-    Plays a YouTube video URL using ffplay and yt-dlp.
+    return "bestaudio" if mode == 'audio' else get_format_policy().playback_format(record=record)
+
+def prefetch_stream(target, mode=None):
+    """
+    Resolves `target` in the background the way play_video() will, so
+    playing it is then served from the resolver cache. Pipe mode has no
+    resolve step and a downloaded row plays from disk, so neither is
+    prefetched. The format is worked out on the prefetch thread, since
+    the throughput policy may have to look up the network.
+    """
+    mode = mode or playback_mode()
+    if mode == 'pipe' or getattr(target, 'path', None):
+        return
+    get_stream_resolver().prefetch(target, lambda: stream_format(mode, record=False))
+
+def play_video(target, mode=None):
     """
-    # Use yt-dlp to get the stream URL and pipe it to ffplay
-    # Actually, ffplay can take the stream URL directly if we get it from ytdlp
-    # Or we can just let ffplay handle it if it has gnutls/openssl, 
-    # but the usual way with ytdlp is to get the best format URL.
-    
-    # Simpler: yt-dlp -g <url> gets the stream URL
+    Plays a YouTube video using ffplay and yt-dlp.
+    target: a URL string or a VideoResult.
+    mode: one of PLAYBACK_MODES, defaults to the 'playback_mode' setting.
+    A VideoResult from the library (with `path` set) plays from disk.
+    """
+    mode = mode or playback_mode()
+    started = time.perf_counter()
     try:
-        cmd_get_url = [YTDLP_PATH, "-g", "-f", "best", url]
-        stream_url = subprocess.check_output(cmd_get_url, text=True, encoding='utf-8', errors='replace', creationflags=subprocess.CREATE_NO_WINDOW).strip()
-        
-        # Now play with ffplay
-        # -nodisp if we wanted audio only, but ffplay by default shows video if available.
-        # User said "play", so we use ffplay.
-        subprocess.Popen([FFPLAY_PATH, "-autoexit", stream_url], creationflags=subprocess.CREATE_NO_WINDOW)
+        ffplay_args = [FFPLAY_PATH, "-autoexit", "-hide_banner"]
+        if get_setting('fast_probe'):
+            ffplay_args += FAST_PROBE_ARGS
+
+        local_path = getattr(target, 'path', None)
+        if local_path and os.path.exists(local_path):
+            # Already downloaded: no yt-dlp and no network at all
+            if mode == 'audio':
+                ffplay_args.append("-nodisp")
+            process = subprocess.Popen(ffplay_args + [local_path], stderr=subprocess.PIPE, creationflags=NO_WINDOW)
+            mode = 'local'
+            resolved = started
+        elif mode == 'pipe':
+            # yt-dlp writes the media to stdout and ffplay reads it from stdin,
+            # so there is no separate resolve step and no second HTTP connection
+            format_spec = get_format_policy().playback_format()
+            source = subprocess.Popen(
+                SubprocessEngine().base_command() + ["-o", "-", "-f", format_spec, "--quiet", media_url(target)],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, creationflags=NO_WINDOW
+            )
+            process = subprocess.Popen(ffplay_args + ["-i", "-"], stdin=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, creationflags=NO_WINDOW)
+            threading.Thread(target=_pump, args=(source, process), daemon=True).start()
+            resolved = started
+        else:
+            # Served from the resolver cache when the row was prefetched
+            format_spec = stream_format(mode)
+            stream_url = get_stream_resolver().resolve(target, format_spec)
+            resolved = time.perf_counter()
+            metrics.record('playback.resolve', (resolved - started) * 1000, mode=mode)
+            if mode == 'audio':
+                ffplay_args.append("-nodisp")
+            process = subprocess.Popen(ffplay_args + [stream_url], stderr=subprocess.PIPE, creationflags=NO_WINDOW)
+
+        threading.Thread(target=_watch_first_frame, args=(process, mode, started, resolved), daemon=True).start()
+        return process
     except Exception as e:
         print(f"Error playing video: {e}")
+        metrics.error('playback', e)
+
+def _pump(source, process):
+    """
+    Copies yt-dlp's output into ffplay and measures the network on the way.
+    Once ffplay's buffer is full the copy runs at playback speed, so only
+    the time spent waiting for yt-dlp counts: it approaches the link speed
+    when the link is the bottleneck.
+    """
+    def record():
+        elapsed = time.perf_counter() - first_byte
+        if elapsed > 0 and waited >= elapsed * PIPE_MIN_WAIT_SHARE:
+            get_estimator().record(copied, waited, 'playback')
+
+    waited = 0.0
+    copied = 0
+    first_byte = None
+    sampled = False
+    try:
+        while True:
+            before = time.perf_counter()
+            chunk = source.stdout.read1(65536)
+            if not chunk:
+                break
+            if first_byte is None:
+                # Everything before the first byte is extraction, not transfer
+                first_byte = time.perf_counter()
+            else:
+                waited += time.perf_counter() - before
+            copied += len(chunk)
+            process.stdin.write(chunk)
+            if not sampled and time.perf_counter() - first_byte >= PIPE_SAMPLE_SECONDS:
+                sampled = True
+                record()
+    except OSError:
+        # ffplay was closed
+        pass
+    finally:
+        if not sampled and first_byte is not None:
+            record()
+        for stream in (process.stdin, source.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        if source.poll() is None:
+            source.kill()
+
+def _watch_first_frame(process, mode, started, resolved):
+    """
+    Reads ffplay's stderr until the first status line and records the time
+    from play_video() being called to playback starting. Keeps draining
+    stderr afterwards so ffplay never blocks on a full pipe.
+    """
+    buffer = b""
+    first_frame = None
+    while True:
+        chunk = process.stderr.read1(4096)
+        if not chunk:
+            break
+        if first_frame is None:
+            buffer = (buffer + chunk)[-256:]
+            if FIRST_FRAME_RE.search(buffer):
+                first_frame = time.perf_counter()
+                record_timing(mode, (resolved - started) * 1000, (first_frame - started) * 1000)
+                buffer = b""
+
+def record_timing(mode, resolve_ms, first_frame_ms):
+    metrics.record('playback.first_frame', first_frame_ms, mode=mode)
+    entry = {
+        'time': time.time(),
+        'mode': mode,
+        'resolve_ms': round(resolve_ms, 1),
+        'first_frame_ms': round(first_frame_ms, 1),
+    }
+    try:
+        with open(data_path(TIMINGS_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+    except Exception as e:
+        print(f"Error recording playback timing: {e}")
+
+def playback_stats():
+    """
+    Summarises recorded click-to-first-frame times per playback mode:
+    {mode: {'count', 'median_ms', 'mean_ms'}}
+    """
+    per_mode = {}
+    try:
+        with open(data_path(TIMINGS_FILE), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                per_mode.setdefault(entry['mode'], []).append(entry['first_frame_ms'])
+    except FileNotFoundError:
+        return {}
+
+    stats = {}
+    for mode, values in per_mode.items():
+        values.sort()
+        stats[mode] = {
+            'count': len(values),
+            'median_ms': values[len(values) // 2],
+            'mean_ms': round(sum(values) / len(values), 1),
+        }
+    return stats
 
 if __name__ == "__main__":
     # Test play (requires a valid URL)
     # play_video("https://www.youtube.com/watch?v=aqvZeN-r_t4")
-    pass
+    print(playback_stats())
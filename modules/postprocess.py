@@ -0,0 +1,281 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from modules import metrics
+from modules.settings import get_setting
+from modules.ytdlp_engine import NO_WINDOW
+
+FFMPEG_PATH = os.path.join(os.getcwd(), "lib", "ffmpeg.exe")
+FFPROBE_PATH = os.path.join(os.getcwd(), "lib", "ffprobe.exe")
+
+# ffmpeg output options per target format
+AUDIO_FORMATS = {
+    'mp3': ["-vn", "-c:a", "libmp3lame", "-q:a", "0"],
+    'wav': ["-vn", "-c:a", "pcm_s16le"],
+}
+
+def conversion_target(source, fmt):
+    return os.path.splitext(source)[0] + "." + fmt
+
+class ConversionJob:
+    def __init__(self, source, fmt, on_update=None):
+        self.source = source
+        self.fmt = fmt
+        self.target = conversion_target(source, fmt)
+        # Everyone waiting for this conversion, see PostProcessor.submit
+        self.listeners = [on_update] if on_update else []
+        self.status = 'queued'
+        self.percent = 0.0
+        self.error = None
+        self.done = threading.Event()
+        self.cancelled = threading.Event()
+        self.process = None
+        self.queued_at = time.perf_counter()
+
+    def update(self):
+        for listener in list(self.listeners):
+            try:
+                listener(self)
+            except Exception as e:
+                print(f"Error in conversion listener: {e}")
+
+def probe_duration(path):
+    """
+    Returns the media duration in seconds, or None if ffprobe can't tell.
+    """
+    try:
+        output = subprocess.check_output(
+            [FFPROBE_PATH, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            text=True, encoding='utf-8', errors='replace', creationflags=NO_WINDOW
+        )
+        return float(output.strip())
+    except Exception:
+        return None
+
+class PostProcessor:
+    """
+    Converts finished downloads on its own queue, so a download slot is
+    free again as soon as the raw file is on disk. Each worker drives one
+    ffmpeg process; the pool is sized to the CPU cores by default.
+    Callers converting to the same target share one conversion.
+
+    A converted source is removed, unless it was claimed: a raw download
+    shared by conversions to several formats stays until every claimant
+    has called release().
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or get_setting('postprocess_workers') or os.cpu_count() or 2
+        self._queue = queue.Queue()
+        self._threads = []
+        # Queued and running conversions by target path
+        self._active = {}
+        # Claimed sources by path: releases still to come
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def submit(self, source, fmt, on_update=None):
+        """
+        Queues `source` for conversion to `fmt` and returns the ConversionJob.
+        on_update(job) is called from a worker thread on every change.
+
+        A conversion to the same target that is still queued or running is
+        joined instead: on_update becomes one more of its listeners. If the
+        source is gone because its conversion already finished, a finished
+        job for the existing target is returned.
+        """
+        self._ensure_workers()
+        target = conversion_target(source, fmt)
+        with self._lock:
+            job = self._active.get(target)
+            if job is not None and not job.cancelled.is_set():
+                if on_update:
+                    job.listeners.append(on_update)
+                metrics.count('convert.coalesced')
+                return job
+            converted = not os.path.exists(source) and os.path.exists(target)
+            job = ConversionJob(source, fmt, on_update)
+            if not converted:
+                self._active[target] = job
+        if converted:
+            job.percent = 100.0
+            job.status = 'finished'
+            job.done.set()
+            job.update()
+            return job
+        self._queue.put(job)
+        return job
+
+    def claim(self, source, count):
+        """
+        Keeps `source` on disk until `count` release() calls have been made.
+        """
+        with self._lock:
+            self._claims[source] = self._claims.get(source, 0) + count
+
+    def release(self, source):
+        """
+        Called by a claimant once its conversion of `source` has finished;
+        the last one removes the file. Unclaimed sources are left alone.
+        """
+        with self._lock:
+            left = self._claims.get(source)
+            if left is None:
+                return
+            if left > 1:
+                self._claims[source] = left - 1
+                return
+            del self._claims[source]
+        self._remove_source(source)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def cancel(self, job, on_update=None):
+        """
+        Withdraws the listener `on_update` from `job`. Once no listener is
+        left, or straight away when on_update is None, the job stops: a
+        queued one never starts, a running one has its ffmpeg killed and
+        the half-written target removed. The source file is kept, so the
+        conversion can be run again later.
+        """
+        with self._lock:
+            if on_update in job.listeners:
+                job.listeners.remove(on_update)
+            if on_update is not None and job.listeners:
+                return
+            job.cancelled.set()
+        self._kill(job)
+
+    def _kill(self, job):
+        process = job.process
+        if process is not None and process.poll() is None:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._convert(job)
+            finally:
+                job.done.set()
+                self._queue.task_done()
+
+    def _settle(self, job, status):
+        # Leaving _active under the lock means submit() either joined
+        # before the final update below or starts a job of its own
+        with self._lock:
+            job.status = status
+            if self._active.get(job.target) is job:
+                del self._active[job.target]
+        job.update()
+
+    def _convert(self, job):
+        if job.cancelled.is_set():
+            self._settle(job, 'cancelled')
+            return
+        if os.path.abspath(job.source) == os.path.abspath(job.target):
+            job.percent = 100.0
+            self._settle(job, 'finished')
+            return
+
+        job.status = 'converting'
+        job.update()
+        metrics.record('convert.queue_wait', (time.perf_counter() - job.queued_at) * 1000)
+        started = time.perf_counter()
+
+        with metrics.span('convert.probe'):
+            duration = probe_duration(job.source)
+        cmd = [FFMPEG_PATH, "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+               "-i", job.source] + AUDIO_FORMATS[job.fmt] + ["-progress", "pipe:1", "-nostats", job.target]
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                creationflags=NO_WINDOW
+            )
+            job.process = process
+            # cancel() may have run before the process was known
+            if job.cancelled.is_set():
+                self._kill(job)
+            # -progress writes key=value blocks; out_time_us is the position reached
+            for line in process.stdout:
+                if duration and line.startswith("out_time_us="):
+                    try:
+                        position = int(line.split("=", 1)[1]) / 1000000.0
+                    except ValueError:
+                        continue
+                    job.percent = min(position * 100.0 / duration, 99.9)
+                    job.update()
+            stderr = process.stderr.read()
+            process.wait()
+            if job.cancelled.is_set():
+                self._discard(job)
+                return
+            if process.returncode != 0:
+                raise Exception(f"ffmpeg exited with code {process.returncode}: {stderr.strip()}")
+        except Exception as e:
+            print(f"Error converting {job.source}: {e}")
+            job.error = str(e)
+            metrics.error('convert', e)
+            self._settle(job, 'error')
+            return
+
+        job.percent = 100.0
+        metrics.record('convert', (time.perf_counter() - started) * 1000, format=job.fmt)
+        with self._lock:
+            claimed = job.source in self._claims
+        if not claimed:
+            self._remove_source(job.source)
+        self._settle(job, 'finished')
+
+    def _remove_source(self, source):
+        # The target is written; a source we can't remove doesn't undo that
+        try:
+            os.remove(source)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing {source} after conversion: {e}")
+
+    def _discard(self, job):
+        with self._lock:
+            # A conversion submitted after the cancel may be writing it again
+            replaced = self._active.get(job.target) not in (None, job)
+        try:
+            if not replaced:
+                os.remove(job.target)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing partial conversion {job.target}: {e}")
+        metrics.count('convert.cancelled')
+        self._settle(job, 'cancelled')
+
+_postprocessor = None
+_postprocessor_lock = threading.Lock()
+
+def get_postprocessor():
+    global _postprocessor
+    with _postprocessor_lock:
+        if _postprocessor is None:
+            _postprocessor = PostProcessor()
+        return _postprocessor
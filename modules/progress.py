@@ -0,0 +1,45 @@
+import threading
+import time
+
+class ProgressThrottle:
+    """
+    Wraps a progress callback so it is called at most `max_rate` times
+    per second. Updates in between are coalesced: only the newest one is
+    kept, and it is delivered by the next allowed call or by flush().
+    Anything that isn't a 'downloading' tick is passed through at once.
+    """
+    def __init__(self, callback, max_rate=4):
+        self.callback = callback
+        self.interval = 1.0 / max_rate if max_rate else 0
+        self._last = 0.0
+        self._pending = None
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.dropped = 0
+
+    def __call__(self, data):
+        final = data.get('status') != 'downloading' or data.get('percent', 0) >= 100
+        now = time.monotonic()
+        with self._lock:
+            if not final and now - self._last < self.interval:
+                if self._pending is not None:
+                    self.dropped += 1
+                self._pending = data
+                return
+            self._pending = None
+            self._last = now
+            self.delivered += 1
+        self.callback(data)
+
+    def flush(self):
+        """
+        Delivers the last coalesced update, if any.
+        """
+        with self._lock:
+            data = self._pending
+            self._pending = None
+            if data is None:
+                return
+            self._last = time.monotonic()
+            self.delivered += 1
+        self.callback(data)
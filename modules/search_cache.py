@@ -0,0 +1,188 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from modules.settings import data_path, get_setting
+
+CACHE_FILE = "search_cache.db"
+
+WORD_RE = re.compile(r'\w+')
+
+def normalize_query(query):
+    """
+    Normalizes a search query so that case and extra whitespace
+    don't produce separate cache entries.
+    """
+    return " ".join(query.lower().split())
+
+class SearchCache:
+    """
+    Two-tier cache for search results: an in-memory LRU in front of
+    an SQLite store that survives restarts. Entries expire after `ttl`
+    seconds and both tiers are capped by entry count.
+    """
+    def __init__(self, path=None, ttl=None, memory_entries=None, disk_entries=None):
+        self.path = path or data_path(CACHE_FILE)
+        self.ttl = ttl if ttl is not None else get_setting('search_cache_ttl')
+        self.memory_entries = memory_entries or get_setting('search_cache_memory_entries')
+        self.disk_entries = disk_entries or get_setting('search_cache_disk_entries')
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            " key TEXT PRIMARY KEY,"
+            " query TEXT NOT NULL,"
+            " max_results INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS search_cache_accessed ON search_cache(accessed)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(query, max_results, start=1):
+        return f"{start}:{max_results}:{normalize_query(query)}"
+
+    def get(self, query, max_results, start=1):
+        """
+        Returns the cached results or None on a miss/expired entry.
+        """
+        key = self.make_key(query, max_results, start)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, results = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._counters['hits'] += 1
+                    self._counters['memory_hits'] += 1
+                    return results
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT created, payload FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                created, payload = row
+                if now - created < self.ttl:
+                    results = json.loads(payload)
+                    self._db.execute("UPDATE search_cache SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, created, results)
+                    self._counters['hits'] += 1
+                    self._counters['disk_hits'] += 1
+                    return results
+                self._db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self._db.commit()
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, query, max_results, results, start=1):
+        key = self.make_key(query, max_results, start)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, results)
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, query, max_results, created, accessed, payload)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, normalize_query(query), max_results, now, now, json.dumps(results))
+            )
+            self._evict_disk()
+            self._db.commit()
+
+    def provisional(self, query, limit=None):
+        """
+        Returns first-page results cached for a related query, filtered to
+        those matching every word of `query`, or None. Used to show rows
+        while the real search for `query` runs: the longest cached prefix
+        ("pyth" while typing "python") is preferred, then the shortest
+        cached extension (after deleting characters).
+        """
+        normalized = normalize_query(query)
+        words = WORD_RE.findall(normalized)
+        if not words:
+            return None
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload FROM search_cache"
+                " WHERE key LIKE '1:%' AND created >= ? AND query != ?"
+                " AND (substr(?, 1, length(query)) = query OR substr(query, 1, length(?)) = ?)"
+                " ORDER BY substr(?, 1, length(query)) = query DESC,"
+                " CASE WHEN length(query) <= length(?) THEN -length(query) ELSE length(query) END"
+                " LIMIT 1",
+                (cutoff, normalized, normalized, normalized, normalized, normalized, normalized)
+            ).fetchone()
+        if row is None:
+            return None
+
+        results = []
+        for result in json.loads(row[0]):
+            text = set(WORD_RE.findall(f"{result.get('title') or ''} {result.get('uploader') or ''}".lower()))
+            # The last word may still be half typed
+            if all(w in text for w in words[:-1]) and any(t.startswith(words[-1]) for t in text):
+                results.append(result)
+                if limit and len(results) >= limit:
+                    break
+        return results or None
+
+    def _remember(self, key, created, results):
+        self._memory[key] = (created, results)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def _evict_disk(self):
+        # Drop expired rows first, then the least recently used ones over the cap
+        cutoff = time.time() - self.ttl
+        cur = self._db.execute("DELETE FROM search_cache WHERE created < ?", (cutoff,))
+        evicted = cur.rowcount
+        count = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        if count > self.disk_entries:
+            cur = self._db.execute(
+                "DELETE FROM search_cache WHERE key IN ("
+                " SELECT key FROM search_cache ORDER BY accessed ASC LIMIT ?)",
+                (count - self.disk_entries,)
+            )
+            evicted += cur.rowcount
+        self._counters['evictions'] += max(evicted, 0)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM search_cache")
+            self._db.commit()
+
+    def stats(self):
+        """
+        Returns hit/miss counters and the current size of both tiers.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+            return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """
+    Returns the shared SearchCache, creating it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
@@ -1,42 +1,101 @@
-import subprocess
-import json
-import os
+import threading
+from modules import metrics
+from modules.search_cache import get_search_cache
+from modules.models import VideoResult
+from modules.ytdlp_engine import extraction_slot, get_engine
 
-YTDLP_PATH = os.path.join(os.getcwd(), "lib", "yt-dlp.exe")
+PAGE_SIZE = 20
 
-def search_youtube(query, max_results=20):
+def search_youtube(query, max_results=PAGE_SIZE, start=1, use_cache=True):
     """
     Searches YouTube for the given query using yt-dlp.
-    Returns a list of dictionaries containing video info.
+    Returns a list of VideoResult records, beginning at the 1-based
+    result index `start` so callers can fetch further pages.
+    Results are served from the search cache when a fresh entry exists.
     """
-    cmd = [
-        YTDLP_PATH,
-        f"ytsearch{max_results}:{query}",
-        "--dump-json",
-        "--flat-playlist",
-        "--quiet"
-    ]
-    
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='replace', creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-        videos = []
-        for line in result.stdout.splitlines():
-            if line.strip():
-                data = json.loads(line)
-                videos.append({
-                    'title': data.get('title', 'Unknown Title'),
-                    'url': data.get('url') or f"https://www.youtube.com/watch?v={data.get('id')}",
-                    'duration': data.get('duration_string', 'N/A'),
-                    'uploader': data.get('uploader', 'Unknown'),
-                    'id': data.get('id')
-                })
-        return videos
+        return StreamingSearch(query, max_results, start, use_cache=use_cache).run()
     except Exception as e:
         print(f"Error searching YouTube: {e}")
+        metrics.error('search', e)
         return []
 
+class StreamingSearch:
+    """
+    A single search that streams results from the yt-dlp engine
+    and hands each one to a callback as soon as it is decoded.
+    cancel() may be called from any thread and stops the running search,
+    as does setting `cancel_event` if one is passed in.
+    """
+    def __init__(self, query, max_results=PAGE_SIZE, start=1, use_cache=True, cancel_event=None):
+        self.query = query
+        self.max_results = max_results
+        self.start = start
+        self.use_cache = use_cache
+        self._cancelled = cancel_event or threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        # The engine watches this event and kills/stops the running search
+        self._cancelled.set()
+
+    def run(self, on_result=None):
+        """
+        Runs the search, calling on_result(item) for every result.
+        Returns the full list of results (possibly partial if cancelled).
+        Raises on yt-dlp failure.
+        """
+        with metrics.span('search', start=self.start) as span:
+            videos, cached = self._run(on_result)
+            span.set(results=len(videos), cached=cached, cancelled=self.cancelled)
+            return videos
+
+    def _run(self, on_result):
+        cache = None
+        if self.use_cache:
+            try:
+                cache = get_search_cache()
+                cached = cache.get(self.query, self.max_results, self.start)
+                if cached is not None:
+                    cached = [VideoResult.from_dict(d) for d in cached]
+                    if on_result:
+                        for item in cached:
+                            on_result(item)
+                    return cached, True
+            except Exception as e:
+                print(f"Error reading search cache: {e}")
+                cache = None
+
+        videos = self._run_process(on_result)
+
+        if cache is not None and videos and not self.cancelled:
+            try:
+                cache.put(self.query, self.max_results, [v.to_dict() for v in videos], self.start)
+            except Exception as e:
+                print(f"Error writing search cache: {e}")
+        return videos, False
+
+    def _run_process(self, on_result):
+        videos = []
+
+        def on_info(info):
+            item = VideoResult.from_info(info)
+            videos.append(item)
+            if on_result:
+                on_result(item)
+
+        # A search superseded while it waits for a slot never starts its process
+        with extraction_slot('search', self._cancelled.is_set) as acquired:
+            if acquired and not self.cancelled:
+                end = self.start + self.max_results - 1
+                get_engine().search(self.query, self.start, end, on_info, self._cancelled)
+        return videos
+
 if __name__ == "__main__":
     # Test search
     results = search_youtube("Python tutorial", max_results=5)
     for r in results:
-        print(f"{r['title']} - {r['url']} ({r['duration']})")
+        print(f"{r.title} - {r.url} ({r.duration})")
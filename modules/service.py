@@ -0,0 +1,705 @@
+"""
+Optional long-running local service. One process owns the warm yt-dlp
+engine, the search cache, the stream resolver and the download queue; the
+GUI, the CLI and scripts talk to it over JSON-RPC 2.0 on 127.0.0.1.
+
+Start it with `python main.py serve`. While it runs, data/service.json
+holds its URL and access token, and every other Te_Tube process (with the
+'ytdlp_engine' setting at 'auto' or 'service') uses it instead of starting
+its own extractor and queue.
+
+POST /rpc     a JSON-RPC request, answered with one JSON-RPC response
+POST /stream  the same request for search/expand/download; the answer is
+              JSON lines: {"item": ...} per result, then {"result": ...}
+              or {"error": ...}. Blank lines are keep-alives.
+"""
+import functools
+import hmac
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules.bandwidth import RateControl
+from modules.download_manager import get_download_manager, summarize_batches
+from modules.settings import data_path, get_setting
+
+HOST = "127.0.0.1"
+SERVICE_FILE = "service.json"
+TOKEN_HEADER = "X-TeTube-Token"
+# Seconds between keep-alive lines on a stream
+HEARTBEAT_INTERVAL = 1.0
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+class ServiceError(Exception):
+    def __init__(self, message, code=SERVER_ERROR):
+        super().__init__(message)
+        self.code = code
+
+class ServiceUnavailable(ServiceError):
+    """
+    The service refused the connection, so the request never reached it
+    and can safely be run in this process instead.
+    """
+
+def job_to_dict(job):
+    """
+    Everything a remote DownloadsPanel needs to show a job.
+    """
+    data = job.to_dict()
+    control = job.rate_control
+    data.update(line=job.line, path=job.path, error=job.error,
+                rate=control.rate if control else None,
+                fragments=control.fragments if control else None)
+    return data
+
+class Service:
+    """
+    The methods exposed over JSON-RPC. Plain methods return a JSON value;
+    stream methods get an extra emit(item) argument and a cancel event that
+    is set when the client goes away.
+    """
+    def __init__(self, engine=None, manager=None):
+        from modules.ytdlp_engine import get_engine
+        self.engine = engine or get_engine()
+        self.manager = manager or get_download_manager()
+        self.started = time.time()
+
+        manager = self.manager
+        self.methods = {
+            'ping': self.ping,
+            'resolve': self.resolve,
+            'info': self.info,
+            'stats': self.stats,
+            'throughput': self.throughput,
+            'queue.jobs': lambda: [job_to_dict(j) for j in manager.jobs()],
+            'queue.submit': lambda url, title, fmt, priority=0: job_to_dict(manager.submit(url, title, fmt, priority)),
+            'queue.submit_many': self.submit_many,
+            'queue.pause': manager.pause,
+            'queue.resume': manager.resume,
+            'queue.cancel': manager.cancel,
+            'queue.set_priority': manager.set_priority,
+            'queue.remove_finished': manager.remove_finished,
+            'queue.batch_progress': manager.batch_progress,
+            'queue.settings': self.queue_settings,
+            'queue.set_max_concurrency': manager.set_max_concurrency,
+            'queue.set_bandwidth_limit': manager.set_bandwidth_limit,
+            'queue.set_policy': self.set_policy,
+        }
+        self.streams = {
+            'search': self.search,
+            'expand': self.expand,
+            'infos': self.infos,
+            'download': self.download,
+        }
+
+    def ping(self):
+        return {'pid': os.getpid(), 'engine': self.engine.name, 'uptime': round(time.time() - self.started, 1)}
+
+    def resolve(self, url, format='best'):
+        from modules.stream_resolver import get_stream_resolver
+        return get_stream_resolver().resolve(url, format)
+
+    def info(self, url):
+        return self.engine.extract_info(url)
+
+    def stats(self):
+        from modules.metrics import get_metrics
+        from modules.search_cache import get_search_cache
+        from modules.stream_resolver import get_stream_resolver
+        return {
+            'metrics': get_metrics().snapshot(),
+            'search_cache': get_search_cache().stats(),
+            'resolver': get_stream_resolver().stats(),
+            'throughput': self.throughput(),
+        }
+
+    def throughput(self):
+        from modules.throughput import get_format_policy
+        return get_format_policy().snapshot()
+
+    def submit_many(self, items, fmt, priority=0, batch_title=None):
+        batch_id, jobs = self.manager.submit_many([tuple(i) for i in items], fmt, priority, batch_title)
+        return {'batch_id': batch_id, 'jobs': [job_to_dict(j) for j in jobs]}
+
+    def queue_settings(self):
+        return {
+            'max_concurrency': self.manager.max_concurrency,
+            'bandwidth_limit': self.manager.bandwidth.budget,
+            'bandwidth_policy': self.manager.bandwidth.policy,
+        }
+
+    def set_policy(self, policy):
+        self.manager.bandwidth.set_policy(policy)
+        self.manager.set_bandwidth_limit(self.manager.bandwidth.budget)
+
+    def search(self, emit, cancel_event, query, start=1, end=None):
+        """
+        Streams search entries through the service's own search cache.
+        """
+        from modules.search_engine import StreamingSearch, PAGE_SIZE
+        end = end or start + PAGE_SIZE - 1
+        search = StreamingSearch(query, end - start + 1, start, cancel_event=cancel_event)
+        results = search.run(lambda item: emit(dict(item.to_dict(), duration_string=item.duration)))
+        return len(results)
+
+    def expand(self, emit, cancel_event, url):
+        entries = []
+
+        def on_info(info):
+            entries.append(info)
+            emit(info)
+
+        self.engine.expand(url, on_info, cancel_event)
+        return len(entries)
+
+    def infos(self, emit, cancel_event, urls):
+        self.engine.extract_infos(urls, emit, cancel_event)
+        return len(urls)
+
+    def download(self, emit, cancel_event, url, options):
+        """
+        Runs one engine download directly, for download_media() callers in
+        client processes. Queued downloads go through queue.submit instead.
+        """
+        return self.engine.download(url, options, emit, cancel_event)
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "TeTube"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), self.server.token):
+            self.send_error(403)
+            return
+        if self.path not in ('/rpc', '/stream'):
+            self.send_error(404)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.reply(None, error=(PARSE_ERROR, "Parse error"))
+            return
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            self.reply(None, error=(INVALID_REQUEST, "Invalid request"))
+            return
+
+        if self.path == '/stream':
+            self.run_stream(request)
+        else:
+            self.run_call(request)
+
+    def run_call(self, request):
+        request_id = request.get('id')
+        method = self.server.service.methods.get(request['method'])
+        if method is None:
+            self.reply(request_id, error=(METHOD_NOT_FOUND, f"Method not found: {request['method']}"))
+            return
+        params = request.get('params') or {}
+        try:
+            inspect.signature(method).bind(**params)
+        except TypeError as e:
+            self.reply(request_id, error=(INVALID_PARAMS, str(e)))
+            return
+        try:
+            result = method(**params)
+        except Exception as e:
+            self.reply(request_id, error=(getattr(e, 'code', SERVER_ERROR), str(e)))
+            return
+        self.reply(request_id, result=result)
+
+    def reply(self, request_id, result=None, error=None):
+        response = {'jsonrpc': "2.0", 'id': request_id}
+        if error:
+            response['error'] = {'code': error[0], 'message': error[1]}
+        else:
+            response['result'] = result
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def run_stream(self, request):
+        method = self.server.service.streams.get(request['method'])
+        if method is None:
+            self.reply(request.get('id'), error=(METHOD_NOT_FOUND, f"Not a stream method: {request['method']}"))
+            return
+        params = request.get('params') or {}
+        try:
+            inspect.signature(method).bind(None, None, **params)
+        except TypeError as e:
+            self.reply(request.get('id'), error=(INVALID_PARAMS, str(e)))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', "application/x-ndjson")
+        self.end_headers()
+        # The connection closes when the stream ends (HTTP/1.0)
+        cancel_event = threading.Event()
+        write_lock = threading.Lock()
+        done = threading.Event()
+
+        def write(data):
+            if cancel_event.is_set():
+                return
+            with write_lock:
+                try:
+                    self.wfile.write(data)
+                    self.wfile.flush()
+                except OSError:
+                    # The client went away; stop the work it asked for
+                    cancel_event.set()
+
+        def heartbeat():
+            while not done.wait(HEARTBEAT_INTERVAL):
+                write(b"\n")
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            result = method(lambda item: write((json.dumps({'item': item}) + "\n").encode('utf-8')),
+                            cancel_event, **params)
+            line = {'result': result}
+        except Exception as e:
+            line = {'error': {'code': getattr(e, 'code', SERVER_ERROR), 'message': str(e),
+                              'type': type(e).__name__}}
+        finally:
+            done.set()
+        write((json.dumps(line) + "\n").encode('utf-8'))
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, token=None):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+        self.token = token or secrets.token_hex(16)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def serve(port=None, ready=None, service=None):
+    """
+    Runs the service until interrupted. ready(server) is called once it
+    accepts connections and has been registered in data/service.json.
+    """
+    global _client, _client_checked
+    # This process is the service; it must never route calls to itself
+    _client, _client_checked = None, True
+
+    service = service or Service()
+    server = ServiceServer((HOST, port if port is not None else get_setting('service_port')), service)
+    registration = {'url': server.url, 'token': server.token, 'pid': os.getpid()}
+    path = data_path(SERVICE_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(registration, f)
+    os.replace(path + ".tmp", path)
+
+    service.manager.start()
+    if ready:
+        ready(server)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.manager.shutdown()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                if json.load(f).get('pid') == os.getpid():
+                    os.remove(path)
+        except (OSError, ValueError):
+            pass
+
+class ServiceClient:
+    """
+    Calls a running service. call() returns the JSON-RPC result or raises
+    ServiceError; stream() calls on_item(item) for every streamed item.
+    """
+    def __init__(self, url, token, timeout=10):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self._ids = iter(range(1, 1 << 62))
+
+    def _open(self, path, method, params, timeout):
+        body = json.dumps({'jsonrpc': "2.0", 'id': next(self._ids), 'method': method, 'params': params})
+        request = urllib.request.Request(self.url + path, data=body.encode('utf-8'), method='POST',
+                                         headers={'Content-Type': "application/json", TOKEN_HEADER: self.token})
+        try:
+            return urllib.request.urlopen(request, timeout=timeout)
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, ConnectionRefusedError):
+                raise ServiceUnavailable(f"{self.url} refused the connection") from e
+            raise
+
+    def call(self, method, **params):
+        with self._open('/rpc', method, params, self.timeout) as response:
+            data = json.loads(response.read())
+        if 'error' in data:
+            raise ServiceError(data['error']['message'], data['error']['code'])
+        return data.get('result')
+
+    def stream(self, method, on_item, cancel_event=None, **params):
+        """
+        Returns the stream's final result. When `cancel_event` is set the
+        connection is dropped, which cancels the work in the service, and
+        None is returned.
+        """
+        with self._open('/stream', method, params, None) as response:
+            for line in response:
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                line = line.strip()
+                if not line:
+                    continue
+                data = json.loads(line)
+                if 'item' in data:
+                    on_item(data['item'])
+                elif 'error' in data:
+                    error = ServiceError(data['error']['message'], data['error']['code'])
+                    error.type = data['error'].get('type')
+                    raise error
+                else:
+                    return data.get('result')
+        raise ServiceError("Service closed the stream")
+
+def find_service():
+    """
+    Returns a ServiceClient for the running service, or None. The answer
+    is kept until forget_service() drops a client whose service went away;
+    without data/service.json it costs a single file check.
+    """
+    global _client, _client_checked
+    with _client_lock:
+        if _client_checked:
+            return _client
+        _client_checked = True
+        try:
+            with open(data_path(SERVICE_FILE), 'r', encoding='utf-8') as f:
+                registration = json.load(f)
+            client = ServiceClient(registration['url'], registration['token'], timeout=2)
+            client.call('ping')
+            client.timeout = get_setting('service_timeout')
+            _client = client
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, ServiceError) as e:
+            # Left behind by a service that didn't shut down cleanly
+            print(f"Te_Tube service not reachable, working locally: {e}")
+        return _client
+
+_client = None
+_client_checked = False
+_client_lock = threading.Lock()
+
+def service_client():
+    """
+    The client this process should use, or None to work locally: only the
+    'auto' and 'service' engine settings look for a service.
+    """
+    name = os.environ.get('TE_TUBE_ENGINE') or get_setting('ytdlp_engine')
+    return find_service() if name in ('auto', 'service') else None
+
+def forget_service(client):
+    """
+    Drops `client` after its service went away, so the next find_service()
+    looks at data/service.json again instead of reusing a dead endpoint.
+    """
+    global _client, _client_checked
+    with _client_lock:
+        if _client is client:
+            _client, _client_checked = None, False
+
+def call_or_local(method, local, **params):
+    """
+    Returns the service's answer to `method` while there is a service, and
+    local(**params) when there is none or it has gone away.
+    """
+    client = service_client()
+    if client is not None:
+        try:
+            return client.call(method, **params)
+        except ServiceUnavailable as e:
+            print(f"Te_Tube service not reachable, working locally: {e}")
+            forget_service(client)
+    return local(**params)
+
+def _or_local(method):
+    """
+    Runs a Remote* method against the service until the service refuses a
+    connection; from then on the same call goes to the in-process object
+    that _go_local() set up.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._local is None:
+            try:
+                return method(self, *args, **kwargs)
+            except ServiceUnavailable as e:
+                print(f"Te_Tube service not reachable, working locally: {e}")
+                forget_service(self.client)
+                self._go_local()
+        return getattr(self._local, method.__name__)(*args, **kwargs)
+    return wrapper
+
+class RemoteEngine:
+    """
+    Engine interface (see ytdlp_engine) backed by the service's warm engine.
+    Falls back to a local engine once the service is gone.
+    """
+    name = 'service'
+    live_rate_control = False
+
+    def __init__(self, client):
+        self.client = client
+        self._local = None
+        self._local_lock = threading.Lock()
+
+    def _go_local(self):
+        from modules.ytdlp_engine import create_engine, get_engine, set_engine
+        with self._local_lock:
+            if self._local is None:
+                self._local = create_engine()
+                self.live_rate_control = self._local.live_rate_control
+        # Later get_engine() callers skip this wrapper
+        if get_engine() is self:
+            set_engine(self._local)
+
+    @_or_local
+    def search(self, query, start, end, on_info, cancel_event=None):
+        self.client.stream('search', on_info, cancel_event, query=query, start=start, end=end)
+
+    @_or_local
+    def expand(self, url, on_info, cancel_event=None):
+        self.client.stream('expand', on_info, cancel_event, url=url)
+
+    @_or_local
+    def resolve_stream(self, url, format_spec='best'):
+        return self.client.call('resolve', url=url, format=format_spec)
+
+    @_or_local
+    def extract_info(self, url):
+        return self.client.call('info', url=url)
+
+    @_or_local
+    def extract_infos(self, urls, on_info, cancel_event=None):
+        self.client.stream('infos', on_info, cancel_event, urls=list(urls))
+
+    @_or_local
+    def download(self, url, options, progress_callback=None, cancel_event=None):
+        from modules.ytdlp_engine import DownloadCancelled
+        # The RateControl object stays here; its current rate goes along as a limit
+        options = {k: v for k, v in options.items() if k != 'rate_control'}
+        try:
+            path = self.client.stream('download', progress_callback or (lambda p: None), cancel_event,
+                                      url=url, options=options)
+        except ServiceError as e:
+            if getattr(e, 'type', None) == 'DownloadCancelled':
+                raise DownloadCancelled("Download cancelled")
+            raise
+        if cancel_event is not None and cancel_event.is_set():
+            raise DownloadCancelled("Download cancelled")
+        return path
+
+class RemoteJob:
+    """
+    Client-side copy of a DownloadJob, refreshed from queue.jobs.
+    """
+    def __init__(self, data):
+        self.id = data['id']
+        self.update(data)
+
+    def update(self, data):
+        for key in ('url', 'title', 'fmt', 'priority', 'seq', 'status', 'percent', 'batch_id', 'batch_title',
+                    'raw_path', 'line', 'path', 'error'):
+            setattr(self, key, data.get(key))
+        self.rate_control = RateControl(data['rate'], data['fragments']) if data.get('fragments') else None
+
+class RemoteBandwidth:
+    def __init__(self, client, budget, policy):
+        self.client = client
+        self.budget = budget
+        self.policy = policy
+
+    def set_policy(self, policy):
+        self.policy = policy
+        self.client.call('queue.set_policy', policy=policy)
+
+class RemoteDownloadManager:
+    """
+    DownloadManager interface for a GUI running against the service.
+    The job list is polled; listeners are called from the polling thread
+    for every job whose state changed, just like the local manager's
+    worker threads do. If the service goes away, the queue it saved is
+    picked up by an in-process DownloadManager and every call goes there.
+    """
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, client):
+        self.client = client
+        self.listeners = []
+        self._jobs = {}
+        self._last = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._local = None
+
+        settings = client.call('queue.settings')
+        self._max_concurrency = settings['max_concurrency']
+        self.bandwidth = RemoteBandwidth(client, settings['bandwidth_limit'], settings['bandwidth_policy'])
+        self._refresh()
+
+    @property
+    def max_concurrency(self):
+        return self._local.max_concurrency if self._local else self._max_concurrency
+
+    def _go_local(self):
+        from modules.download_manager import DownloadManager
+        with self._lock:
+            if self._local is not None:
+                return
+            local = DownloadManager()
+            # Listeners added or removed later reach the local manager too
+            local.listeners = self.listeners
+            self.bandwidth = local.bandwidth
+            self._local = local
+        local.start()
+        for job in local.jobs():
+            self._notify(job)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def start(self):
+        threading.Thread(target=self._poll_loop, daemon=True).start()
+
+    def _poll_loop(self):
+        while not self._stopping.wait(self.POLL_INTERVAL):
+            try:
+                self._refresh()
+            except ServiceUnavailable as e:
+                print(f"Te_Tube service not reachable, working locally: {e}")
+                forget_service(self.client)
+                self._go_local()
+                return
+            except Exception as e:
+                print(f"Error polling the Te_Tube service: {e}")
+
+    def _refresh(self):
+        changed = []
+        data = self.client.call('queue.jobs')
+        with self._lock:
+            seen = set()
+            for item in data:
+                seen.add(item['id'])
+                if self._last.get(item['id']) == item:
+                    continue
+                self._last[item['id']] = item
+                job = self._jobs.get(item['id'])
+                if job is None:
+                    job = self._jobs[item['id']] = RemoteJob(item)
+                else:
+                    job.update(item)
+                changed.append(job)
+            for job_id in set(self._jobs) - seen:
+                del self._jobs[job_id]
+                del self._last[job_id]
+        for job in changed:
+            self._notify(job)
+
+    def _track(self, item):
+        with self._lock:
+            job = self._jobs.get(item['id'])
+            if job is None:
+                job = self._jobs[item['id']] = RemoteJob(item)
+            self._last[item['id']] = item
+        self._notify(job)
+        return job
+
+    def _notify(self, job):
+        for listener in list(self.listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                print(f"Error in download listener: {e}")
+
+    @_or_local
+    def jobs(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.seq)
+
+    @_or_local
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    @_or_local
+    def submit(self, url, title, fmt, priority=0):
+        return self._track(self.client.call('queue.submit', url=url, title=title, fmt=fmt, priority=priority))
+
+    @_or_local
+    def submit_many(self, items, fmt, priority=0, batch_title=None):
+        result = self.client.call('queue.submit_many', items=[list(i) for i in items], fmt=fmt, priority=priority,
+                                  batch_title=batch_title)
+        return result['batch_id'], [self._track(item) for item in result['jobs']]
+
+    def batch_progress(self):
+        return summarize_batches(self.jobs())
+
+    @_or_local
+    def pause(self, job_id):
+        self.client.call('queue.pause', job_id=job_id)
+
+    @_or_local
+    def resume(self, job_id):
+        self.client.call('queue.resume', job_id=job_id)
+
+    @_or_local
+    def cancel(self, job_id):
+        self.client.call('queue.cancel', job_id=job_id)
+
+    @_or_local
+    def set_priority(self, job_id, priority):
+        self.client.call('queue.set_priority', job_id=job_id, priority=priority)
+
+    @_or_local
+    def set_max_concurrency(self, value):
+        self._max_concurrency = max(1, int(value))
+        self.client.call('queue.set_max_concurrency', value=self._max_concurrency)
+
+    @_or_local
+    def set_bandwidth_limit(self, budget):
+        self.bandwidth.budget = max(0, int(budget))
+        self.client.call('queue.set_bandwidth_limit', budget=self.bandwidth.budget)
+
+    @_or_local
+    def remove_finished(self):
+        self.client.call('queue.remove_finished')
+        self._refresh()
+
+    def shutdown(self):
+        # The service keeps running (and downloading) without us
+        self._stopping.set()
+        if self._local is not None:
+            self._local.shutdown()
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+
+DATA_DIR = os.path.join(os.getcwd(), "data")
+SETTINGS_PATH = os.path.join(DATA_DIR, "settings.json")
+
+DEFAULTS = {
+    # Search result cache
+    'search_cache_ttl': 6 * 60 * 60,
+    'search_cache_memory_entries': 128,
+    'search_cache_disk_entries': 2000,
+    # Search as you type: pause before searching, shortest query searched
+    'search_as_you_type': True,
+    'search_as_you_type_delay_ms': 400,
+    'search_as_you_type_min_chars': 3,
+    # Searches, result enrichment and stream prefetch running at once; later
+    # ones wait (or are dropped if superseded). Downloads are not counted.
+    'extractor_max_processes': 2,
+    # yt-dlp backend: 'auto', 'inprocess', 'subprocess' or 'service'
+    # ('auto' and 'service' use a running `main.py serve` when there is one)
+    'ytdlp_engine': 'auto',
+    'ytdlp_engine_workers': 2,
+    # Minimum seconds between yt-dlp.exe update checks
+    'ytdlp_update_interval': 24 * 60 * 60,
+    # Playback: 'resolve', 'pipe' or 'audio' (see player.PLAYBACK_MODES)
+    'playback_mode': 'resolve',
+    'fast_probe': True,
+    # Download queue
+    'max_concurrent_downloads': 2,
+    'progress_updates_per_second': 4,
+    'concurrent_fragments': 4,
+    # Bytes per second shared by all downloads, 0 = unlimited
+    'bandwidth_limit': 0,
+    # 'fair' (equal shares) or 'priority' (weighted by job priority)
+    'bandwidth_policy': 'fair',
+    # Concurrent fragments shared by all running downloads
+    'fragment_budget': 16,
+    # Parallel audio conversions, 0 = one per CPU core
+    'postprocess_workers': 0,
+    # Timing spans and counters (data/metrics.jsonl, see metrics.py)
+    'metrics_enabled': True,
+    'metrics_file_bytes': 1024 * 1024,
+    'metrics_file_backups': 3,
+    # Local JSON-RPC service (service.py); port 0 picks a free one
+    'service_port': 0,
+    'service_timeout': 30,
+    # Result list thumbnails (thumbnails.py)
+    'show_thumbnails': True,
+    'thumbnail_workers': 4,
+    'thumbnail_cache_bytes': 50 * 1024 * 1024,
+    'thumbnail_memory_entries': 200,
+    # Format choice from measured throughput (throughput.py)
+    'adaptive_formats': True,
+    'download_target_seconds': 120,
+    # Share of the measured speed a playback stream may need
+    'playback_headroom': 0.7,
+    'throughput_samples': 20,
+    'throughput_min_bytes': 1024 * 1024,
+    # Seconds between clipboard checks where change notifications can't be registered
+    'clipboard_poll_interval': 1.0,
+    # Full metadata for search results, fetched in batches (enrichment.py)
+    'enrich_results': True,
+    'enrichment_batch_size': 10,
+    'enrichment_workers': 3,
+    'enrichment_ttl': 60 * 60,
+    'enrichment_memory_entries': 1000,
+}
+
+_lock = threading.Lock()
+_settings = None
+
+def ensure_data_dir():
+    """
+    Creates the data folder used for caches and persisted state.
+    """
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR, exist_ok=True)
+    return DATA_DIR
+
+def data_path(name):
+    """
+    Returns the path of a file inside the data folder.
+    """
+    return os.path.join(ensure_data_dir(), name)
+
+def load_settings():
+    """
+    Loads settings.json merged over the defaults.
+    Missing or broken files fall back to the defaults.
+    """
+    global _settings
+    with _lock:
+        if _settings is None:
+            settings = dict(DEFAULTS)
+            try:
+                with open(SETTINGS_PATH, 'r', encoding='utf-8') as f:
+                    settings.update(json.load(f))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error reading settings: {e}")
+            _settings = settings
+        return _settings
+
+def get_setting(key, default=None):
+    return load_settings().get(key, DEFAULTS.get(key, default))
+
+def set_setting(key, value):
+    """
+    Updates a single setting and writes settings.json atomically.
+    """
+    settings = load_settings()
+    with _lock:
+        settings[key] = value
+        ensure_data_dir()
+        tmp_path = SETTINGS_PATH + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(settings, f, indent=2)
+            os.replace(tmp_path, SETTINGS_PATH)
+        except Exception as e:
+            print(f"Error saving settings: {e}")
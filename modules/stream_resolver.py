@@ -0,0 +1,170 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlparse, parse_qs
+
+from modules.models import media_url, video_id_of
+from modules.ytdlp_engine import extraction_slot, get_engine
+
+# googlevideo URLs carry their expiry either as ?expire=<epoch> or /expire/<epoch>/
+EXPIRE_PATH_RE = re.compile(r'/expire/(\d+)')
+
+# Used when a resolved URL doesn't say when it expires
+DEFAULT_TTL = 30 * 60
+# Treat URLs as expired this long before the real deadline
+EXPIRY_MARGIN = 60
+# How long the focused row has to stay focused before it is prefetched
+PREFETCH_DELAY = 0.25
+
+def parse_expiry(stream_url):
+    """
+    Returns the expiry embedded in a media URL as a unix timestamp, or None.
+    """
+    try:
+        values = parse_qs(urlparse(stream_url).query).get('expire')
+        if values:
+            return int(values[0])
+    except ValueError:
+        pass
+    match = EXPIRE_PATH_RE.search(stream_url)
+    if match:
+        return int(match.group(1))
+    return None
+
+class StreamResolver:
+    """
+    Resolves playable stream URLs through the yt-dlp engine and caches them
+    per (video id, format) until just before the URL's own expiry.
+    Concurrent requests for the same key share one resolution, and
+    prefetch() resolves the most recently focused video in the background,
+    holding one of the extraction slots shared with searches.
+    """
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'prefetches': 0}
+
+        self._wanted = None
+        self._prefetch_cond = threading.Condition()
+        self._prefetch_thread = None
+
+    @staticmethod
+    def make_key(target, format_spec):
+        return (video_id_of(target) or media_url(target), format_spec)
+
+    def cached(self, target, format_spec='best'):
+        """
+        Returns a still-valid cached stream URL or None.
+        """
+        key = self.make_key(target, format_spec)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            stream_url, expires = entry
+            if time.time() >= expires - EXPIRY_MARGIN:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return stream_url
+
+    def resolve(self, target, format_spec='best'):
+        stream_url = self.cached(target, format_spec)
+        key = self.make_key(target, format_spec)
+        with self._lock:
+            if stream_url is not None:
+                self._counters['hits'] += 1
+                return stream_url
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self._counters['misses'] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            stream_url = get_engine().resolve_stream(media_url(target), format_spec)
+            expires = parse_expiry(stream_url) or time.time() + DEFAULT_TTL
+            with self._lock:
+                self._cache[key] = (stream_url, expires)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            future.set_result(stream_url)
+            return stream_url
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def prefetch(self, target, format_spec='best'):
+        """
+        Asks for `target` to be resolved in the background. Only the latest
+        request is kept, so moving quickly through a list resolves just the
+        row the user settles on. `format_spec` may be a function returning
+        the spec; it is then called on the prefetch thread.
+        """
+        if not callable(format_spec) and self.cached(target, format_spec) is not None:
+            return
+        with self._prefetch_cond:
+            self._wanted = (target, format_spec)
+            if self._prefetch_thread is None:
+                self._prefetch_thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+                self._prefetch_thread.start()
+            self._prefetch_cond.notify()
+
+    def _prefetch_loop(self):
+        while True:
+            with self._prefetch_cond:
+                while self._wanted is None:
+                    self._prefetch_cond.wait()
+                wanted = self._wanted
+                # Wait for focus to settle; a newer request replaces this one
+                self._prefetch_cond.wait(PREFETCH_DELAY)
+                if self._wanted is not wanted:
+                    continue
+                self._wanted = None
+
+            target, format_spec = wanted
+            try:
+                if callable(format_spec):
+                    format_spec = format_spec()
+            except Exception as e:
+                print(f"Error choosing prefetch format: {e}")
+                continue
+            if self.cached(target, format_spec) is not None:
+                continue
+            # A newer request while waiting for a slot replaces this one
+            with extraction_slot('prefetch', lambda: self._wanted is not None) as acquired:
+                if not acquired:
+                    continue
+                try:
+                    self.resolve(target, format_spec)
+                    with self._lock:
+                        self._counters['prefetches'] += 1
+                except Exception as e:
+                    print(f"Error prefetching stream: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._cache)
+            return stats
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+def get_stream_resolver():
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = StreamResolver()
+        return _resolver
@@ -0,0 +1,219 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from modules import metrics
+from modules.settings import data_path, get_setting
+
+THROUGHPUT_FILE = "throughput.json"
+
+# Weight of the newest sample in the running estimate
+EWMA_ALPHA = 0.3
+# A transfer running this close to its rate limit measured the limit, not the link
+CAPPED_FRACTION = 0.8
+# How long the network key is trusted before it is looked up again
+NETWORK_TTL = 30.0
+
+# Video bitrates (kbit/s) playback may be capped at; quantizing keeps the
+# format string, and so the stream resolver's cache key, stable
+PLAYBACK_LADDER = (300, 500, 800, 1200, 2000, 3000, 5000, 8000)
+
+def network_key():
+    """
+    Identifies the network by the local address of the default route, so
+    home, office and hotspot keep separate estimates. Connecting a UDP
+    socket sends nothing.
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+    except OSError:
+        return 'offline'
+
+class ThroughputEstimator:
+    """
+    Measured transfer speeds per network, persisted in data/throughput.json.
+    Every download (and the start of piped playback) reports its bytes and
+    seconds; the estimate is an exponentially weighted mean of the samples,
+    so it follows a network that got slower without forgetting it at once.
+    Tiny transfers and transfers held back by the bandwidth limit are
+    ignored since they say little about the link.
+    """
+    def __init__(self, path=None, max_samples=None, min_bytes=None):
+        self.path = path or data_path(THROUGHPUT_FILE)
+        self.max_samples = max_samples or get_setting('throughput_samples')
+        self.min_bytes = min_bytes or get_setting('throughput_min_bytes')
+        self._lock = threading.Lock()
+        self._networks = None
+        self._mtime = None
+        self._network = None
+        self._network_checked = 0.0
+
+    def network(self):
+        now = time.monotonic()
+        if self._network is None or now - self._network_checked > NETWORK_TTL:
+            self._network = network_key()
+            self._network_checked = now
+        return self._network
+
+    def _load(self):
+        # Called with the lock held; other Te_Tube processes may have written since
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if self._networks is not None and mtime == self._mtime:
+            return
+        self._mtime = mtime
+        self._networks = {}
+        if mtime is None:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._networks = json.load(f)
+        except Exception as e:
+            print(f"Error reading throughput history: {e}")
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._networks, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except Exception as e:
+            print(f"Error saving throughput history: {e}")
+
+    def record(self, total_bytes, seconds, source, rate_limit=None):
+        """
+        Adds one measured transfer. Returns the bytes per second recorded,
+        or None if the sample was ignored.
+        """
+        if not total_bytes or total_bytes < self.min_bytes or not seconds or seconds <= 0:
+            return None
+        speed = total_bytes / seconds
+        if rate_limit and speed >= rate_limit * CAPPED_FRACTION:
+            return None
+        network = self.network()
+        with self._lock:
+            self._load()
+            entry = self._networks.setdefault(network, {'estimate': None, 'samples': []})
+            previous = entry['estimate']
+            entry['estimate'] = round(speed if previous is None else previous + EWMA_ALPHA * (speed - previous))
+            entry['samples'].append({'time': round(time.time()), 'source': source, 'bytes': total_bytes,
+                                     'bytes_per_sec': round(speed)})
+            del entry['samples'][:-self.max_samples]
+            self._save()
+        metrics.record('throughput.sample', seconds * 1000, source=source, bytes_per_sec=round(speed))
+        return speed
+
+    def estimate(self, network=None):
+        """
+        Returns the estimated bytes per second on `network` (default: the
+        current one), or None before anything was measured there.
+        """
+        network = network or self.network()
+        with self._lock:
+            self._load()
+            entry = self._networks.get(network)
+            return entry['estimate'] if entry else None
+
+    def snapshot(self):
+        with self._lock:
+            self._load()
+            return json.loads(json.dumps(self._networks))
+
+class FormatPolicy:
+    """
+    Turns the throughput estimate into yt-dlp format strings.
+
+    Downloads: the video stream is capped by file size so the whole file
+    arrives within 'download_target_seconds'; when nothing fits, the usual
+    best quality is taken since the user asked for a download anyway.
+    Playback: the muxed stream ffplay opens is capped by bitrate at
+    'playback_headroom' of the estimate, so it plays without stalling;
+    when nothing fits, the smallest stream is taken.
+
+    With no estimate for the network yet, or with 'adaptive_formats' off,
+    the default strings are returned unchanged. Recent decisions are kept
+    for inspection (see snapshot()).
+    """
+    def __init__(self, estimator=None):
+        self.estimator = estimator or ThroughputEstimator()
+        self._decisions = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def download_format(self, default):
+        estimate = self._estimate()
+        if estimate is None:
+            return self._decide('download', default, estimate, None, "no estimate")
+        budget = int(estimate * get_setting('download_target_seconds'))
+        # Audio is around a tenth of a video download; the rest goes to the video stream
+        video_budget = int(budget * 0.9)
+        spec = (f"bestvideo[ext=mp4][filesize<=?{video_budget}][filesize_approx<=?{video_budget}]"
+                f"+bestaudio[ext=m4a]"
+                f"/best[ext=mp4][filesize<=?{budget}][filesize_approx<=?{budget}]"
+                f"/{default}")
+        return self._decide('download', spec, estimate, budget, "size within target time")
+
+    def playback_format(self, default="best", record=True):
+        estimate = self._estimate()
+        if estimate is None:
+            return self._decide('playback', default, estimate, None, "no estimate", record)
+        affordable = estimate * 8 / 1000 * get_setting('playback_headroom')
+        fitting = [step for step in PLAYBACK_LADDER if step <= affordable]
+        if not fitting:
+            return self._decide('playback', "worst", estimate, PLAYBACK_LADDER[0], "slower than every step",
+                                record)
+        if fitting[-1] == PLAYBACK_LADDER[-1]:
+            return self._decide('playback', default, estimate, None, "faster than every step", record)
+        limit = fitting[-1]
+        return self._decide('playback', f"best[tbr<=?{limit}]/worst", estimate, limit, "bitrate within headroom",
+                            record)
+
+    def _estimate(self):
+        if not get_setting('adaptive_formats'):
+            return None
+        return self.estimator.estimate()
+
+    def _decide(self, kind, spec, estimate, limit, reason, record=True):
+        if record:
+            with self._lock:
+                self._decisions.append({'time': round(time.time()), 'kind': kind,
+                                        'network': self.estimator.network(), 'estimate': estimate,
+                                        'limit': limit, 'reason': reason, 'format': spec})
+        return spec
+
+    def snapshot(self):
+        """
+        Everything the policy works from: the current network, the measured
+        speeds per network and the most recent decisions, newest last.
+        """
+        with self._lock:
+            decisions = list(self._decisions)
+        return {
+            'network': self.estimator.network(),
+            'estimate': self.estimator.estimate(),
+            'networks': self.estimator.snapshot(),
+            'decisions': decisions,
+        }
+
+_policy = None
+_policy_lock = threading.Lock()
+
+def get_format_policy():
+    """
+    Returns the shared FormatPolicy, creating it on first use.
+    """
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = FormatPolicy()
+        return _policy
+
+def get_estimator():
+    return get_format_policy().estimator
@@ -0,0 +1,133 @@
+import os
+import threading
+
+from modules import metrics
+from modules.settings import data_path, get_setting
+
+# 320x180, the smallest 16:9 size YouTube serves for every video
+THUMBNAIL_URL = "https://i.ytimg.com/vi/{}/mqdefault.jpg"
+CACHE_DIR = "thumbnails"
+
+class ThumbnailFetcher:
+    """
+    Loads thumbnail JPEGs on a small pool of worker threads sharing one
+    pooled requests.Session, with a size-capped cache in data/thumbnails.
+
+    want(video_ids) replaces the pending list, so ids that scrolled out of
+    view or belong to an old search are dropped before they are fetched.
+    Workers take ids in the given order (visible rows first) and call
+    on_ready(video_id, data) from their own thread. Thumbnails are small,
+    so a fetch already running is left to finish and lands in the cache.
+    """
+    def __init__(self, on_ready, workers=None, cache_dir=None, max_bytes=None):
+        self.on_ready = on_ready
+        self.workers = workers or get_setting('thumbnail_workers')
+        self.cache_dir = cache_dir or data_path(CACHE_DIR)
+        self.max_bytes = max_bytes or get_setting('thumbnail_cache_bytes')
+        self._wanted = []
+        self._inflight = set()
+        self._failed = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._disk_bytes = None
+        self._disk_lock = threading.Lock()
+
+    def want(self, video_ids):
+        """
+        Sets the ids to load next, most important first.
+        """
+        with self._cond:
+            self._wanted = [v for v in dict.fromkeys(video_ids)
+                            if v and v not in self._inflight and v not in self._failed]
+            if self._wanted and not self._threads:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self._worker_loop, daemon=True)
+                    self._threads.append(thread)
+                    thread.start()
+            self._cond.notify_all()
+
+    def cancel(self):
+        self.want([])
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._wanted:
+                    self._cond.wait()
+                video_id = self._wanted.pop(0)
+                self._inflight.add(video_id)
+            try:
+                data = self._load(video_id)
+            except Exception as e:
+                print(f"Error loading thumbnail {video_id}: {e}")
+                data = None
+            with self._cond:
+                self._inflight.discard(video_id)
+                if data is None:
+                    self._failed.add(video_id)
+            if data is not None:
+                try:
+                    self.on_ready(video_id, data)
+                except Exception as e:
+                    print(f"Error in thumbnail listener: {e}")
+
+    def _load(self, video_id):
+        path = os.path.join(self.cache_dir, video_id + ".jpg")
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime doubles as the last-used time for pruning
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            pass
+
+        with metrics.span('thumbnail.fetch') as span:
+            response = self._get_session().get(THUMBNAIL_URL.format(video_id), timeout=10)
+            response.raise_for_status()
+            data = response.content
+            span.set(bytes=len(data))
+        self._store(path, data)
+        return data
+
+    def _get_session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # Keep one connection per worker open to i.ytimg.com
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def _store(self, path, data):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(e.stat().st_size for e in os.scandir(self.cache_dir) if e.is_file())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_bytes:
+                self._prune()
+
+    def _prune(self):
+        # Called with _disk_lock held; drops least recently used files down to 90% of the cap
+        entries = sorted((e for e in os.scandir(self.cache_dir) if e.is_file()), key=lambda e: e.stat().st_mtime)
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if self._disk_bytes <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._disk_bytes -= size
+            except OSError:
+                pass
+
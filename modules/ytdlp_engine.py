@@ -0,0 +1,637 @@
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from modules import metrics, ytdlp_manager
+from modules.settings import get_setting
+from modules.throughput import get_estimator
+
+NO_WINDOW = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+
+PERCENT_RE = re.compile(r'(\d+\.\d+)%')
+ALREADY_DOWNLOADED_RE = re.compile(r'\[download\] (.*) has already been downloaded')
+# [Merger] Merging formats into "Title.mp4" / [FixupM4a] Correcting container of "Title.m4a"
+QUOTED_PATH_RE = re.compile(r'"(.*)"\s*$')
+# [info] dQw4w9WgXcQ: Downloading 1 format(s): 137+140
+SELECTED_FORMAT_RE = re.compile(r'^\[info\] [^:]+: Downloading \d+ format\(s\): (\S+)')
+
+# Machine-readable progress: yt-dlp prints one JSON object per update after
+# this prefix. Missing numeric fields fall back to null via the |null default.
+PROGRESS_PREFIX = "TETUBE_PROGRESS "
+PROGRESS_FIELDS = ['downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'speed', 'eta',
+                   'fragment_index', 'fragment_count']
+PROGRESS_TEMPLATE = "download:" + PROGRESS_PREFIX + "{" + ", ".join(
+    f'"{field}": %(progress.{field}|null)s' for field in PROGRESS_FIELDS
+) + "}"
+
+# stderr lines kept for the error message of a failed run
+STDERR_TAIL_LINES = 20
+
+# Output of the steps yt-dlp runs after the transfer (merging, converting, fixups)
+POSTPROCESS_PREFIXES = ('[Merger]', '[ExtractAudio]', '[VideoConvertor]', '[VideoRemuxer]', '[Fixup')
+
+class DownloadCancelled(Exception):
+    pass
+
+def format_bytes(value):
+    if value is None:
+        return "?"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024 or unit == "GiB":
+            return f"{value:.2f}{unit}" if unit != "B" else f"{int(value)}B"
+        value /= 1024.0
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{secs:02d}"
+
+def build_progress(data):
+    """
+    Turns raw byte counters into the progress dict handed to callbacks:
+    status, percent and a human readable line plus the raw fields.
+    """
+    total = data.get('total_bytes') or data.get('total_bytes_estimate')
+    done = data.get('downloaded_bytes') or 0
+    percent = min(done * 100.0 / total, 100.0) if total else 0.0
+    line = f"{percent:.1f}% of {format_bytes(total)} at {format_bytes(data.get('speed'))}/s ETA {format_eta(data.get('eta'))}"
+    if data.get('fragment_count'):
+        line += f" (frag {data.get('fragment_index') or 0}/{data['fragment_count']})"
+    progress = {'status': 'downloading', 'percent': percent, 'line': line}
+    for field in PROGRESS_FIELDS:
+        progress[field] = data.get(field)
+    return progress
+
+def parse_progress_line(line):
+    """
+    Parses a PROGRESS_TEMPLATE line; returns None for any other output.
+    """
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        return build_progress(json.loads(line[len(PROGRESS_PREFIX):]))
+    except ValueError:
+        return None
+
+class TransferTimer:
+    """
+    Splits one download into phases for the metrics: extraction (start to
+    first progress), network transfer and post-processing (merge/convert).
+    Completed transfers also go to the throughput estimator; `rate_limit`
+    tells it whether the speed was held back on purpose.
+    """
+    def __init__(self, rate_limit=None):
+        self.rate_limit = rate_limit
+        self.started = time.perf_counter()
+        self.transfer_started = None
+        self.post_started = None
+        # Bytes of finished files (video, then audio) plus the current one
+        self.finished_bytes = 0
+        self.current_bytes = 0
+
+    def progress(self, downloaded_bytes):
+        if self.transfer_started is None:
+            self.transfer_started = time.perf_counter()
+        downloaded_bytes = downloaded_bytes or 0
+        if downloaded_bytes < self.current_bytes:
+            self.finished_bytes += self.current_bytes
+        self.current_bytes = downloaded_bytes
+
+    def postprocess(self):
+        if self.post_started is None:
+            self.post_started = time.perf_counter()
+
+    def finish(self, error=None):
+        ended = time.perf_counter()
+        attrs = {'error': error} if error else {}
+        if self.transfer_started is None:
+            metrics.record('ytdlp.extract', (ended - self.started) * 1000, **attrs)
+            return
+        metrics.record('ytdlp.extract', (self.transfer_started - self.started) * 1000)
+        transfer_ended = self.post_started or ended
+        seconds = transfer_ended - self.transfer_started
+        total = self.finished_bytes + self.current_bytes
+        metrics.record('ytdlp.transfer', seconds * 1000, bytes=total,
+                       bytes_per_sec=round(total / seconds) if seconds > 0 else None,
+                       **(attrs if self.post_started is None else {}))
+        metrics.count('download.bytes', total)
+        # A paused, restarted or failed transfer may have stopped anywhere,
+        # and would pull the estimate down for no fault of the link
+        if not error:
+            get_estimator().record(total, seconds, 'download', self.rate_limit)
+        if self.post_started is not None:
+            metrics.record('ytdlp.postprocess', (ended - self.post_started) * 1000, **attrs)
+
+def kill_on_cancel(process, cancel_event):
+    """
+    Kills `process` as soon as `cancel_event` is set.
+    Polls so the watcher exits on its own once the process finishes.
+    """
+    while process.poll() is None:
+        if cancel_event.wait(0.2):
+            try:
+                process.kill()
+            except OSError:
+                pass
+            return
+
+def watch_cancel(process, cancel_event):
+    if cancel_event is not None:
+        threading.Thread(target=kill_on_cancel, args=(process, cancel_event), daemon=True).start()
+
+_extraction_slots = None
+_extraction_slots_lock = threading.Lock()
+
+def extraction_slots():
+    """
+    Returns the semaphore shared by the extractions the app starts on its
+    own (searches, result enrichment, stream prefetch), which caps them at
+    'extractor_max_processes' however fast the user types. Downloads are
+    limited by the download queue instead.
+    """
+    global _extraction_slots
+    with _extraction_slots_lock:
+        if _extraction_slots is None:
+            _extraction_slots = threading.BoundedSemaphore(max(1, get_setting('extractor_max_processes')))
+        return _extraction_slots
+
+@contextmanager
+def extraction_slot(kind, cancelled=None):
+    """
+    Holds one extraction slot for the body of the with block. Yields False
+    instead, without waiting any longer, once `cancelled()` returns True.
+    The wait is recorded as '<kind>.slot_wait'.
+    """
+    slots = extraction_slots()
+    waited = time.perf_counter()
+    while not slots.acquire(timeout=0.05):
+        if cancelled is not None and cancelled():
+            yield False
+            return
+    metrics.record(kind + '.slot_wait', (time.perf_counter() - waited) * 1000)
+    try:
+        yield True
+    finally:
+        slots.release()
+
+class SubprocessEngine:
+    """
+    Runs every operation in a fresh yt-dlp executable.
+    `command` overrides the executable, e.g. [sys.executable, "stub.py"].
+    """
+    name = 'subprocess'
+    # Rate limits are fixed when the process starts
+    live_rate_control = False
+
+    def __init__(self, command=None):
+        self.command = command
+
+    def base_command(self):
+        return list(self.command) if self.command else ytdlp_manager.ytdlp_command()
+
+    def _spawn(self, kind, args, **kwargs):
+        started = time.perf_counter()
+        process = subprocess.Popen(self.base_command() + args, creationflags=NO_WINDOW, **kwargs)
+        metrics.record('ytdlp.spawn', (time.perf_counter() - started) * 1000, kind=kind)
+        return process
+
+    def search(self, query, start, end, on_info, cancel_event=None):
+        """
+        Streams flat search entries for results start..end (1-based)
+        to on_info(info_dict). Raises on yt-dlp failure.
+        """
+        self._stream_json('search', [
+            f"ytsearch{end}:{query}",
+            "--playlist-start", str(start),
+            "--playlist-end", str(end),
+            "--dump-json",
+            "--flat-playlist",
+            "--quiet"
+        ], on_info, cancel_event)
+
+    def expand(self, url, on_info, cancel_event=None):
+        """
+        Streams the flat entries of a playlist or channel URL to on_info.
+        """
+        self._stream_json('expand', [url, "--dump-json", "--flat-playlist", "--quiet"], on_info, cancel_event)
+
+    def _stream_json(self, kind, args, on_info, cancel_event):
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        started = time.perf_counter()
+        process = self._spawn(
+            kind,
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1
+        )
+        watch_cancel(process, cancel_event)
+        # Read alongside stdout, so a run full of warnings can't fill the pipe and stall
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        drain = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+        drain.start()
+
+        cancelled = lambda: cancel_event is not None and cancel_event.is_set()
+        entries = 0
+        try:
+            for line in process.stdout:
+                if cancelled():
+                    break
+                line = line.strip()
+                if line:
+                    if not entries:
+                        metrics.record('ytdlp.first_entry', (time.perf_counter() - started) * 1000, kind=kind)
+                    entries += 1
+                    on_info(json.loads(line))
+        finally:
+            if cancelled() and process.poll() is None:
+                process.kill()
+            process.wait()
+            drain.join()
+            process.stdout.close()
+            process.stderr.close()
+        stderr = "".join(stderr_tail)
+
+        metrics.record('ytdlp.' + kind, (time.perf_counter() - started) * 1000, entries=entries,
+                       returncode=process.returncode)
+        if not cancelled() and process.returncode != 0:
+            raise Exception(f"yt-dlp exited with code {process.returncode}: {stderr.strip()}")
+
+    def resolve_stream(self, url, format_spec='best'):
+        """
+        Returns the direct media URL for `url`.
+        """
+        cmd = self.base_command() + ["-g", "-f", format_spec, "--no-playlist", url]
+        with metrics.span('ytdlp.resolve', format=format_spec):
+            output = subprocess.check_output(cmd, text=True, encoding='utf-8', errors='replace', creationflags=NO_WINDOW)
+        return output.strip().splitlines()[0]
+
+    def extract_info(self, url):
+        cmd = self.base_command() + ["--dump-single-json", "--skip-download", "--no-playlist", "--quiet", url]
+        with metrics.span('ytdlp.info'):
+            output = subprocess.check_output(cmd, text=True, encoding='utf-8', errors='replace', creationflags=NO_WINDOW)
+        return json.loads(output)
+
+    def extract_infos(self, urls, on_info, cancel_event=None):
+        """
+        Streams the full info dict of every URL to on_info from a single
+        yt-dlp process. URLs that fail are skipped; the call still raises
+        afterwards because yt-dlp exits non-zero.
+        """
+        self._stream_json('info_batch', [
+            "--dump-json",
+            "--skip-download",
+            "--no-playlist",
+            "--ignore-errors",
+            "--quiet",
+            "--no-warnings",
+            "--"
+        ] + list(urls), on_info, cancel_event)
+
+    def build_download_args(self, options):
+        # A watch link with &list= is the video; playlists are expanded before queueing
+        args = ["-o", options['output_template'], "--no-playlist", "--newline", "--progress",
+                "--progress-template", PROGRESS_TEMPLATE, "-f", options['format']]
+        if options.get('extract_audio'):
+            args += ["--extract-audio", "--audio-format", options['extract_audio']]
+            if options.get('audio_quality') is not None:
+                args += ["--audio-quality", str(options['audio_quality'])]
+        if options.get('concurrent_fragments'):
+            args += ["--concurrent-fragments", str(options['concurrent_fragments'])]
+        if options.get('rate_limit'):
+            args += ["--limit-rate", str(int(options['rate_limit']))]
+        if options.get('ffmpeg_location'):
+            args += ["--ffmpeg-location", options['ffmpeg_location']]
+        return args
+
+    def download(self, url, options, progress_callback=None, cancel_event=None):
+        """
+        Downloads `url` according to the options built by download_media.
+        Returns the final file path. Progress dicts also carry the selected
+        'format_id' and the 'filename' being written, so an interrupted
+        download can be resumed with the same streams.
+        """
+        timer = TransferTimer(options.get('rate_limit'))
+        process = self._spawn(
+            'download',
+            self.build_download_args(options) + [url],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='replace'
+        )
+        watch_cancel(process, cancel_event)
+
+        final_path = None
+        format_id = None
+        destination = None
+
+        for line in process.stdout:
+            # Structured progress from PROGRESS_TEMPLATE, the common case by far
+            if line.startswith(PROGRESS_PREFIX):
+                progress = parse_progress_line(line)
+                if progress:
+                    progress['format_id'] = format_id
+                    progress['filename'] = destination
+                    timer.progress(progress['downloaded_bytes'])
+                    if progress_callback:
+                        progress_callback(progress)
+                continue
+
+            if line.startswith(POSTPROCESS_PREFIXES):
+                timer.postprocess()
+            elif 'Retrying' in line:
+                metrics.count('ytdlp.retries')
+
+            # Older yt-dlp builds ignore the template: [download]  10.0% of 100.00MiB at 1.00MiB/s ETA 01:30
+            if '[download]' in line and '%' in line:
+                percent_match = PERCENT_RE.search(line)
+                if percent_match:
+                    percent = float(percent_match.group(1))
+                    timer.progress(None)
+                    if progress_callback:
+                        progress_callback({'status': 'downloading', 'percent': percent, 'line': line.strip()})
+
+            # Look for the destination file
+            if line.startswith('[info]'):
+                match = SELECTED_FORMAT_RE.match(line)
+                if match:
+                    format_id = match.group(1)
+            if '[download] Destination:' in line:
+                final_path = destination = line.split('Destination:')[1].strip()
+            elif 'has already been downloaded' in line:
+                # [download] d:\python code\te_tube\download\Video Title.mp4 has already been downloaded
+                match = ALREADY_DOWNLOADED_RE.search(line)
+                if match:
+                    final_path = match.group(1).strip()
+            elif line.startswith(('[ExtractAudio]', '[VideoRemuxer]', '[VideoConvertor]')) and 'Destination:' in line:
+                final_path = line.split('Destination:')[1].strip()
+            elif line.startswith(('[Merger]', '[Fixup')):
+                # The merged file replaces the per-format ones, which yt-dlp deletes
+                match = QUOTED_PATH_RE.search(line)
+                if match:
+                    final_path = match.group(1)
+
+        process.wait()
+
+        if cancel_event is not None and cancel_event.is_set():
+            timer.finish('DownloadCancelled')
+            raise DownloadCancelled("Download cancelled")
+        if process.returncode != 0:
+            timer.finish(f"exit code {process.returncode}")
+            raise Exception(f"yt-dlp exited with code {process.returncode}")
+        timer.finish()
+        return final_path
+
+def format_duration(seconds):
+    if seconds is None:
+        return None
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+class InProcessEngine:
+    """
+    Drives the yt_dlp Python API on a small pool of long-lived worker threads.
+    Each worker keeps its own YoutubeDL instances, so extractors stay
+    initialised between calls and no executable is started.
+    `ydl_factory(params)` builds the YoutubeDL object; tests can pass a stub.
+    """
+    name = 'inprocess'
+    # Downloads re-read their RateControl on every progress tick
+    live_rate_control = True
+
+    def __init__(self, workers=None, ydl_factory=None):
+        if ydl_factory is None:
+            import yt_dlp
+            ydl_factory = yt_dlp.YoutubeDL
+        self.ydl_factory = ydl_factory
+        self.executor = ThreadPoolExecutor(max_workers=workers or get_setting('ytdlp_engine_workers'),
+                                           thread_name_prefix='ytdlp')
+        self._local = threading.local()
+
+    def _ydl(self, kind, params):
+        # One warm instance per worker thread and kind of operation. Options
+        # yt-dlp reads only when it is built (the format selector) belong in
+        # `kind`, so instances with different values are never shared.
+        cache = getattr(self._local, 'instances', None)
+        if cache is None:
+            cache = self._local.instances = {}
+        ydl = cache.get(kind)
+        if ydl is None:
+            ydl = cache[kind] = self.ydl_factory(params)
+        return ydl
+
+    def _call(self, func, *args):
+        submitted = time.perf_counter()
+
+        def run():
+            metrics.record('ytdlp.pool_wait', (time.perf_counter() - submitted) * 1000, call=func.__name__)
+            return func(*args)
+
+        return self.executor.submit(run).result()
+
+    def search(self, query, start, end, on_info, cancel_event=None):
+        self._call(self._search, query, start, end, on_info, cancel_event)
+
+    def _search(self, query, start, end, on_info, cancel_event):
+        ydl = self._ydl('flat', {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist'})
+        # process=False keeps the entries lazy so results stream as they arrive
+        info = ydl.extract_info(f"ytsearch{end}:{query}", download=False, process=False)
+        for entry in islice(info.get('entries') or [], start - 1, end):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if 'duration_string' not in entry:
+                entry['duration_string'] = format_duration(entry.get('duration')) or 'N/A'
+            on_info(entry)
+
+    def expand(self, url, on_info, cancel_event=None):
+        self._call(self._expand, url, on_info, cancel_event)
+
+    def _expand(self, url, on_info, cancel_event):
+        ydl = self._ydl('flat', {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist'})
+        # Processed so that channel tabs resolve down to their video entries
+        info = ydl.extract_info(url, download=False)
+        for entry in info.get('entries') or [info]:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if 'duration_string' not in entry:
+                entry['duration_string'] = format_duration(entry.get('duration')) or 'N/A'
+            on_info(entry)
+
+    def resolve_stream(self, url, format_spec='best'):
+        return self._call(self._resolve_stream, url, format_spec)
+
+    def _resolve_stream(self, url, format_spec):
+        ydl = self._ydl(('resolve', format_spec), {'quiet': True, 'no_warnings': True, 'noplaylist': True,
+                                                   'format': format_spec})
+        with metrics.span('ytdlp.resolve', format=format_spec):
+            info = ydl.extract_info(url, download=False)
+        if info.get('url'):
+            return info['url']
+        return info['requested_formats'][0]['url']
+
+    def extract_info(self, url):
+        return self._call(self._extract_info, url)
+
+    def _extract_info(self, url):
+        ydl = self._ydl('info', {'quiet': True, 'no_warnings': True, 'noplaylist': True})
+        with metrics.span('ytdlp.info'):
+            info = ydl.extract_info(url, download=False)
+        return ydl.sanitize_info(info)
+
+    def extract_infos(self, urls, on_info, cancel_event=None):
+        self._call(self._extract_infos, list(urls), on_info, cancel_event)
+
+    def _extract_infos(self, urls, on_info, cancel_event):
+        # The whole batch is one pool task on one warm instance
+        ydl = self._ydl('info', {'quiet': True, 'no_warnings': True, 'noplaylist': True})
+        errors = []
+        with metrics.span('ytdlp.info_batch', urls=len(urls)) as span:
+            for url in urls:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                try:
+                    info = ydl.extract_info(url, download=False)
+                except Exception as e:
+                    errors.append(f"{url}: {e}")
+                    continue
+                on_info(ydl.sanitize_info(info))
+            span.set(errors=len(errors))
+        if errors:
+            raise Exception("; ".join(errors))
+
+    def build_download_params(self, options):
+        params = {
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'noplaylist': True,
+            'outtmpl': options['output_template'],
+            'format': options['format'],
+        }
+        if options.get('ffmpeg_location'):
+            params['ffmpeg_location'] = options['ffmpeg_location']
+        if options.get('concurrent_fragments'):
+            params['concurrent_fragment_downloads'] = options['concurrent_fragments']
+        if options.get('rate_limit'):
+            params['ratelimit'] = int(options['rate_limit'])
+        if options.get('extract_audio'):
+            quality = options.get('audio_quality')
+            params['postprocessors'] = [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': options['extract_audio'],
+                'preferredquality': str(quality if quality is not None else 5),
+            }]
+        return params
+
+    def download(self, url, options, progress_callback=None, cancel_event=None):
+        # Downloads run on their own thread: the pool is kept for quick calls
+        # and a fresh YoutubeDL per download keeps per-job options isolated.
+        params = self.build_download_params(options)
+        rate_control = options.get('rate_control')
+        result = {'path': None, 'ydl': None}
+        timer = TransferTimer(options.get('rate_limit'))
+
+        def progress_hook(d):
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled("Download cancelled")
+            if rate_control is not None and result['ydl'] is not None:
+                # The downloader reads params['ratelimit'] for every chunk
+                result['ydl'].params['ratelimit'] = rate_control.rate
+            if d.get('status') == 'downloading':
+                timer.progress(d.get('downloaded_bytes'))
+                if progress_callback:
+                    progress = build_progress(d)
+                    info = d.get('info_dict') or {}
+                    # Merged downloads report the stream being fetched; resuming needs the pair
+                    requested = info.get('requested_formats')
+                    progress['format_id'] = ("+".join(f['format_id'] for f in requested) if requested
+                                             else info.get('format_id'))
+                    progress['filename'] = d.get('filename')
+                    progress_callback(progress)
+            if d.get('status') == 'finished':
+                result['path'] = d.get('filename')
+
+        def postprocessor_hook(d):
+            if d.get('status') == 'started':
+                timer.postprocess()
+            if d.get('status') == 'finished':
+                result['path'] = d.get('info_dict', {}).get('filepath') or result['path']
+
+        params['progress_hooks'] = [progress_hook]
+        params['postprocessor_hooks'] = [postprocessor_hook]
+
+        try:
+            with self.ydl_factory(params) as ydl:
+                result['ydl'] = ydl
+                info = ydl.extract_info(url, download=True)
+        except Exception as e:
+            if cancel_event is not None and cancel_event.is_set():
+                timer.finish('DownloadCancelled')
+                raise DownloadCancelled("Download cancelled")
+            timer.finish(type(e).__name__)
+            raise
+        timer.finish()
+
+        if info:
+            downloads = info.get('requested_downloads') or []
+            if downloads and downloads[-1].get('filepath'):
+                result['path'] = downloads[-1]['filepath']
+        return result['path']
+
+def create_engine(name=None):
+    """
+    Builds the engine named by `name`, the TE_TUBE_ENGINE environment
+    variable or the 'ytdlp_engine' setting. 'auto' uses a running Te_Tube
+    service if there is one, then prefers the in-process engine and falls
+    back to the executable when yt_dlp isn't installed.
+    """
+    name = name or os.environ.get('TE_TUBE_ENGINE') or get_setting('ytdlp_engine')
+    if name in ('auto', 'service'):
+        from modules.service import find_service, RemoteEngine
+        client = find_service()
+        if client is not None:
+            return RemoteEngine(client)
+        name = 'auto'
+    if name in ('auto', 'inprocess'):
+        try:
+            return InProcessEngine()
+        except ImportError:
+            if name == 'inprocess':
+                print("yt_dlp module not available, using yt-dlp executable instead.")
+    return SubprocessEngine()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine()
+        return _engine
+
+def set_engine(engine):
+    """
+    Replaces the shared engine, e.g. with a SubprocessEngine pointing at a stub.
+    """
+    global _engine
+    with _engine_lock:
+        _engine = engine
@@ -1,41 +1,146 @@
+import json
 import os
+import shlex
 import subprocess
-import requests
-import sys
+import threading
+import time
+
+from modules.settings import data_path, get_setting
 
 YTDLP_URL = "https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp.exe"
+YTDLP_RELEASE_API = "https://api.github.com/repos/yt-dlp/yt-dlp/releases/latest"
 YTDLP_PATH = os.path.join(os.getcwd(), "lib", "yt-dlp.exe")
+STATE_FILE = "ytdlp_state.json"
+
+NO_WINDOW = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
 
-def ensure_ytdlp():
+def ytdlp_command():
     """
-    Ensures yt-dlp.exe exists and is updated.
+    Returns the command line prefix used to run yt-dlp. The TE_TUBE_YTDLP
+    environment variable replaces YTDLP_PATH, e.g. with a benchmark stub:
+    TE_TUBE_YTDLP="python benchmarks/ytdlp_stub.py"
     """
-    if not os.path.exists(YTDLP_PATH):
-        print("yt-dlp.exe not found. Downloading the latest version...")
-        download_ytdlp()
-    else:
-        print("yt-dlp.exe found. Checking for updates...")
-        update_ytdlp()
+    override = os.environ.get('TE_TUBE_YTDLP')
+    if override:
+        return shlex.split(override, posix=(os.name != 'nt'))
+    return [YTDLP_PATH]
+
+def fetch_ytdlp(dest):
+    """
+    Downloads the latest yt-dlp.exe next to `dest` and moves it into place
+    in one step, so a half-written file is never picked up.
+    """
+    import requests
+    tmp_path = dest + ".part"
+    response = requests.get(YTDLP_URL, stream=True, timeout=30)
+    response.raise_for_status()
+    with open(tmp_path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=65536):
+            f.write(chunk)
+    os.replace(tmp_path, dest)
 
-def download_ytdlp():
+def installed_version():
     try:
-        response = requests.get(YTDLP_URL, stream=True)
-        response.raise_for_status()
-        with open(YTDLP_PATH, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        print("yt-dlp.exe downloaded successfully.")
-    except Exception as e:
-        print(f"Error downloading yt-dlp.exe: {e}")
-        sys.exit(1)
+        output = subprocess.check_output([YTDLP_PATH, "--version"], text=True, encoding='utf-8',
+                                         errors='replace', creationflags=NO_WINDOW, timeout=30)
+        return output.strip()
+    except Exception:
+        return None
+
+def latest_version():
+    import requests
+    response = requests.get(YTDLP_RELEASE_API, timeout=15)
+    response.raise_for_status()
+    return response.json()['tag_name']
+
+def load_state():
+    try:
+        with open(data_path(STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
 
-def update_ytdlp():
+def save_state(state):
+    path = data_path(STATE_FILE)
     try:
-        # Run yt-dlp -U to update itself
-        subprocess.run([YTDLP_PATH, "-U"], check=True, encoding='utf-8', errors='replace', creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-        print("yt-dlp.exe is up to date.")
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
     except Exception as e:
-        print(f"Error updating yt-dlp.exe: {e}")
+        print(f"Error saving yt-dlp state: {e}")
+
+def apply_pending_update():
+    """
+    Swaps in a yt-dlp.exe that was downloaded earlier but couldn't replace
+    the old one (e.g. because it was running at the time).
+    """
+    pending = YTDLP_PATH + ".new"
+    if os.path.exists(pending):
+        try:
+            os.replace(pending, YTDLP_PATH)
+            print("Installed pending yt-dlp.exe update.")
+        except OSError as e:
+            print(f"Error installing pending yt-dlp.exe update: {e}")
+
+def check_for_update(force=False):
+    """
+    Compares the installed yt-dlp.exe with the latest release and replaces
+    it atomically when outdated. Skipped if the last check was less than
+    'ytdlp_update_interval' seconds ago, unless `force` is set.
+    Returns True when a new binary was installed.
+    """
+    state = load_state()
+    if not os.path.exists(YTDLP_PATH):
+        print("yt-dlp.exe not found. Downloading the latest version...")
+        fetch_ytdlp(YTDLP_PATH)
+        state['last_checked'] = time.time()
+        save_state(state)
+        return True
+
+    interval = get_setting('ytdlp_update_interval')
+    if not force and time.time() - state.get('last_checked', 0) < interval:
+        return False
+
+    current = installed_version()
+    latest = latest_version()
+    state['last_checked'] = time.time()
+    state['version'] = current
+    save_state(state)
+    if current == latest:
+        return False
+
+    print(f"Updating yt-dlp.exe {current} -> {latest}...")
+    pending = YTDLP_PATH + ".new"
+    fetch_ytdlp(pending)
+    try:
+        os.replace(pending, YTDLP_PATH)
+    except OSError:
+        # In use right now; apply_pending_update() installs it next start
+        return False
+    state['version'] = latest
+    save_state(state)
+    return True
+
+def start_background_update(callback=None):
+    """
+    Runs check_for_update on a daemon thread.
+    callback(updated, error) is called from that thread when done.
+    """
+    def run():
+        try:
+            updated = check_for_update()
+            if callback:
+                callback(updated, None)
+        except Exception as e:
+            print(f"Error checking for yt-dlp updates: {e}")
+            if callback:
+                callback(False, e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
 
 if __name__ == "__main__":
-    ensure_ytdlp()
+    # Manual update: python -m modules.ytdlp_manager
+    apply_pending_update()
+    print("yt-dlp.exe updated." if check_for_update(force=True) else "yt-dlp.exe is up to date.")